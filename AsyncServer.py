@@ -0,0 +1,149 @@
+import asyncio, socket, signal
+from time import perf_counter
+
+from Server import Server
+from ServerWorker import ServerWorker
+from RtspParser import RtspParser, RtspParseError
+from RtpTransmitter import tuneSendBuffer
+from RtpPacket import RtpPacket
+
+
+class AsyncServerWorker(ServerWorker):
+    """ServerWorker driven by one asyncio event loop instead of per-client threads."""
+
+    def __init__(self, clientInfo, writer, rtpTransport):
+        super().__init__(clientInfo)
+        self.writer = writer
+        self.rtpTransport = rtpTransport  # transport UDP dùng chung cho mọi phiên
+        self.loop = asyncio.get_running_loop()
+        self.timer = None
+
+    async def handle(self, reader):
+        """Read RTSP requests until the client disconnects."""
+        parser = RtspParser()
+        while True:
+            try:
+                if parser.pending():
+                    data = await asyncio.wait_for(reader.read(4096), self.LEGACY_FLUSH_TIMEOUT)
+                else:
+                    data = await reader.read(4096) # nhận dữ liệu từ client
+            except asyncio.TimeoutError:
+                # an older client that does not end its requests with a blank line
+                data = None
+            except ConnectionError:
+                break
+            if data is not None and not data:
+                break
+
+            try:
+                self.processRtspMessages(parser.feed(data) if data is not None else parser.flush())
+            except RtspParseError as e:
+                print("Bad RTSP request, closing connection:", e)
+                break
+
+        # client đóng kết nối mà không TEARDOWN
+        self.connectionClosed()
+        self.writer.close()
+
+    def forwardRequest(self, requestType, session, seq):
+        """Forward without blocking the event loop; the reply is written when the owner answers."""
+        try:
+            sessionId = int(session.split(';')[0])
+        except ValueError:
+            sessionId = 0
+        reply = lambda code: self.loop.call_soon_threadsafe(self.replyRtsp, code, seq, ['Session: %d' % sessionId])
+        self.router.forward(requestType, sessionId, reply)
+
+    def runForwarded(self, requestType, done):
+        """Apply the request on the event loop that owns this session."""
+        self.loop.call_soon_threadsafe(lambda: done(self.applyForwarded(requestType)))
+
+    def sendReply(self, reply):
+        """Queue the RTSP reply on the stream writer."""
+        self.writer.write(reply.encode())
+
+    def openRtpSocket(self):
+        """Nothing to open: all sessions share the server's datagram transport."""
+        pass
+
+    def rtpSourcePort(self):
+        if 'broadcast' in self.clientInfo:
+            return super().rtpSourcePort()  # broadcasts go out through the shared transmitter
+        return self.rtpTransport.get_extra_info('sockname')[1]
+
+    def startStreaming(self):
+        """Schedule the first frame on the event loop."""
+        if self.preparePacing(self.loop.time()):  # loop.time() is the monotonic clock
+            self.timer = self.loop.call_at(self.frameDeadline, self.tick)
+
+    def stopStreaming(self):
+        """Cancel the pending frame timer."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def tick(self):
+        """Send what is due and re-arm the timer for the next deadline."""
+        self.timer = None
+        nextDeadline = self.sendRtp(self.loop.time())
+        if nextDeadline is not None:
+            self.timer = self.loop.call_at(nextDeadline, self.tick)
+
+    def sendPackets(self, batch, frameNumber, extension=0):
+        """Send the fragments through the shared datagram transport."""
+        start = perf_counter()
+        for payload_chunk, marker_bit in batch:
+            self.rtpTransport.sendto(self.makeRtp(payload_chunk, frameNumber, marker_bit, extension), self.rtpAddr)
+        self.metrics.sendLatency.observe(perf_counter() - start)
+        return True  # the transport buffers what the socket cannot take yet
+
+    def resendPackets(self, entries):
+        """Send packets from the history again on the event loop (called from the RTCP thread)."""
+        for seq, marker, payload, timestamp, extension in entries:
+            packet = RtpPacket()
+            packet.encode(2, 0, extension, 0, seq, marker, 26, self.ssrc, payload, timestamp)
+            self.loop.call_soon_threadsafe(self.rtpTransport.sendto, packet.getPacket(), self.rtpAddr)
+        return entries
+
+
+class AsyncServer(Server):
+    USAGE = "AsyncServer.py Server_port [options]"
+
+    def serve(self, SERVER_PORT):
+        """Run every RTSP connection and RTP session on a single event loop."""
+        try:
+            asyncio.run(self.serveAsync(SERVER_PORT))
+        except KeyboardInterrupt:
+            pass
+
+    async def serveAsync(self, SERVER_PORT):
+        loop = asyncio.get_running_loop()
+        self.rtpTransport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, family=socket.AF_INET, local_addr=('0.0.0.0', 0))
+        tuneSendBuffer(self.rtpTransport.get_extra_info('socket'))
+        server = await asyncio.start_server(self.handleClient, '', SERVER_PORT, backlog=128,
+                                            reuse_port=self.prefork or None)
+        if not self.prefork:
+            async with server:
+                await server.serve_forever()
+            return
+
+        # pre-fork worker: on SIGTERM stop accepting, then let the open sessions finish
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        self.draining = True
+        server.close()
+        self.onDrain()
+        deadline = loop.time() + self.drainTimeout
+        while self.sessionsLeft() and loop.time() < deadline:
+            await asyncio.sleep(self.DRAIN_POLL)
+
+    async def handleClient(self, reader, writer):
+        # same clientInfo layout as the threaded server; the socket slot is unused
+        clientInfo = {'rtspSocket': (None, writer.get_extra_info('peername'))}
+        await AsyncServerWorker(clientInfo, writer, self.rtpTransport).handle(reader)
+
+
+if __name__ == "__main__":
+    (AsyncServer()).main()
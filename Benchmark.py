@@ -0,0 +1,456 @@
+import sys, os, socket, subprocess, argparse, json, time, timeit, platform, random, tempfile
+
+import RtpPacket as rtp
+from RtpPacket import RtpPacket
+from LoadClient import LoadGenerator
+from VideoStream import VideoStream, INDEX_FILE_EXT
+from ServerWorker import ServerWorker
+from FrameReassembler import FrameReassembler
+from HintFile import buildHints, acquireHints, releaseHints
+
+SERVERS = {
+    'threaded': 'Server.py',
+    'async': 'AsyncServer.py',
+}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# synthetic MJPEG fixtures: name -> (frame size in bytes, frames); sizes vary +-25% per frame
+FIXTURES = {
+    'small': (4000, 400),
+    'medium': (25000, 400),
+    'large': (90000, 400),  # the 5-digit length prefix caps frames at 99999 bytes
+}
+FIXTURE_SEED = 20240501
+
+# metrics compared by `compare`: name -> True if higher is better
+METRICS = {
+    'us_per_op': False,
+    'fps_mean': True,
+    'fps_min': True,
+    'packets_per_s': True,
+    'cpu_ms_per_stream_s': False,
+    'frame_latency_ms_p50': False,
+    'frame_latency_ms_p99': False,
+}
+
+
+def freePort():
+    """Return a TCP port that is currently free on localhost."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def processCpuTime(pid):
+    """Return user+system CPU seconds of a process from /proc, or None if unavailable."""
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def processThreads(pid):
+    """Return the number of threads of a process from /proc, or None if unavailable."""
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def makeFixture(path, frameSize, frames, seed=FIXTURE_SEED):
+    """Write a reproducible MJPEG file of JPEG-framed random frames around frameSize bytes."""
+    rng = random.Random(seed + frameSize)
+    with open(path, 'wb') as f:
+        for _ in range(frames):
+            size = min(99999, max(64, int(frameSize * rng.uniform(0.75, 1.25))))
+            frame = b'\xff\xd8' + rng.randbytes(size - 4) + b'\xff\xd9'  # SOI ... EOI
+            f.write(b'%05d' % len(frame) + frame)
+    return path
+
+
+def makeFixtures(directory, names=None):
+    """Create (or reuse) the fixtures in a directory; return name -> path."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name in names or FIXTURES:
+        frameSize, frames = FIXTURES[name]
+        path = os.path.join(directory, 'bench-%s.Mjpeg' % name)
+        if not os.path.exists(path):
+            makeFixture(path, frameSize, frames)
+        paths[name] = path
+    return paths
+
+
+def environment():
+    """Describe the code and machine a result was measured on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def startServer(engine, port, mediaDir, extraArgs=()):
+    """Launch a server engine as a subprocess and wait until it accepts connections."""
+    script = os.path.join(HERE, SERVERS[engine])
+    proc = subprocess.Popen([sys.executable, script, str(port)] + list(extraArgs), cwd=mediaDir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server %s did not start" % engine)
+
+
+def runLoad(engine, sessions, duration, mediaDir, fileName, extraArgs=()):
+    """Stream `sessions` concurrent sessions for `duration` seconds and measure the server."""
+    port = freePort()
+    server = startServer(engine, port, mediaDir, extraArgs)
+    generator = LoadGenerator('127.0.0.1', port, fileName, sessions)
+    try:
+        generator.start()
+        cpuStart = processCpuTime(server.pid)
+        threads = processThreads(server.pid)
+        generator.run(duration)
+        cpuEnd = processCpuTime(server.pid)
+    finally:
+        generator.stop()
+        server.terminate()
+        server.wait()
+
+    report = generator.report()['summary']
+    wall = report['duration']
+    cpu = (cpuEnd - cpuStart) if cpuStart is not None and cpuEnd is not None else None
+    cpuFraction = cpu / wall if cpu else None
+    return {
+        'engine': engine,
+        'sessions': sessions,
+        'duration': wall,
+        'server_threads': threads,
+        'server_cpu_s': cpu,
+        'cpu_cores_used': cpuFraction,
+        'sessions_per_core': sessions / cpuFraction if cpuFraction else None,
+        'cpu_ms_per_stream_s': cpu / sessions / wall * 1000 if cpu is not None else None,
+        'fps_mean': report['fps_mean'],
+        'fps_min': report['fps_min'],
+        'frame_latency_ms_p50': report['frame_latency_ms_p50'],
+        'frame_latency_ms_p99': report['frame_latency_ms_p99'],
+        'loss_rate_max': report['loss_rate_max'],
+        'packets_per_s': report['packets_per_s'],
+        'bytes_per_s': report['bytes_per_s'],
+        'setup_latency_ms_max': report['setup_latency_ms_max'],
+    }
+
+
+class LegacyRtpPacket:
+    """The original byte-by-byte RtpPacket, kept as the baseline for the micro-benchmarks."""
+
+    def __init__(self):
+        self.header = bytearray(rtp.HEADER_SIZE)
+        self.payload = b''
+
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
+        timestamp = int(time.time())
+        header = bytearray(rtp.HEADER_SIZE)
+        header[0] = (version << 6) | (padding << 5) | (extension << 4) | (cc & 0x0F)
+        header[1] = ((marker & 0x01) << 7) | (pt & 0x7F)
+        header[2] = (seqnum >> 8) & 0xFF
+        header[3] = seqnum & 0xFF
+        header[4] = (timestamp >> 24) & 0xFF
+        header[5] = (timestamp >> 16) & 0xFF
+        header[6] = (timestamp >> 8) & 0xFF
+        header[7] = timestamp & 0xFF
+        header[8] = (ssrc >> 24) & 0xFF
+        header[9] = (ssrc >> 16) & 0xFF
+        header[10] = (ssrc >> 8) & 0xFF
+        header[11] = ssrc & 0xFF
+        self.header = header
+        self.payload = payload if isinstance(payload, (bytes, bytearray)) else bytes(payload)
+
+    def decode(self, byteStream):
+        bs = bytearray(byteStream)
+        self.header = bs[:rtp.HEADER_SIZE]
+        self.payload = bytes(bs[rtp.HEADER_SIZE:])
+
+    def seqNum(self):
+        return (self.header[2] << 8) | self.header[3]
+
+    def getPayload(self):
+        return bytes(self.payload)
+
+    def getPacket(self):
+        return bytes(self.header) + bytes(self.payload)
+
+
+def timePerCall(func, number):
+    """Return the best-of-5 time per call of func in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def runRtpMicro(number=50000, payloadSize=1400):
+    """Compare the legacy and struct-based RtpPacket encode/decode paths."""
+    payload = bytes(payloadSize)
+    wire = LegacyRtpPacket()
+    wire.encode(2, 0, 0, 0, 1234, 1, 26, 0, payload)
+    packet = wire.getPacket()
+    buffer = bytearray(rtp.HEADER_SIZE)
+
+    def legacyEncode():
+        p = LegacyRtpPacket()
+        p.encode(2, 0, 0, 0, 1234, 1, 26, 0, payload)
+        return p.getPacket()
+
+    def legacyDecode():
+        p = LegacyRtpPacket()
+        p.decode(packet)
+        return p.seqNum(), p.getPayload()
+
+    def wrapperEncode():
+        p = RtpPacket()
+        p.encode(2, 0, 0, 0, 1234, 1, 26, 0, payload)
+        return p.getPacket()
+
+    def wrapperDecode():
+        p = RtpPacket()
+        p.decode(packet)
+        return p.seqNum(), p.payload
+
+    def fastEncode():
+        rtp.pack_into(buffer, 0, 1234, 0, 0, 1)
+
+    def fastDecode():
+        p = rtp.parse(packet)
+        return p.seq, p.payload
+
+    cases = [
+        ('encode', legacyEncode, [('RtpPacket.encode', wrapperEncode), ('pack_into', fastEncode)]),
+        ('decode', legacyDecode, [('RtpPacket.decode', wrapperDecode), ('parse', fastDecode)]),
+    ]
+    results = []
+    for name, legacy, candidates in cases:
+        base = timePerCall(legacy, number)
+        results.append({'case': name, 'impl': 'legacy', 'us_per_op': base, 'speedup': 1.0})
+        for label, func in candidates:
+            t = timePerCall(func, number)
+            results.append({'case': name, 'impl': label, 'us_per_op': t, 'speedup': base / t})
+    return results
+
+
+def runStreamMicro(fixtures, number=2000):
+    """Time the per-frame and per-packet work of the server and client on each fixture."""
+    results = []
+    worker = ServerWorker({'rtspSocket': (None, ('127.0.0.1', 0))})
+    chunk = bytes(ServerWorker.MAX_RTP_PAYLOAD)
+    results.append({'case': 'makeRtp', 'impl': 'ServerWorker.makeRtp', 'fixture': None,
+                    'us_per_op': timePerCall(lambda: worker.makeRtp(chunk, 1, 0), number * 10)})
+
+    for name, path in sorted(fixtures.items()):
+        for useMmap in (True, False):
+            video = VideoStream(path, useMmap)
+            count = video.frameCount()
+
+            def nextFrame():
+                if video.frameNbr() >= count:
+                    video.seek(0)
+                return video.nextFrame()
+
+            results.append({'case': 'nextFrame', 'impl': 'mmap' if useMmap else 'read', 'fixture': name,
+                            'us_per_op': timePerCall(nextFrame, number)})
+            video.close()
+
+        video = VideoStream(path)
+        frame = video.nextFrame()
+        video.close()
+        results.append({'case': 'frameHash', 'impl': 'crc32+adler32', 'fixture': name,
+                        'us_per_op': timePerCall(lambda: rtp.frameHash(frame), number)})
+
+        # per-frame packetizing: fragment at send time, or take the layout from the .hint file
+        video = VideoStream(path, True)
+        hints = acquireHints(video, ServerWorker.MAX_RTP_PAYLOAD)
+        if hints is None:
+            buildHints(path, ServerWorker.MAX_RTP_PAYLOAD)
+            hints = acquireHints(video, ServerWorker.MAX_RTP_PAYLOAD)
+        view = video.frameAt(0)
+        results.append({'case': 'packetize', 'impl': 'iterFragments', 'fixture': name,
+                        'us_per_op': timePerCall(lambda: list(worker.iterFragments(view)), number)})
+        results.append({'case': 'packetize', 'impl': 'hint', 'fixture': name,
+                        'us_per_op': timePerCall(lambda: hints.fragments(0, view), number)})
+        releaseHints(video)
+        del view
+        video.close()
+
+        # one frame's fragments through the reassembler, with fresh seq/timestamps each time
+        fragments = [(payload, marker) for payload, marker in worker.iterFragments(frame)]
+        reassembler = FrameReassembler()
+        state = {'seq': 0, 'ts': 0}
+
+        def reassemble():
+            seq, ts = state['seq'], state['ts']
+            for i, (payload, marker) in enumerate(fragments):
+                delivered = reassembler.push((seq + i) & 0xFFFF, ts, marker, payload, 0.0)
+            state['seq'] = (seq + len(fragments)) & 0xFFFF
+            state['ts'] = (ts + 4500) & 0xFFFFFFFF
+            return delivered
+
+        results.append({'case': 'reassemble', 'impl': 'FrameReassembler', 'fixture': name,
+                        'us_per_op': timePerCall(reassemble, max(1, number // 10))})
+    return results
+
+
+def runSuite(args):
+    """Fixtures, micro-benchmarks and the loopback matrix, with the environment recorded."""
+    directory = args.fixtures or os.path.join(tempfile.gettempdir(), 'rtsp-bench-fixtures')
+    fixtures = makeFixtures(directory)
+    print("fixtures in", directory)
+
+    micro = runRtpMicro(args.number)
+    for r in micro:
+        r['fixture'] = None
+    micro += runStreamMicro(fixtures, max(1, args.number // 25))
+    for r in micro:
+        print("%-10s %-20s %-6s %10.3f us/op" % (r['case'], r['impl'], r['fixture'] or '', r['us_per_op']))
+
+    load = []
+    for name in args.load_fixtures.split(','):
+        mediaDir, fileName = os.path.split(fixtures[name])
+        for count in [int(n) for n in args.sessions.split(',')]:
+            for engine in args.engines.split(','):
+                result = runLoad(engine, count, args.duration, mediaDir, fileName)
+                result['fixture'] = name
+                load.append(result)
+                print("%-6s %-8s sessions=%4d fps=%.1f (min %.1f) pkts/s=%.0f cpu/stream=%s ms/s "
+                      "latency p50=%.1f p99=%.1f ms" % (
+                          name, engine, count, result['fps_mean'], result['fps_min'], result['packets_per_s'],
+                          '%.2f' % result['cpu_ms_per_stream_s'] if result['cpu_ms_per_stream_s'] is not None
+                          else 'n/a', result['frame_latency_ms_p50'], result['frame_latency_ms_p99']))
+    for path in fixtures.values():
+        if os.path.exists(path + INDEX_FILE_EXT):
+            os.remove(path + INDEX_FILE_EXT)  # the index format may change between commits
+    return {'environment': environment(), 'micro': micro, 'load': load}
+
+
+def resultKey(kind, r):
+    """Identify the same measurement in two result files."""
+    if kind == 'micro':
+        return (kind, r['case'], r['impl'], r.get('fixture'))
+    return (kind, r['engine'], r['sessions'], r.get('fixture'))
+
+
+def compareResults(base, new, threshold):
+    """Print metric changes between two suite results; return the number of regressions."""
+    print("base %s  ->  new %s" % (base['environment'].get('commit'), new['environment'].get('commit')))
+    if base['environment'].get('platform') != new['environment'].get('platform'):
+        print("warning: results come from different machines")
+    old = {resultKey(kind, r): r for kind in ('micro', 'load') for r in base.get(kind, [])}
+    regressions = 0
+    for kind in ('micro', 'load'):
+        for r in new.get(kind, []):
+            before = old.get(resultKey(kind, r))
+            if before is None:
+                continue
+            for metric, higherIsBetter in METRICS.items():
+                a, b = before.get(metric), r.get(metric)
+                if not a or b is None:
+                    continue
+                change = (b - a) / a
+                worse = -change if higherIsBetter else change
+                flag = ''
+                if worse > threshold:
+                    flag = '  REGRESSION'
+                    regressions += 1
+                print("%-60s %-22s %12.3f -> %12.3f  %+6.1f%%%s" % (
+                    ' '.join(str(k) for k in resultKey(kind, r) if k is not None), metric, a, b,
+                    change * 100, flag))
+    return regressions
+
+
+def runLoadMatrix(args):
+    """Run every engine at every session count from the command line."""
+    mediaDir = os.path.dirname(os.path.abspath(args.file))
+    fileName = os.path.basename(args.file)
+    results = []
+    for count in [int(n) for n in args.sessions.split(',')]:
+        for engine in args.engines.split(','):
+            result = runLoad(engine, count, args.duration, mediaDir, fileName)
+            results.append(result)
+            print("%-8s sessions=%4d threads=%s cpu=%.2f cores  sessions/core=%s  fps=%.1f (min %.1f)" % (
+                engine, count, result['server_threads'], result['cpu_cores_used'] or 0,
+                '%.0f' % result['sessions_per_core'] if result['sessions_per_core'] else 'n/a',
+                result['fps_mean'], result['fps_min']))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server and packetization benchmarks.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help="compare sessions-per-core of the server engines")
+    load.add_argument('file', help="MJPEG file, resolved relative to the server's working directory")
+    load.add_argument('--sessions', default='1,10,50,100', help="comma separated session counts")
+    load.add_argument('--engines', default='threaded,async', help="comma separated: " + ','.join(SERVERS))
+    load.add_argument('--duration', type=float, default=5.0, help="seconds of streaming per run")
+    load.add_argument('--json', help="write the results to this file")
+
+    micro = commands.add_parser('rtp', help="RtpPacket encode/decode micro-benchmarks")
+    micro.add_argument('--number', type=int, default=50000, help="calls per timing run")
+    micro.add_argument('--json', help="write the results to this file")
+
+    suite = commands.add_parser('suite', help="fixtures, micro-benchmarks and loopback runs, for comparing commits")
+    suite.add_argument('--fixtures', help="directory for the synthetic MJPEG fixtures (default: temp dir)")
+    suite.add_argument('--number', type=int, default=50000, help="calls per timing run of the RTP micro-benchmarks")
+    suite.add_argument('--sessions', default='1,10,100', help="comma separated session counts (up to 500)")
+    suite.add_argument('--engines', default='threaded,async', help="comma separated: " + ','.join(SERVERS))
+    suite.add_argument('--load-fixtures', default='medium', help="comma separated: " + ','.join(FIXTURES))
+    suite.add_argument('--duration', type=float, default=5.0, help="seconds of streaming per run")
+    suite.add_argument('--json', help="write the results to this file")
+
+    compare = commands.add_parser('compare', help="compare two suite results and flag regressions")
+    compare.add_argument('base', help="JSON from the reference commit")
+    compare.add_argument('new', help="JSON from the commit under test")
+    compare.add_argument('--threshold', type=float, default=0.10, help="relative change counted as regression")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compareResults(base, new, args.threshold)
+        print("%d regression(s) over %.0f%%" % (regressions, args.threshold * 100))
+        sys.exit(1 if regressions else 0)
+    elif args.command == 'suite':
+        results = runSuite(args)
+    elif args.command == 'rtp':
+        results = runRtpMicro(args.number)
+        for r in results:
+            print("%-7s %-17s %7.3f us/op  x%.1f" % (r['case'], r['impl'], r['us_per_op'], r['speedup']))
+    else:
+        results = runLoadMatrix(args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os, threading
+from time import monotonic
+
+from ServerWorker import ServerWorker
+from RtpPacket import HEADER_SIZE
+from Scheduler import sharedScheduler
+from RtpTransmitter import sharedTransmitter
+
+
+class BroadcastSource(ServerWorker):
+    """One file played once for all its viewers, live-style.
+
+    Reuses the ServerWorker pacing, but has no RTSP client of its own: each
+    frame is read and packetized once and every batch is fanned out to all
+    subscribed sessions. All viewers share its SSRC, sequence numbers and
+    timestamps. A session that joins mid-frame starts at the next frame. The
+    file loops; nobody watching pauses it.
+    """
+
+    def __init__(self, filename):
+        super().__init__({})
+        self.filename = filename
+        self.clientInfo['videoStream'] = self.openVideo(filename)
+        self.subscribers = {}  # ServerWorker -> RTP address it receives on
+        self.joining = {}  # subscribers waiting for the next frame boundary
+        self.refs = 0  # sessions set up on this source
+        self.framesLooped = 0  # frames played before the last loop, keeps timestamps increasing
+
+    def subscribe(self, worker, addr):
+        """Add a session from the next frame on; return (seq, rtptime) of its first packet."""
+        with self.sendLock:
+            self.joining[worker] = addr
+            video = self.clientInfo['videoStream']
+            if 'timer' not in self.clientInfo:
+                self.openRtpSocket()
+                self.preparePacing(monotonic())
+                self.clientInfo['timer'] = sharedScheduler.schedule(self.frameDeadline, self.sendRtp)
+            # the fragments of the current frame still go out before the joiner's first packet
+            return (self.rtpSeq + len(self.pending)) & 0xFFFF, self.mediaTimestamp(video.frameNbr() + 1)
+
+    def unsubscribe(self, worker):
+        with self.sendLock:
+            self.subscribers.pop(worker, None)
+            self.joining.pop(worker, None)
+            if not self.subscribers and not self.joining:
+                self.stopStreaming()
+
+    def preparePacing(self, now):
+        """Reset the pacing state; the source sends to its subscribers, not to one client."""
+        video = self.clientInfo['videoStream']
+        self.interval = 1.0 / video.frameRate
+        self.frameDeadline = now + self.interval
+        self.nextDeadline = self.frameDeadline
+        self.pending.clear()
+        return True
+
+    def nextTick(self, now, video):
+        if not self.pending and self.joining:
+            self.subscribers.update(self.joining)  # frame boundary: admit the joiners
+            self.joining.clear()
+        return super().nextTick(now, video)
+
+    def readFrame(self, video):
+        data = super().readFrame(video)
+        if data is None and video.frameNbr() > 0:
+            # end of file: loop, continuing the RTP timeline
+            self.framesLooped += video.frameNbr()
+            video.seek(0)
+            data = super().readFrame(video)
+        return data
+
+    def mediaTimestamp(self, frameNumber):
+        return super().mediaTimestamp(self.framesLooped + frameNumber)
+
+    def sendPackets(self, batch, frameNumber, extension=0):
+        """Queue one copy of the batch, sent to every subscriber by the transmit thread.
+
+        Returns False if the lane's queue was full and the batch was dropped.
+        """
+        seq = self.rtpSeq
+        packets = [((seq + i) & 0xFFFF, marker_bit, payload_chunk)
+                   for i, (payload_chunk, marker_bit) in enumerate(batch)]
+        self.rtpSeq = (seq + len(batch)) & 0xFFFF
+        if not self.subscribers:
+            return True
+        return sharedTransmitter.submit(self.lane, packets, list(self.subscribers.values()),
+                                        self.mediaTimestamp(frameNumber), self.ssrc, self.metrics, extension)
+
+    def countedSend(self, batch, frameNumber, extension=0):
+        """sendPackets, counting what each subscriber receives in its own session metrics."""
+        sent = self.sendPackets(batch, frameNumber, extension)
+        packets = len(batch)
+        nbytes = sum(len(payload) for payload, _ in batch) + HEADER_SIZE * packets
+        frames = sum(marker for _, marker in batch)
+        # subscribers' metrics are also updated by their own sessions: locked counts only
+        for metrics in [self.metrics] + [worker.metrics for worker in self.subscribers]:
+            if sent:
+                metrics.countSent(packets, nbytes, frames)
+            else:
+                metrics.countDropped(packets)
+
+
+class BroadcastRegistry:
+    """Broadcast sources by file, created on the first SETUP and closed after the last TEARDOWN."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sources = {}  # realpath -> BroadcastSource
+
+    def open(self, filename):
+        """Return the source of a file, creating it if needed (raises IOError if missing)."""
+        key = os.path.realpath(filename)
+        with self.lock:
+            source = self.sources.get(key)
+            if source is None:
+                source = self.sources[key] = BroadcastSource(filename)
+            source.refs += 1
+            return source
+
+    def release(self, source):
+        with self.lock:
+            source.refs -= 1
+            if source.refs > 0:
+                return
+            self.sources.pop(os.path.realpath(source.filename), None)
+        source.unsubscribe(None)
+        source.closeSession()
+
+    def stats(self):
+        with self.lock:
+            return {source.filename: len(source.subscribers) for source in self.sources.values()}
+
+
+# Nguồn phát chung, dùng khi server chạy với --broadcast
+sharedBroadcasts = BroadcastRegistry()
@@ -0,0 +1,519 @@
+import socket, threading, traceback
+from random import randint
+from time import time, monotonic
+from RtpPacket import RtpPacket, MJPEG_CLOCK_RATE, frameRef
+from RtpStats import ReceptionStats
+from FrameReassembler import FrameReassembler
+from FrameStore import FrameStore
+from RtspParser import RtspParser, RtspParseError
+from Rtcp import ReportBlock, packReceiverReport, packNack, parseRtcp, compactNtp, RTCP_SR
+from Retransmission import NackTracker
+
+
+class ClientCore:
+    """RTSP session and RTP receiver without a GUI.
+
+    Client puts the Tk player on top of it; LoadClient runs hundreds of them.
+    With threaded=True replies and RTP packets are read by background threads.
+    With threaded=False nothing blocks: the owner calls onRtspReadable() and
+    onRtpReadable() when the sockets are readable (e.g. from a selector).
+
+    A repeated frame may arrive as a hash reference to the frame store. If
+    the store no longer has it, that frame is lost: the previous frame stays
+    on screen, and Frame-Miss only makes the server send the next repeat in
+    full. The missed frame itself is not resent, because a full copy would
+    arrive after its display time.
+    """
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+
+    SETUP = 0
+    PLAY = 1
+    PAUSE = 2
+    TEARDOWN = 3
+    METHODS = {SETUP: 'SETUP', PLAY: 'PLAY', PAUSE: 'PAUSE', TEARDOWN: 'TEARDOWN'}
+
+    FRAME_STORE_BUDGET = 64 * 1024 * 1024  # bytes of frames kept in memory
+    CACHE_DECODED_IMAGES = False  # giữ ảnh đã giải mã thay vì JPEG (tốn RAM hơn, ít CPU hơn)
+    RTP_RECV_BUFFER = 1 << 20  # SO_RCVBUF: room for bursts while a thread is busy
+    LOG_INTERVAL = 2.0  # seconds between reception logs (verbose only)
+    LEGACY_FLUSH_TIMEOUT = 0.2  # a reply without the final blank line is complete after this pause
+    RTCP_INTERVAL = 1.0  # seconds between receiver reports (the server adapts quality on them)
+    USE_NACK = True  # ask the server to resend lost fragments (RTCP generic NACK)
+    RETRANSMIT_WAIT = 0.3  # seconds an incomplete frame waits for its missing fragments
+
+    def __init__(self, serveraddr, serverport, rtpport, filename, threaded=True, verbose=True):
+        # Connection parameters
+        self.serverAddr = serveraddr
+        self.serverPort = int(serverport)
+        self.rtpPort = int(rtpport)  # 0: any free port
+        self.fileName = filename
+        self.threaded = threaded
+        self.verbose = verbose
+
+        # RTSP state
+        self.state = self.INIT
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.requestSent = -1
+        self.pendingRequests = {}  # CSeq -> (request code, send time), awaiting a reply
+        self.replyLatency = {}  # method -> seconds from request to reply
+        self.rtspParser = RtspParser()
+        self.teardownAcked = 0
+        self.rtspLock = threading.Lock()
+        self.rtspSocket = None
+        self.rtpSocket = None
+        self.rtcpSocket = None
+        self.rtcpServerAddr = None  # from the server_port of the SETUP reply; None: no reports
+
+        # RTP reception
+        self.isReceivingFrames = False
+        self.frameReceiverThread = None
+        self.rtpStats = ReceptionStats(MJPEG_CLOCK_RATE)
+        # frames wait for resent fragments only once SETUP shows the server can resend them
+        self.reassembler = FrameReassembler(timeout=self.RETRANSMIT_WAIT)
+        self.nack = NackTracker(self.RETRANSMIT_WAIT)
+        self.packetsReceived = 0
+        self.bytesReceived = 0
+        self.firstPacketTime = None
+        self.lastLogTime = time()
+        self.ssrc = randint(0, 0xFFFFFFFF)  # our SSRC in receiver reports
+        self.mediaSsrc = None  # SSRC of the stream we receive
+        self.lastReportTime = monotonic()
+        self.lastSenderReport = None  # (compact NTP time of the server's last SR, when it arrived)
+
+        # Memory cache: every frame stored once, by content hash, within a byte budget
+        self.frameStore = FrameStore(self.FRAME_STORE_BUDGET, self.CACHE_DECODED_IMAGES)
+        self.requestedFrames = set()  # frame references we asked the server to resend
+        self.framesByReference = 0
+        self.framesReceived = 0
+        self.frameDropCount = 0
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def warn(self, title, message):
+        """Report a problem the user should see (the GUI shows a dialog)."""
+        print(f"{title}: {message}")
+
+    # RTSP
+    def connectToServer(self):
+        self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.rtspSocket.connect((self.serverAddr, self.serverPort))
+            self.log(f"Connected to RTSP server {self.serverAddr}:{self.serverPort}")
+            return True
+        except Exception as e:
+            self.warn('Connection Failed', "Connection to '%s' failed: %s" % (self.serverAddr, e))
+            return False
+
+    def sendRtspRequest(self, requestCode):
+        if requestCode not in self.METHODS:
+            return
+
+        # validate transitions
+        valid = False
+        if requestCode == self.SETUP and self.state == self.INIT:
+            valid = True
+        elif requestCode == self.PLAY and self.state == self.READY:
+            valid = True
+        elif requestCode == self.PAUSE and self.state == self.PLAYING:
+            valid = True
+        elif requestCode == self.TEARDOWN and self.state != self.INIT:
+            valid = True
+
+        if not valid:
+            print("Invalid RTSP state transition; request ignored.")
+            return
+
+        if requestCode == self.SETUP and not self.prepareSetup():
+            return
+        self.sendRequests([requestCode])
+
+    def setupAndPlay(self):
+        """Send SETUP and PLAY in one write, saving a round-trip before the stream starts."""
+        if self.state != self.INIT:
+            print("Invalid RTSP state transition; request ignored.")
+            return
+        if self.prepareSetup():
+            self.sendRequests([self.SETUP, self.PLAY])
+
+    def prepareSetup(self):
+        """Bind the RTP port (the Transport header carries it) and start reading replies."""
+        if not self.openRtpPort():
+            return False
+        if self.threaded:
+            threading.Thread(target=self.recvRtspReply, daemon=True).start()
+        return True
+
+    def sendRequests(self, requestCodes):
+        """Send one or more (pipelined) requests in a single write."""
+        # the receiver thread also sends requests (SET_PARAMETER): CSeq and socket are shared
+        with self.rtspLock:
+            requests = []
+            for requestCode in requestCodes:
+                self.rtspSeq += 1
+                request = f"{self.METHODS[requestCode]} {self.fileName} RTSP/1.0\r\nCSeq: {self.rtspSeq}"
+                if requestCode == self.SETUP:
+                    request += "\r\nTransport: RTP/UDP; client_port=%d-%d" % (self.rtpPort, self.rtcpPort())
+                    request += "\r\nFrame-Cache: " + str(self.FRAME_STORE_BUDGET)
+                elif self.sessionId:
+                    request += "\r\nSession: " + str(self.sessionId)
+                requests.append(request + "\r\n\r\n")
+                self.requestSent = requestCode
+                self.pendingRequests[self.rtspSeq] = (requestCode, monotonic())
+
+            try:
+                self.rtspSocket.sendall(''.join(requests).encode("utf-8"))
+                self.log('Data sent:\n' + ''.join(requests))
+            except Exception as e:
+                print("Failed to send RTSP request:", e)
+                traceback.print_exc()
+
+    def sendFrameMiss(self, key):
+        """Tell the server a referenced frame is not cached, so it sends it in full next time."""
+        if self.state == self.INIT:
+            return
+        with self.rtspLock:
+            self.rtspSeq += 1
+            request = (f"SET_PARAMETER {self.fileName} RTSP/1.0\r\nCSeq: {self.rtspSeq}"
+                       f"\r\nSession: {self.sessionId}\r\nFrame-Miss: {key:016x}\r\n\r\n")
+            try:
+                self.rtspSocket.sendall(request.encode("utf-8"))
+            except Exception as e:
+                print("Failed to send frame miss:", e)
+
+    def recvRtspReply(self):
+        while self.onRtspReadable():
+            pass
+
+    def onRtspReadable(self):
+        """Read and handle RTSP replies; return False once the connection is finished."""
+        try:
+            try:
+                reply = self.rtspSocket.recv(4096)
+            except socket.timeout:
+                # an older server that does not end its replies with a blank line
+                messages = self.rtspParser.flush()
+            else:
+                if not reply:
+                    return False
+                messages = self.rtspParser.feed(reply)
+        except RtspParseError as e:
+            print("Bad RTSP reply:", e)
+            return False
+        except Exception as e:
+            print("RTSP recv exception:", e)
+            return False
+
+        # several replies may arrive together (pipelined requests, SET_PARAMETER)
+        for message in messages:
+            try:
+                self.parseRtspReply(message)
+            except Exception as e:
+                print("Failed parsing RTSP reply:", e)
+                traceback.print_exc()
+
+        if self.requestSent == self.TEARDOWN and self.teardownAcked == 1:
+            try:
+                self.rtspSocket.close()
+            except:
+                pass
+            return False
+        if self.threaded:
+            self.rtspSocket.settimeout(self.LEGACY_FLUSH_TIMEOUT if self.rtspParser.pending() else None)
+        return True
+
+    def parseRtspReply(self, message):
+        self.log("=" * 50)
+        self.log("Server Reply:")
+        self.log(message.text())
+        self.log("=" * 50)
+
+        status_code = message.statusCode()
+        if status_code is None:
+            print("Malformed status line:", message.startLine)
+            return
+        if status_code == 404:
+            print("ERROR 404: File not found on server!")
+
+        try:
+            seqNum = int(message.header('CSeq'))
+        except (TypeError, ValueError):
+            print("CSeq not found in reply.")
+            return
+        try:
+            session = int(message.header('Session'))
+        except (TypeError, ValueError):
+            session = None
+
+        request = self.pendingRequests.pop(seqNum, None)
+        if request is None:
+            return  # reply to SET_PARAMETER, or to a request we no longer wait for
+        requestCode, sentTime = request
+
+        if self.sessionId == 0 and session is not None:
+            self.sessionId = session
+
+        if session is not None and self.sessionId != session:
+            print(f"Session ID mismatch: received {session}, expected {self.sessionId}")
+            return
+
+        self.replyLatency[self.METHODS[requestCode]] = monotonic() - sentTime
+        if status_code == 200:
+            if requestCode == self.SETUP:
+                self.rtcpServerAddr = self.parseServerRtcp(message.header('Transport'))
+                self.reassembler.retransmits = (self.USE_NACK and self.rtcpServerAddr is not None
+                                                and 'nack' in (message.header('RTCP-Feedback') or '').lower())
+                self.state = self.READY
+                self.log("RTSP State: READY")
+                # Bắt đầu nhận frames NGAY SAU SETUP
+                self.startFrameReceiver()
+            elif requestCode == self.PLAY:
+                self.state = self.PLAYING
+                self.rtpStats.restartJitter()  # the pause or seek is not jitter
+                self.log("RTSP State: PLAYING")
+            elif requestCode == self.PAUSE:
+                self.state = self.READY
+                self.log("RTSP State: READY (paused)")
+            elif requestCode == self.TEARDOWN:
+                self.state = self.INIT
+                self.log("RTSP State: INIT (teardown)")
+                self.teardownAcked = 1
+        else:
+            print(f"RTSP Error: status code {status_code}")
+
+    def parseServerRtcp(self, transport):
+        """Return the address for receiver reports from a reply's Transport header, or None."""
+        for param in (transport or '').split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'server_port' and '-' in value:
+                try:
+                    return self.serverAddr, int(value.split('-')[1])
+                except ValueError:
+                    return None
+        return None
+
+    def openRtpPort(self):
+        """Bind the RTP socket; return False if the port is unavailable."""
+        if self.rtpSocket is not None:
+            return True
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RTP_RECV_BUFFER)
+            self.rtpSocket.bind(('', self.rtpPort))
+        except Exception as e:
+            self.warn('Unable to Bind', 'Unable to bind RTP PORT=%d: %s' % (self.rtpPort, e))
+            self.rtpSocket.close()
+            self.rtpSocket = None
+            return False
+        self.rtpPort = self.rtpSocket.getsockname()[1]
+        self.rtpSocket.setblocking(self.threaded)
+        self.log(f"RTP Port opened at: {self.rtpPort}")
+        self.openRtcpPort()
+        return True
+
+    def openRtcpPort(self):
+        """Bind the RTCP socket on the port after the RTP one, or any free port if it is taken."""
+        self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for port in (self.rtpPort + 1, 0):
+            try:
+                self.rtcpSocket.bind(('', port))
+                break
+            except OSError:
+                continue
+        if self.threaded:
+            self.rtcpSocket.settimeout(0.5)
+            threading.Thread(target=self.receiveRtcp, daemon=True).start()
+        else:
+            self.rtcpSocket.setblocking(False)
+
+    def receiveRtcp(self):
+        while self.onRtcpReadable():
+            pass
+
+    def onRtcpReadable(self):
+        """Read the server's sender reports; return False once the RTCP socket is closed."""
+        while True:
+            try:
+                data = self.rtcpSocket.recv(2048)
+            except (socket.timeout, BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                return False
+            try:
+                packets = parseRtcp(data)
+            except ValueError:
+                continue
+            for packet in packets:
+                if packet.packetType == RTCP_SR:
+                    self.lastSenderReport = (compactNtp(packet.ntp), monotonic())
+
+    def rtcpPort(self):
+        return self.rtcpSocket.getsockname()[1] if self.rtcpSocket is not None else self.rtpPort + 1
+
+    # RTP RECEIVER
+    def startFrameReceiver(self):
+        """Start receiving frames (in a thread when threaded)."""
+        if not self.isReceivingFrames and self.rtpSocket:
+            self.isReceivingFrames = True
+            if self.threaded:
+                self.frameReceiverThread = threading.Thread(target=self.receiveAndCacheFrames, daemon=True)
+                self.frameReceiverThread.start()
+
+    def stopFrameReceiver(self):
+        """Stop receiving frames"""
+        self.isReceivingFrames = False
+
+    def receiveAndCacheFrames(self):
+        """Nhận frames liên tục"""
+        self.log("Starting to receive frames from server...")
+        # Giảm timeout để nhận frames nhanh hơn
+        self.rtpSocket.settimeout(0.1)
+        while self.isReceivingFrames:
+            try:
+                data = self.rtpSocket.recv(65536)
+                if data:
+                    self.handleRtpPacket(data)
+            except socket.timeout:
+                # Timeout is normal; give up on frames that waited too long
+                self.expireFrames()
+            except Exception as e:
+                if self.isReceivingFrames:
+                    print(f"Error receiving frame: {e}")
+                    traceback.print_exc()
+                break
+        self.log("Stopped receiving frames")
+
+    def onRtpReadable(self):
+        """Handle every datagram waiting on the (non-blocking) RTP socket."""
+        while self.isReceivingFrames:
+            try:
+                data = self.rtpSocket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.isReceivingFrames = False
+                return
+            self.handleRtpPacket(data)
+
+    def handleRtpPacket(self, data, arrival=None):
+        """Account for one RTP packet and pass it to the reassembler."""
+        if arrival is None:
+            arrival = monotonic()
+        rtpPacket = RtpPacket()
+        rtpPacket.decode(data)
+
+        seqNum = rtpPacket.seqNum()
+        timestamp = rtpPacket.timestamp()
+        self.rtpStats.update(seqNum, timestamp)
+        self.mediaSsrc = rtpPacket.ssrc
+        if self.reassembler.retransmits:
+            self.nack.update(seqNum, arrival)
+            if self.nack.missing:
+                self.sendNacks(arrival)
+        self.packetsReceived += 1
+        self.bytesReceived += len(data)
+        if self.firstPacketTime is None:
+            self.firstPacketTime = arrival
+
+        if self.verbose and time() - self.lastLogTime >= self.LOG_INTERVAL:
+            self.logReception()
+            self.lastLogTime = time()
+
+        # Ghép các mảnh thành frame (chịu được mất thứ tự, nhiều frame cùng lúc)
+        for frameTimestamp, frame_data, latency in self.reassembler.push(
+                seqNum, timestamp, rtpPacket.marker(), rtpPacket.payload, arrival, frameRef(rtpPacket)):
+            self.onFrameComplete(frame_data, frameTimestamp)
+
+        if arrival - self.lastReportTime >= self.RTCP_INTERVAL:
+            self.sendReceiverReport(arrival)
+
+    def expireFrames(self):
+        """Give up on frames that waited too long and deliver what follows them."""
+        for frameTimestamp, frame_data, latency in self.reassembler.expire():
+            self.onFrameComplete(frame_data, frameTimestamp)
+        if self.nack.missing:
+            self.sendNacks(monotonic())
+
+    def sendNacks(self, now):
+        """NACK the missing packets that are due, so the server resends them from its history."""
+        seqs = self.nack.due(now)
+        if not seqs or self.rtcpServerAddr is None or self.mediaSsrc is None:
+            return
+        try:
+            self.rtcpSocket.sendto(packNack(self.ssrc, self.mediaSsrc, seqs), self.rtcpServerAddr)
+        except OSError as e:
+            self.log("Failed to send NACK:", e)
+
+    def sendReceiverReport(self, now):
+        """Send an RTCP receiver report (loss and jitter since the last one) to the server.
+
+        LSR/DLSR echo the last sender report and how long ago it arrived, so
+        the server can measure the round-trip time.
+        """
+        self.lastReportTime = now
+        if self.rtcpServerAddr is None or self.mediaSsrc is None:
+            return
+        stats = self.rtpStats
+        lsr = dlsr = 0
+        if self.lastSenderReport is not None:
+            lsr, arrival = self.lastSenderReport
+            dlsr = int((now - arrival) * 65536) & 0xFFFFFFFF
+        block = ReportBlock(self.mediaSsrc, stats.fractionLost(), stats.lost(), stats.extendedMaxSeq(), stats.jitter,
+                            lsr, dlsr)
+        try:
+            self.rtcpSocket.sendto(packReceiverReport(self.ssrc, [block]), self.rtcpServerAddr)
+        except OSError as e:
+            self.log("Failed to send receiver report:", e)
+
+    def logReception(self):
+        stats = self.rtpStats.summary()
+        reassembly = self.reassembler.stats()
+        print(f"Received {self.packetsReceived} packets | "
+              f"lost: {stats['lost']} ({stats['loss_rate']:.1%}) | reordered: {stats['reordered']} | "
+              f"jitter: {stats['jitter_ms']:.1f} ms | recovered: {self.nack.recovered} | "
+              f"frames dropped: {reassembly['frames_dropped']} | "
+              f"reassembly: {reassembly['latency_ms_avg']:.1f} ms")
+
+    # FRAMES
+    def onFrameComplete(self, frame_data, timestamp):
+        """Handle a reassembled frame (or frame reference); the player overrides this."""
+        key = self.storeFrame(frame_data)
+        if key is not None:
+            self.frameStore.release(key)  # không phát: chỉ giữ trong cache
+
+    def storeFrame(self, frame_data):
+        """Put a frame in the store, or resolve a reference to one; return its key or None."""
+        self.framesReceived += 1
+        if isinstance(frame_data, int):
+            key = self.resolveFrameRef(frame_data)
+        else:
+            key = self.frameStore.add(frame_data)
+            if key is None:
+                self.frameDropCount += 1  # hết ngân sách: mọi frame trong store đang chờ phát
+            self.requestedFrames.discard(key)
+        return key
+
+    def resolveFrameRef(self, key):
+        """Take a reference to a frame the server sent by hash; on a miss drop it and ask for its repeats in full."""
+        if self.frameStore.acquire(key):
+            self.framesByReference += 1
+            return key
+        self.frameDropCount += 1
+        if key not in self.requestedFrames:
+            self.requestedFrames.add(key)
+            self.sendFrameMiss(key)
+        return None
+
+    def close(self):
+        """Close both sockets without TEARDOWN."""
+        self.stopFrameReceiver()
+        for sock in (self.rtspSocket, self.rtpSocket, self.rtcpSocket):
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
@@ -0,0 +1,96 @@
+class CongestionController:
+    """Send rate of one session, adjusted on the RTCP receiver reports of its client.
+
+    Loss-based AIMD: a report losing more than LOSS_HIGH cuts the rate to
+    what actually went out in the last period, reduced in proportion to the
+    loss; a report under LOSS_LOW raises it by RATE_INCREASE unless the RTT has
+    grown well above the smallest one seen (queues filling up). Once the limit
+    is far above what the session sends, it is lifted.
+
+    The pacing loop applies it as a token bucket on whole frames (a frame
+    that does not fit is skipped) and by spreading each frame's fragments
+    over the time the rate allows.
+
+    Packets the client asks to have resent (NACK) count as lost: once they
+    are repaired the report's own loss figure no longer shows them.
+    """
+
+    LOSS_HIGH = 0.02  # fraction lost in a report that cuts the rate
+    LOSS_LOW = 0.005  # reports below this let the rate grow
+    RATE_INCREASE = 1.08  # growth per clean report
+    RTT_RISE = 2.0  # an RTT this many times the smallest one (plus RTT_SLACK) holds the rate
+    RTT_SLACK = 0.02  # seconds
+    MIN_RATE = 32 * 1024  # bytes/s, never limited below this
+    UNLIMIT = 1.5  # the limit is lifted once it is this many times the rate sent
+    BUCKET = 0.1  # seconds of credit a session may save up
+
+    def __init__(self):
+        self.rate = None  # bytes/s; None: not limited
+        self.tokens = 0.0
+        self.lastRefill = None
+        self.sentBytes = 0  # since the last report
+        self.sentPackets = 0
+        self.nacked = 0  # packets NACKed since the last report
+        self.lastReport = None
+        self.sentRate = 0.0  # bytes/s measured over the last report period
+        self.rtt = None
+        self.minRtt = None
+
+    def onSent(self, nbytes, packets=1):
+        self.sentBytes += nbytes
+        self.sentPackets += packets
+
+    def onNack(self, packets):
+        self.nacked += packets
+
+    def charge(self, nbytes):
+        """Take bytes sent outside the frames (retransmissions) from the bucket; later frames pay for them."""
+        if self.rate is not None:
+            self.tokens -= nbytes
+
+    def onReport(self, now, fractionLost, rtt=None):
+        """Update the rate from one receiver report (fraction lost since the previous one, RTT in seconds)."""
+        if self.lastReport is not None and now > self.lastReport:
+            self.sentRate = self.sentBytes / (now - self.lastReport)
+        self.lastReport = now
+        if self.sentPackets:
+            fractionLost = max(fractionLost, min(1.0, self.nacked / self.sentPackets))
+        self.sentBytes = self.sentPackets = self.nacked = 0
+        if rtt is not None:
+            self.rtt = rtt
+            self.minRtt = rtt if self.minRtt is None else min(self.minRtt, rtt)
+
+        if fractionLost > self.LOSS_HIGH:
+            base = self.sentRate if self.rate is None else min(self.rate, self.sentRate or self.rate)
+            if base:
+                self.rate = max(self.MIN_RATE, base * (1.0 - fractionLost / 2))
+        elif fractionLost < self.LOSS_LOW and self.rate is not None and not self.queueing():
+            self.rate *= self.RATE_INCREASE
+            if self.rate > self.sentRate * self.UNLIMIT:
+                self.rate = None
+
+    def queueing(self):
+        """Return True if the last RTT suggests packets are waiting in a queue on the path."""
+        return self.rtt is not None and self.rtt > self.minRtt * self.RTT_RISE + self.RTT_SLACK
+
+    def admit(self, now, nbytes):
+        """Return True if a frame of nbytes may be sent now, and charge it to the bucket."""
+        if self.rate is None:
+            self.lastRefill = None
+            return True
+        if self.lastRefill is None:
+            self.tokens = 0.0
+        else:
+            self.tokens = min(self.tokens + (now - self.lastRefill) * self.rate, self.rate * self.BUCKET)
+        self.lastRefill = now
+        if self.tokens < 0:
+            return False  # still paying for the previous frames
+        self.tokens -= nbytes
+        return True
+
+    def spread(self, nbytes, minimum):
+        """Return the seconds a frame's fragments should be spread over: at least minimum, longer
+        when the rate allows less (the frames that follow are skipped until it has gone out)."""
+        if self.rate is None:
+            return minimum
+        return max(minimum, nbytes / self.rate)
@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_BUDGET = 64 * 1024 * 1024  # 64 MB
+
+
+class FrameCache:
+    """Process-wide LRU cache of frame data keyed by (file, frame number).
+
+    Only frames read with file I/O go through it: --no-mmap, or a file that
+    could not be mapped. Mapped files already share the page cache, so by
+    default it stays unused and its metrics are not exported.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.frames = OrderedDict()  # key -> bytes, cũ nhất ở đầu
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.used = False  # a session has read frames through the cache
+
+    def get(self, key):
+        """Return cached data for key, or None on a miss."""
+        with self.lock:
+            self.used = True
+            data = self.frames.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store a frame, evicting least recently used frames over the budget."""
+        size = len(data)
+        if size > self.budget:
+            return
+        data = bytes(data)
+        with self.lock:
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.frames[key] = data
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        """Drop LRU entries until the cache fits the budget (lock must be held)."""
+        while self.size > self.budget and self.frames:
+            _, data = self.frames.popitem(last=False)
+            self.size -= len(data)
+            self.evictions += 1
+
+    def setBudget(self, budget):
+        """Change the memory budget in bytes."""
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def clear(self):
+        """Remove every frame and reset the counters."""
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def hitRate(self):
+        """Return the fraction of lookups served from memory."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        with self.lock:
+            return {
+                'entries': len(self.frames),
+                'bytes': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hitRate(),
+            }
+
+
+# Cache dùng chung cho mọi ServerWorker trong tiến trình
+sharedCache = FrameCache()
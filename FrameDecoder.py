@@ -0,0 +1,51 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FrameDecoder:
+    """Decode frames on a thread pool, keeping `lookahead` frames in flight ahead of playback.
+
+    Pillow releases the GIL while decoding JPEG, so the workers run in parallel
+    with each other and with the receiver/playback threads. Frames come out in
+    the order they were fed.
+    """
+
+    def __init__(self, decode, lookahead=8, workers=None):
+        self.decode = decode  # hàm giải mã: data -> ảnh (hoặc None)
+        self.lookahead = lookahead
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="decode")
+        self.inflight = deque()  # (item, future), theo thứ tự phát
+
+    def feed(self, source, getData=lambda item: item[1]):
+        """Move items from the source deque into the pool until the look-ahead is full."""
+        while len(self.inflight) < self.lookahead and source:
+            item = source.popleft()
+            self.inflight.append((item, self.pool.submit(self.decode, getData(item))))
+
+    def pending(self):
+        """Return the number of frames submitted but not yet taken."""
+        return len(self.inflight)
+
+    def ready(self):
+        """Return True if the next frame in order is decoded."""
+        return bool(self.inflight) and self.inflight[0][1].done()
+
+    def peek(self):
+        """Return the item of the next frame without taking it (None if empty)."""
+        return self.inflight[0][0] if self.inflight else None
+
+    def pop(self, timeout=None):
+        """Return (item, image) for the next frame, waiting for its decode if needed."""
+        item, future = self.inflight.popleft()
+        return item, future.result(timeout)
+
+    def clear(self):
+        """Drop every frame in flight."""
+        while self.inflight:
+            self.inflight.popleft()[1].cancel()
+
+    def shutdown(self):
+        self.clear()
+        self.pool.shutdown(wait=False)
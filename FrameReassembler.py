@@ -0,0 +1,191 @@
+from time import monotonic
+from RtpPacket import SEQ_MOD, extendSeq
+
+TS_MOD = 1 << 32
+
+
+def tsNewer(a, b):
+    """Return True if RTP timestamp a is after b (32-bit serial arithmetic)."""
+    return a != b and (a - b) % TS_MOD < TS_MOD // 2
+
+
+class PartialFrame:
+    """Fragments received so far for one RTP timestamp."""
+    __slots__ = ('timestamp', 'fragments', 'size', 'startSeq', 'endSeq', 'firstArrival', 'reference')
+
+    def __init__(self, timestamp, arrival):
+        self.timestamp = timestamp
+        self.fragments = {}  # extended seqnum -> payload
+        self.size = 0
+        self.startSeq = None  # biết được khi thấy gói trước đó thuộc frame khác
+        self.endSeq = None  # gói có marker bit
+        self.firstArrival = arrival
+        self.reference = None  # hash của frame client đã có, thay cho dữ liệu
+
+    def complete(self):
+        return (self.startSeq is not None and self.endSeq is not None
+                and len(self.fragments) == self.endSeq - self.startSeq + 1)
+
+
+class FrameReassembler:
+    """Reassemble RTP fragments into frames.
+
+    Several frames may be in flight at once, keyed by RTP timestamp, and
+    fragments may arrive out of order within `reorderWindow` packets. A frame
+    is complete once its first packet (the one after another frame's packet),
+    its marker packet and everything in between have arrived; it is then
+    copied once into a buffer of the exact frame size. Frames are delivered in
+    timestamp order; an incomplete frame is dropped after `timeout` seconds, or
+    as soon as its missing fragments fall outside the reorder window.
+
+    With retransmits=True the missing fragments may still be resent (after a
+    NACK): an incomplete frame waits for the whole timeout and accepts its
+    fragments however late they come.
+    """
+
+    def __init__(self, reorderWindow=64, timeout=0.3, retransmits=False):
+        self.reorderWindow = reorderWindow
+        self.timeout = timeout
+        self.retransmits = retransmits
+        self.frames = {}  # timestamp -> PartialFrame
+        self.seqOwners = {}  # extended seqnum -> timestamp, for recent packets
+        self.lastExtSeq = None
+        self.firstExtSeq = None
+        self.newestTs = None
+        self.lastDelivered = None
+
+        self.framesCompleted = 0
+        self.framesDropped = 0
+        self.packetsLate = 0
+        self.packetsDuplicate = 0
+        self.latencySum = 0.0
+        self.latencyMax = 0.0
+
+    def extendSeq(self, seq):
+        """Map a 16-bit seqnum onto a monotonically extended counter."""
+        if self.lastExtSeq is None:
+            self.lastExtSeq = SEQ_MOD + seq
+            return self.lastExtSeq
+        ext = extendSeq(seq, self.lastExtSeq)
+        if ext > self.lastExtSeq:
+            self.lastExtSeq = ext
+        return ext
+
+    def age(self, timestamp):
+        """Return how far a timestamp is behind the newest one (serial arithmetic)."""
+        return (self.newestTs - timestamp) % TS_MOD
+
+    def push(self, seq, timestamp, marker, payload, arrival=None, reference=None):
+        """Add one fragment; return the list of (timestamp, data, latency) frames now deliverable.
+
+        A frame reference packet is pushed with the frame hash as `reference`;
+        its frame is delivered with that hash (an int) as data.
+        """
+        if arrival is None:
+            arrival = monotonic()
+        if self.lastDelivered is not None and not tsNewer(timestamp, self.lastDelivered):
+            self.packetsLate += 1  # frame đã phát hoặc đã bỏ
+            return self.expire(arrival)
+
+        ext = self.extendSeq(seq)
+        if self.firstExtSeq is None:
+            self.firstExtSeq = ext
+        if ext < self.lastExtSeq - self.reorderWindow and not (self.retransmits and timestamp in self.frames):
+            self.packetsLate += 1
+            return self.expire(arrival)
+
+        frame = self.frames.get(timestamp)
+        if frame is None:
+            frame = self.frames[timestamp] = PartialFrame(timestamp, arrival)
+            if self.newestTs is None or tsNewer(timestamp, self.newestTs):
+                self.newestTs = timestamp
+        if ext in frame.fragments:
+            self.packetsDuplicate += 1
+            return []
+        if reference is not None:
+            frame.reference = reference
+            payload = b''
+        frame.fragments[ext] = payload
+        frame.size += len(payload)
+        if marker:
+            frame.endSeq = ext
+
+        # frame boundaries: a packet whose neighbour belongs to another timestamp
+        self.seqOwners[ext] = timestamp
+        before = self.seqOwners.get(ext - 1)
+        if before is not None and before != timestamp:
+            frame.startSeq = ext
+        elif before is None and ext <= self.firstExtSeq:
+            # nothing earlier in the stream: PLAY always starts on a frame boundary
+            self.firstExtSeq = ext
+            frame.startSeq = ext
+        after = self.seqOwners.get(ext + 1)
+        if after is not None and after != timestamp and after in self.frames:
+            self.frames[after].startSeq = ext + 1
+        if len(self.seqOwners) > 8 * self.reorderWindow + 1024:
+            self.pruneOwners()
+
+        return self.expire(arrival)
+
+    def expire(self, now=None):
+        """Drop timed-out frames and return the frames that can be delivered in order."""
+        if now is None:
+            now = monotonic()
+        delivered = []
+        while self.frames:
+            oldest = max(self.frames.values(), key=lambda f: self.age(f.timestamp))
+            if oldest.complete():
+                delivered.append(self.deliver(oldest, now))
+            elif now - oldest.firstArrival > self.timeout or (not self.retransmits and self.unrecoverable(oldest)):
+                del self.frames[oldest.timestamp]
+                self.lastDelivered = oldest.timestamp
+                self.framesDropped += 1
+            else:
+                break
+        return delivered
+
+    def unrecoverable(self, frame):
+        """Return True if every missing fragment is already outside the reorder window."""
+        highest = frame.endSeq if frame.endSeq is not None else max(frame.fragments)
+        return self.lastExtSeq - highest > self.reorderWindow
+
+    def deliver(self, frame, now):
+        """Copy the fragments of a complete frame into one buffer."""
+        del self.frames[frame.timestamp]
+        self.lastDelivered = frame.timestamp
+
+        if frame.reference is not None:
+            data = frame.reference
+        else:
+            data = bytearray(frame.size)  # cấp phát một lần, đúng kích thước frame
+            pos = 0
+            for ext in range(frame.startSeq, frame.endSeq + 1):
+                fragment = frame.fragments[ext]
+                data[pos:pos + len(fragment)] = fragment
+                pos += len(fragment)
+
+        latency = now - frame.firstArrival
+        self.framesCompleted += 1
+        self.latencySum += latency
+        self.latencyMax = max(self.latencyMax, latency)
+        return frame.timestamp, data, latency
+
+    def pruneOwners(self):
+        """Forget seqnum owners far behind the newest packet."""
+        horizon = self.lastExtSeq - 4 * self.reorderWindow
+        if self.frames:
+            # frames still waiting need their neighbours to find their boundaries
+            horizon = min(horizon, min(min(frame.fragments) for frame in self.frames.values()) - 1)
+        self.seqOwners = {ext: ts for ext, ts in self.seqOwners.items() if ext >= horizon}
+
+    def stats(self):
+        """Return the reassembly counters."""
+        return {
+            'frames_completed': self.framesCompleted,
+            'frames_dropped': self.framesDropped,
+            'frames_inflight': len(self.frames),
+            'packets_late': self.packetsLate,
+            'packets_duplicate': self.packetsDuplicate,
+            'latency_ms_avg': self.latencySum / self.framesCompleted * 1000 if self.framesCompleted else 0.0,
+            'latency_ms_max': self.latencyMax * 1000,
+        }
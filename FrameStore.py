@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from RtpPacket import frameHash
+
+DEFAULT_BUDGET = 64 * 1024 * 1024  # 64 MB
+
+
+class StoredFrame:
+    """One frame held by the store: raw JPEG data and/or the decoded image."""
+    __slots__ = ('data', 'image', 'size', 'refs')
+
+    def __init__(self, data):
+        self.data = data
+        self.image = None
+        self.size = len(data)
+        self.refs = 1
+
+
+def imageSize(image):
+    """Return the approximate memory used by a decoded PIL image."""
+    return image.width * image.height * len(image.getbands())
+
+
+class FrameStore:
+    """Client frame store keyed by whole-frame content hash, with a byte budget.
+
+    Every frame is held once, however many times it is queued for playback.
+    Each queue entry holds a reference: referenced frames are never evicted,
+    unreferenced ones stay cached for repeats until their memory is needed,
+    least recently used first. With `cacheImages` the decoded image replaces
+    the JPEG data, trading memory for skipping decode on repeated frames.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, cacheImages=False):
+        self.budget = budget
+        self.cacheImages = cacheImages
+        self.frames = OrderedDict()  # hash -> StoredFrame, cũ nhất ở đầu
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0  # frame đã có sẵn trong store
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0  # không đủ chỗ: mọi frame đều đang được tham chiếu
+
+    def add(self, data):
+        """Store a frame and take a reference to it; return its key, or None if it does not fit."""
+        key = frameHash(data)
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is not None:
+                entry.refs += 1
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return key
+            self.misses += 1
+            self.evict(len(data))
+            if self.size + len(data) > self.budget:
+                self.rejected += 1
+                return None
+            self.frames[key] = StoredFrame(data)
+            self.size += len(data)
+            return key
+
+    def acquire(self, key):
+        """Take a reference to a frame already stored; return False if it is not there."""
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return False
+            entry.refs += 1
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def release(self, key):
+        """Drop a reference; the frame stays cached until the budget needs its memory."""
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+
+    def get(self, key):
+        """Return (data, image) for a frame; either may be None."""
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is None:
+                return None, None
+            self.frames.move_to_end(key)
+            return entry.data, entry.image
+
+    def setImage(self, key, image):
+        """Keep the decoded image of a frame instead of its JPEG data (if cacheImages)."""
+        if not self.cacheImages or image is None:
+            return
+        size = imageSize(image)
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is None or entry.image is not None:
+                return
+            self.evict(size - entry.size)
+            if self.size - entry.size + size > self.budget:
+                return  # ảnh quá lớn so với chỗ trống: giữ lại JPEG
+            self.size += size - entry.size
+            entry.data, entry.image, entry.size = None, image, size
+
+    def evict(self, needed=0):
+        """Drop unreferenced LRU frames until `needed` more bytes fit (lock must be held)."""
+        if self.size + needed <= self.budget:
+            return
+        for key in [key for key, entry in self.frames.items() if entry.refs == 0]:
+            self.size -= self.frames.pop(key).size
+            self.evictions += 1
+            if self.size + needed <= self.budget:
+                break
+
+    def setBudget(self, budget):
+        """Change the memory budget in bytes."""
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def clear(self):
+        """Remove every frame and reset the counters."""
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = self.rejected = 0
+
+    def hitRate(self):
+        """Return the fraction of frames that were already in the store."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return a snapshot of the store counters."""
+        with self.lock:
+            return {
+                'entries': len(self.frames),
+                'referenced': sum(1 for entry in self.frames.values() if entry.refs),
+                'bytes': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+                'hit_rate': self.hitRate(),
+            }
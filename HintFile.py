@@ -0,0 +1,143 @@
+import os, sys, struct, argparse, threading
+from array import array
+
+from VideoStream import VideoStream
+from RtpPacket import frameHash
+
+HINT_FILE_EXT = ".hint"
+HINT_MAGIC = b'VHNT'
+HINT_VERSION = 1
+# magic, version, source size, source mtime (ns), frame count, packet count, max RTP payload
+HINT_HEADER = struct.Struct('!4sHQQIIH')
+DEFAULT_MAX_PAYLOAD = 1400
+
+# Tables shared by every session of a file: realpath -> [HintTable, refcount]
+_tables = {}
+_tablesLock = threading.Lock()
+
+
+class HintTable:
+    """Pre-packetized layout of one media file, read from its .hint file.
+
+    For every frame: its first packet, packet count and content hash; for
+    every packet: offset in the frame, length and marker bit. The server
+    takes the fragments from here instead of re-fragmenting each frame and
+    sends the precomputed hash instead of hashing the frame.
+    """
+
+    def __init__(self):
+        self.firstPacket = array('I')
+        self.packetCounts = array('I')
+        self.hashes = array('Q')
+        self.offsets = array('I')  # packet offset within its frame
+        self.lengths = array('I')
+        self.markers = array('B')
+
+    @classmethod
+    def load(cls, video, maxPayload):
+        """Return the table of a VideoStream's file, or None if there is no usable .hint file."""
+        st = os.fstat(video.file.fileno())
+        try:
+            with open(video.filename + HINT_FILE_EXT, 'rb') as f:
+                magic, version, size, mtime, frames, packets, payload = HINT_HEADER.unpack(f.read(HINT_HEADER.size))
+                if magic != HINT_MAGIC or version != HINT_VERSION or size != st.st_size \
+                        or mtime != st.st_mtime_ns or payload != maxPayload:
+                    return None
+                table = cls()
+                for values, count in ((table.firstPacket, frames), (table.packetCounts, frames),
+                                      (table.hashes, frames), (table.offsets, packets),
+                                      (table.lengths, packets), (table.markers, packets)):
+                    values.fromfile(f, count)
+                    if sys.byteorder == 'little':
+                        values.byteswap()
+                return table
+        except (OSError, EOFError, struct.error):
+            return None
+
+    def frameHash(self, n):
+        """Return the content hash of frame index n (as RtpPacket.frameHash computes it)."""
+        return self.hashes[n]
+
+    def fragments(self, n, data):
+        """Return the (payload_chunk, marker_bit) fragments of frame index n, whose data is given."""
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        first = self.firstPacket[n]
+        last = first + self.packetCounts[n]
+        return [(view[offset:offset + length], marker) for offset, length, marker in
+                zip(self.offsets[first:last], self.lengths[first:last], self.markers[first:last])]
+
+
+def acquireHints(video, maxPayload):
+    """Return the shared HintTable of a VideoStream's file, or None if it has no fresh .hint file."""
+    with _tablesLock:
+        entry = _tables.get(video.path)
+        if entry is None:
+            table = HintTable.load(video, maxPayload)
+            if table is None:
+                return None
+            entry = _tables[video.path] = [table, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def releaseHints(video):
+    """Drop one reference to a file's table, freeing it when unused."""
+    with _tablesLock:
+        entry = _tables.get(video.path)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _tables[video.path]
+
+
+def buildHints(filename, maxPayload=DEFAULT_MAX_PAYLOAD):
+    """Write filename.hint: the packet layout and hash of every frame. Returns (frames, packets)."""
+    video = VideoStream(filename)
+    try:
+        st = os.fstat(video.file.fileno())
+        table = HintTable()
+        for n in range(video.frameCount()):
+            data = video.frameAt(n)
+            table.firstPacket.append(len(table.offsets))
+            table.hashes.append(frameHash(data))
+            count = (len(data) + maxPayload - 1) // maxPayload
+            table.packetCounts.append(count)
+            for i in range(count):
+                table.offsets.append(i * maxPayload)
+                table.lengths.append(min(maxPayload, len(data) - i * maxPayload))
+                table.markers.append(1 if i == count - 1 else 0)
+    finally:
+        video.close()
+
+    tmpname = filename + HINT_FILE_EXT + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(HINT_HEADER.pack(HINT_MAGIC, HINT_VERSION, st.st_size, st.st_mtime_ns,
+                                 len(table.firstPacket), len(table.offsets), maxPayload))
+        for values in (table.firstPacket, table.packetCounts, table.hashes,
+                       table.offsets, table.lengths, table.markers):
+            values = array(values.typecode, values)
+            if sys.byteorder == 'little':
+                values.byteswap()
+            values.tofile(f)
+    os.replace(tmpname, filename + HINT_FILE_EXT)
+    return len(table.firstPacket), len(table.offsets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-packetize MJPEG files for the server (writes <file>.hint).")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--max-payload', type=int, default=DEFAULT_MAX_PAYLOAD,
+                        help="RTP payload size; must match the server's MAX_RTP_PAYLOAD")
+    args = parser.parse_args()
+    for filename in args.files:
+        try:
+            frames, packets = buildHints(filename, args.max_payload)
+        except IOError:
+            print("%s: cannot open file" % filename, file=sys.stderr)
+            continue
+        print("%s: %d frames, %d packets" % (filename, frames, packets))
+
+
+if __name__ == "__main__":
+    main()
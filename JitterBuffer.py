@@ -0,0 +1,90 @@
+import threading
+from time import monotonic
+
+TS_MOD = 1 << 32
+DISCONTINUITY = 1.0  # seconds; bigger transit jumps are pauses or seeks, not jitter
+
+
+class JitterBuffer:
+    """Playout clock that turns RTP timestamps into local display deadlines.
+
+    deadline(ts) = ts / clockRate + offset. The offset is anchored on the first
+    frame shown after PLAY. Every arriving frame then checks that it would
+    still be on time with a safety margin of `jitterFactor` times the observed
+    interarrival jitter. If not, the offset grows and playback waits for it.
+    Once the buffer holds more than twice the needed margin, the offset shrinks
+    by at most `decayStep` per frame, which is too little to notice.
+    """
+
+    def __init__(self, clockRate=90000, minDelay=0.05, maxDelay=1.0, jitterFactor=4.0, decayStep=0.0005):
+        self.clockRate = clockRate
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.jitterFactor = jitterFactor
+        self.decayStep = decayStep
+        self.lock = threading.Lock()
+        self.jitter = 0.0  # giây, ước lượng theo RFC 3550
+        self.lastTransit = None
+        self.lastTs = None
+        self.lastExtTs = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the timestamp -> clock mapping (on PLAY after PAUSE or a seek)."""
+        with self.lock:
+            self.offset = None
+            self.lastTransit = None
+            self.lateFrames = 0
+
+    def mediaTime(self, ts):
+        """Return the RTP timestamp in seconds, extended across 32-bit wraparound."""
+        if self.lastTs is None:
+            self.lastTs, self.lastExtTs = ts, ts
+        delta = (ts - self.lastTs) % TS_MOD
+        if delta >= TS_MOD // 2:
+            delta -= TS_MOD  # khung cũ hơn khung mới nhất
+        ext = self.lastExtTs + delta
+        if delta > 0:
+            self.lastTs, self.lastExtTs = ts, ext
+        return ext / self.clockRate
+
+    def targetDelay(self):
+        """Return the safety margin kept ahead of arrivals."""
+        return min(self.maxDelay, max(self.minDelay, self.jitterFactor * self.jitter))
+
+    def observe(self, ts, arrival=None):
+        """Record the arrival of a complete frame and adapt the offset to it."""
+        if arrival is None:
+            arrival = monotonic()
+        with self.lock:
+            transit = arrival - self.mediaTime(ts)
+            if self.lastTransit is not None:
+                d = abs(transit - self.lastTransit)
+                if d < DISCONTINUITY:
+                    self.jitter += (d - self.jitter) / 16.0
+            self.lastTransit = transit
+
+            if self.offset is None:
+                return  # chưa neo: khung đầu tiên được hiển thị sẽ neo đồng hồ
+            needed = transit + self.targetDelay()
+            if needed > self.offset:
+                self.lateFrames += 1
+                self.offset = needed  # khung đến muộn: lùi toàn bộ lịch phát
+            elif self.offset - needed > self.targetDelay() * 2:
+                self.offset -= self.decayStep  # thu nhỏ độ trễ thật chậm
+
+    def deadline(self, ts, now=None):
+        """Return the monotonic time at which the frame with timestamp ts is due."""
+        with self.lock:
+            t = self.mediaTime(ts)
+            if self.offset is None:
+                self.offset = (now if now is not None else monotonic()) - t
+            return t + self.offset
+
+    def stats(self):
+        """Return the current jitter estimate, target delay and late-frame count."""
+        return {
+            'jitter_ms': self.jitter * 1000,
+            'target_delay_ms': self.targetDelay() * 1000,
+            'late_frames': self.lateFrames,
+        }
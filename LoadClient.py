@@ -0,0 +1,213 @@
+import sys, argparse, json, selectors
+from time import monotonic
+
+from ClientCore import ClientCore
+from RtpPacket import MJPEG_CLOCK_RATE
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of numbers (0.0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadSession(ClientCore):
+    """Headless session that also records when each frame completes."""
+
+    def __init__(self, host, port, fileName):
+        ClientCore.__init__(self, host, port, 0, fileName, threaded=False, verbose=False)
+        self.transits = []  # arrival - media time of each frame, in seconds
+        self.firstTs = None
+
+    def onFrameComplete(self, frame_data, timestamp):
+        if self.firstTs is None:
+            self.firstTs = timestamp
+        mediaTime = ((timestamp - self.firstTs) & 0xFFFFFFFF) / MJPEG_CLOCK_RATE
+        self.transits.append(monotonic() - mediaTime)
+        ClientCore.onFrameComplete(self, frame_data, timestamp)
+
+    def frameLatencies(self):
+        """Return each frame's delay over the fastest frame of the session, in ms.
+
+        The server paces frames on the media clock, so with an unloaded server
+        every frame has the same transit time; the excess is queueing and jitter.
+        """
+        if not self.transits:
+            return []
+        best = min(self.transits)
+        return [(t - best) * 1000 for t in self.transits]
+
+
+class LoadGenerator:
+    """Run many headless RTSP/RTP sessions against one server from a single thread."""
+
+    EXPIRE_INTERVAL = 0.1  # how often timed-out partial frames are flushed
+
+    def __init__(self, host, port, fileName, sessions):
+        self.sel = selectors.DefaultSelector()
+        self.sessions = [LoadSession(host, port, fileName) for _ in range(sessions)]
+        self.connected = []
+        self.playing = set()  # sessions that reached PLAYING (by id)
+        self.playTime = None
+        self.wall = 0.0
+
+    def pump(self, duration, until=None):
+        """Dispatch socket events for up to `duration` seconds, or until until() is true."""
+        deadline = monotonic() + duration
+        lastExpire = monotonic()
+        while monotonic() < deadline:
+            if until is not None and until():
+                return True
+            for key, _ in self.sel.select(timeout=self.EXPIRE_INTERVAL):
+                session, kind = key.data
+                if kind == 'rtsp':
+                    if not session.onRtspReadable():
+                        self.sel.unregister(key.fileobj)
+                elif kind == 'rtcp':
+                    if not session.onRtcpReadable():
+                        self.sel.unregister(key.fileobj)
+                else:
+                    session.onRtpReadable()
+            now = monotonic()
+            if now - lastExpire >= self.EXPIRE_INTERVAL:
+                for session in self.sessions:
+                    session.expireFrames()
+                lastExpire = now
+        return until is not None and until()
+
+    def request(self, requestCode, state, timeout):
+        """Send one request on every session and wait for the replies."""
+        for session in self.connected:
+            if session.teardownAcked == 0:
+                session.sendRtspRequest(requestCode)
+        return self.pump(timeout, lambda: all(s.state == state for s in self.connected))
+
+    def start(self, timeout=10.0, pipeline=False):
+        """Connect, SETUP and PLAY every session; return True if all of them are playing.
+
+        With pipeline, SETUP and PLAY go out together and play_latency_ms is the
+        whole session start.
+        """
+        for session in self.sessions:
+            if session.connectToServer():
+                self.connected.append(session)
+                self.sel.register(session.rtspSocket, selectors.EVENT_READ, (session, 'rtsp'))
+        if pipeline:
+            self.playTime = monotonic()
+            for session in self.connected:
+                session.setupAndPlay()
+        else:
+            self.request(ClientCore.SETUP, ClientCore.READY, timeout)
+        for session in self.connected:
+            if session.rtpSocket is not None:
+                self.sel.register(session.rtpSocket, selectors.EVENT_READ, (session, 'rtp'))
+            if session.rtcpSocket is not None:
+                self.sel.register(session.rtcpSocket, selectors.EVENT_READ, (session, 'rtcp'))
+        if pipeline:
+            self.pump(timeout, lambda: all(s.state == s.PLAYING for s in self.connected))
+        else:
+            self.playTime = monotonic()
+            self.request(ClientCore.PLAY, ClientCore.PLAYING, timeout)
+        self.playing = {id(s) for s in self.sessions if s.state == s.PLAYING}
+        return len(self.playing) == len(self.sessions)
+
+    def run(self, duration):
+        """Receive for `duration` seconds."""
+        self.pump(duration)
+        self.wall = monotonic() - self.playTime
+
+    def stop(self, timeout=2.0):
+        """TEARDOWN every session and close the sockets."""
+        self.request(ClientCore.TEARDOWN, ClientCore.INIT, timeout)
+        for session in self.sessions:
+            session.close()
+        self.sel.close()
+
+    def sessionReport(self, session):
+        """Return the measurements of one session."""
+        wall = self.wall or 1.0
+        stats = session.rtpStats.summary()
+        reassembly = session.reassembler.stats()
+        return {
+            'session': session.sessionId,
+            'playing': id(session) in self.playing,
+            'setup_latency_ms': session.replyLatency.get('SETUP', 0.0) * 1000,
+            'play_latency_ms': session.replyLatency.get('PLAY', 0.0) * 1000,
+            'first_packet_ms': (session.firstPacketTime - self.playTime) * 1000 if session.firstPacketTime else None,
+            'fps': reassembly['frames_completed'] / wall,
+            'frame_latency_ms_p50': percentile(session.frameLatencies(), 0.5),
+            'frame_latency_ms_p99': percentile(session.frameLatencies(), 0.99),
+            'frames_by_reference': session.framesByReference,
+            'frames_dropped': reassembly['frames_dropped'],
+            'nacks_sent': session.nack.nacksSent,
+            'packets_recovered': session.nack.recovered,
+            'packets': session.packetsReceived,
+            'loss_rate': stats['loss_rate'],
+            'jitter_ms': stats['jitter_ms'],
+            'bytes_per_s': session.bytesReceived / wall,
+        }
+
+    def report(self):
+        """Return the JSON report: a summary over all sessions plus each session's numbers."""
+        sessions = [self.sessionReport(s) for s in self.sessions]
+        latency = [ms for s in self.sessions for ms in s.frameLatencies()]
+        setup = [s['setup_latency_ms'] for s in sessions]
+        fps = [s['fps'] for s in sessions]
+        loss = [s['loss_rate'] for s in sessions]
+        return {
+            'summary': {
+                'sessions': len(sessions),
+                'sessions_playing': sum(1 for s in sessions if s['playing']),
+                'duration': round(self.wall, 3),
+                'setup_latency_ms_p50': percentile(setup, 0.5),
+                'setup_latency_ms_p99': percentile(setup, 0.99),
+                'setup_latency_ms_max': max(setup, default=0.0),
+                'fps_mean': sum(fps) / len(fps) if fps else 0.0,
+                'fps_min': min(fps, default=0.0),
+                'frame_latency_ms_p50': percentile(latency, 0.5),
+                'frame_latency_ms_p99': percentile(latency, 0.99),
+                'loss_rate_mean': sum(loss) / len(loss) if loss else 0.0,
+                'loss_rate_max': max(loss, default=0.0),
+                'packets_per_s': sum(s['packets'] for s in sessions) / (self.wall or 1.0),
+                'bytes_per_s': sum(s['bytes_per_s'] for s in sessions),
+            },
+            'sessions': sessions,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open N headless sessions against an RTSP server and report.")
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('file', help="MJPEG file name as the server resolves it")
+    parser.add_argument('--sessions', type=int, default=10, help="concurrent sessions")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of streaming")
+    parser.add_argument('--pipeline', action='store_true', help="send SETUP and PLAY in one write")
+    parser.add_argument('--json', help="write the report to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.host, args.port, args.file, args.sessions)
+    try:
+        if not generator.start(pipeline=args.pipeline):
+            print("Warning: not every session reached PLAYING", file=sys.stderr)
+        generator.run(args.duration)
+    finally:
+        generator.stop()
+
+    report = generator.report()
+    summary = report['summary']
+    print("sessions=%d playing=%d fps=%.1f (min %.1f) loss=%.2f%% setup p50=%.1f ms p99=%.1f ms %.2f MB/s" % (
+        summary['sessions'], summary['sessions_playing'], summary['fps_mean'], summary['fps_min'],
+        summary['loss_rate_mean'] * 100, summary['setup_latency_ms_p50'], summary['setup_latency_ms_p99'],
+        summary['bytes_per_s'] / 1e6), file=sys.stderr if args.json == '-' else sys.stdout)
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
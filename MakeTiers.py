@@ -0,0 +1,102 @@
+import os, sys, argparse
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from VideoStream import VideoStream, tierFileName
+from HintFile import buildHints, DEFAULT_MAX_PAYLOAD
+
+# (scale, JPEG quality) of tiers 1, 2, 3...; tier 0 is the original file
+DEFAULT_TIERS = ((0.75, 70), (0.5, 50), (0.35, 35))
+MAX_FRAME_SIZE = 99999  # the length prefix of an MJPEG frame has 5 digits
+MIN_QUALITY = 10
+FRAMES_PER_JOB = 50  # frames re-encoded by one worker process call
+
+
+def encodeFrames(filename, start, stop, scale, quality):
+    """Re-encode frames [start, stop) of a file smaller and at a lower JPEG quality (in a worker process)."""
+    video = VideoStream(filename)
+    try:
+        frames = []
+        for n in range(start, stop):
+            image = Image.open(BytesIO(video.frameAt(n))).convert('RGB')
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR)
+            q = quality
+            while True:
+                out = BytesIO()
+                image.save(out, 'JPEG', quality=q)
+                data = out.getvalue()
+                if len(data) <= MAX_FRAME_SIZE or q <= MIN_QUALITY:
+                    break
+                q = max(MIN_QUALITY, q - 10)  # khung quá lớn cho tiền tố 5 chữ số
+            if len(data) > MAX_FRAME_SIZE:
+                raise ValueError("frame %d of %s does not fit in %d bytes" % (n, filename, MAX_FRAME_SIZE))
+            frames.append(data)
+        return frames
+    finally:
+        video.close()
+
+
+def makeTiers(filename, tiers=DEFAULT_TIERS, workers=None, maxPayload=DEFAULT_MAX_PAYLOAD):
+    """Write filename.tier1, .tier2... with the same frames re-encoded, and their .hint files.
+
+    The frames of all tiers are re-encoded in jobs on a process pool. Every
+    tier has the original's frame count, so the server can switch between
+    them at any frame. Returns the file names.
+    """
+    video = VideoStream(filename)
+    count = video.frameCount()
+    video.close()
+
+    names = []
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [[pool.submit(encodeFrames, filename, start, min(start + FRAMES_PER_JOB, count), scale, quality)
+                 for start in range(0, count, FRAMES_PER_JOB)]
+                for scale, quality in tiers]
+        for tier, tierJobs in enumerate(jobs, 1):
+            name = tierFileName(filename, tier)
+            tmpname = name + '.tmp'
+            size = 0
+            try:
+                with open(tmpname, 'wb') as f:
+                    for job in tierJobs:
+                        for data in job.result():
+                            f.write(b'%05d' % len(data))
+                            f.write(data)
+                            size += len(data)
+                os.replace(tmpname, name)
+            finally:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)  # a frame failed: no partial tier
+            buildHints(name, maxPayload)
+            print("%s: %d frames, %.1f KB/frame" % (name, count, size / 1024.0 / max(count, 1)))
+            names.append(name)
+    return names
+
+
+def parseTier(value):
+    scale, _, quality = value.partition(':')
+    return float(scale), int(quality or 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute reduced-quality tiers of MJPEG files for adaptive streaming.")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--tier', action='append', type=parseTier, metavar='SCALE:QUALITY',
+                        help="one tier per option, best first (default: 0.75:70 0.5:50 0.35:35)")
+    parser.add_argument('--workers', type=int, default=None, help="encoder processes (default: CPU count)")
+    parser.add_argument('--max-payload', type=int, default=DEFAULT_MAX_PAYLOAD,
+                        help="RTP payload size of the .hint files; must match the server's MAX_RTP_PAYLOAD")
+    args = parser.parse_args()
+    for filename in args.files:
+        try:
+            makeTiers(filename, args.tier or DEFAULT_TIERS, args.workers, args.max_payload)
+        except IOError:
+            print("%s: cannot open file" % filename, file=sys.stderr)
+        except ValueError as e:
+            print("%s: %s" % (filename, e), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from FrameCache import sharedCache
+from RtpTransmitter import sharedTransmitter
+from Rtcp import sharedRtcp
+
+# bucket upper bounds in seconds
+SEND_LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+LATENESS_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """Cumulative-on-export histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile q (0.0 if empty)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self, name, labels):
+        """Yield Prometheus text lines for this histogram."""
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield '%s_bucket{%sle="%g"} %d' % (name, labels, bound, cumulative)
+        yield '%s_bucket{%sle="+Inf"} %d' % (name, labels, self.count)
+        labels = '{%s}' % labels.rstrip(',') if labels else ''
+        yield '%s_sum%s %.6f' % (name, labels, self.sum)
+        yield '%s_count%s %d' % (name, labels, self.count)
+
+
+class SessionMetrics:
+    """Counters of one streaming session, updated by its sender (under its sendLock).
+
+    send_errors is also counted by the transmit threads, and a broadcast
+    source counts what its subscribers are sent: use the count* methods.
+    """
+
+    COUNTERS = ('frames_sent', 'frames_referenced', 'frames_skipped', 'packets_sent', 'packets_retransmitted',
+                'packets_dropped', 'bytes_sent', 'send_errors', 'tier_switches')
+
+    def __init__(self):
+        self.frames_sent = 0
+        self.frames_referenced = 0  # repeats sent as a hash reference
+        self.frames_skipped = 0  # not sent: over the congestion controller's rate
+        self.packets_sent = 0
+        self.packets_retransmitted = 0  # resent on a client's NACK
+        self.packets_dropped = 0  # not sent: the transmit queue was full
+        self.bytes_sent = 0
+        self.send_errors = 0
+        self.tier_switches = 0  # quality tier changes driven by receiver reports
+        self.tier = 0  # current quality tier (0: original file)
+        self.rtt = 0.0  # seconds, from the last receiver report
+        self.rateLimit = 0  # bytes/s allowed by the congestion controller (0: no limit)
+        self.sendLatency = Histogram(SEND_LATENCY_BUCKETS)  # time inside one batched send
+        self.lateness = Histogram(LATENESS_BUCKETS)  # pacing tick behind its deadline
+        self.lock = threading.Lock()
+
+    def countSendErrors(self, count=1):
+        with self.lock:
+            self.send_errors += count
+
+    def countSent(self, packets, nbytes, frames=0):
+        with self.lock:
+            self.packets_sent += packets
+            self.bytes_sent += nbytes
+            self.frames_sent += frames
+
+    def countDropped(self, packets):
+        with self.lock:
+            self.packets_dropped += packets
+
+    def add(self, other):
+        """Add another session's counts to these."""
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.sendLatency.merge(other.sendLatency)
+        self.lateness.merge(other.lateness)
+
+    def snapshot(self):
+        """Return the counters and latency quantiles as a flat dict."""
+        values = {name: getattr(self, name) for name in self.COUNTERS}
+        values['quality_tier'] = self.tier
+        values['rtt_ms'] = self.rtt * 1000
+        values['rate_limit_kbps'] = self.rateLimit * 8 / 1000
+        values['send_latency_ms_p50'] = self.sendLatency.quantile(0.5) * 1000
+        values['send_latency_ms_p99'] = self.sendLatency.quantile(0.99) * 1000
+        values['pacing_lateness_ms_p50'] = self.lateness.quantile(0.5) * 1000
+        values['pacing_lateness_ms_p99'] = self.lateness.quantile(0.99) * 1000
+        return values
+
+
+class MetricsRegistry:
+    """Server-wide view: live sessions, totals of closed sessions and RTSP request counts."""
+
+    SERVER_COUNTERS = ('transmit_dropped', 'rtcp_reports')  # server values that only grow
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # session id -> (SessionMetrics, client address, worker)
+        self.retired = SessionMetrics()  # totals of sessions already closed
+        self.requests = {}  # RTSP method -> count
+
+    def register(self, sessionId, metrics, client, worker):
+        with self.lock:
+            self.sessions[sessionId] = (metrics, client, worker)
+
+    def unregister(self, sessionId):
+        """Forget a session, keeping its counts in the server totals."""
+        with self.lock:
+            entry = self.sessions.pop(sessionId, None)
+            if entry is not None:
+                self.retired.add(entry[0])
+
+    def countRequest(self, method):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def serverValues(self):
+        """Return the server-wide gauges and SERVER_COUNTERS as a dict."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        values = {
+            'active_sessions': len(sessions),
+            'playing_sessions': sum(1 for _, _, worker in sessions if worker.state == worker.PLAYING),
+            'threads': threading.active_count(),
+            'transmit_queue': sharedTransmitter.queued(),
+            'transmit_dropped': sharedTransmitter.dropped,
+            'rtcp_reports': sharedRtcp.reports,
+        }
+        if sharedCache.used:  # mmap (the default) bypasses the frame cache
+            cache = sharedCache.stats()
+            values['cache_hit_rate'] = cache['hit_rate']
+            values['cache_bytes'] = cache['bytes']
+        return values
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self.lock:
+            sessions = sorted(self.sessions.items())
+            requests = sorted(self.requests.items())
+            # server totals = closed sessions + live ones
+            total = SessionMetrics()
+            total.add(self.retired)
+            for _, (metrics, _, _) in sessions:
+                total.add(metrics)
+        lines = []
+        for name, value in self.serverValues().items():
+            if name in self.SERVER_COUNTERS:
+                lines.append('# TYPE rtsp_%s_total counter' % name)
+                lines.append('rtsp_%s_total %s' % (name, value))
+            else:
+                lines.append('# TYPE rtsp_%s gauge' % name)
+                lines.append('rtsp_%s %s' % (name, value))
+        lines.append('# TYPE rtsp_requests_total counter')
+        for method, count in requests:
+            lines.append('rtsp_requests_total{method="%s"} %d' % (method, count))
+
+        for name in SessionMetrics.COUNTERS:
+            lines.append('# TYPE rtsp_%s_total counter' % name)
+            lines.append('rtsp_%s_total %d' % (name, getattr(total, name)))
+            lines.append('# TYPE rtsp_session_%s_total counter' % name)
+            for sessionId, (metrics, client, _) in sessions:
+                lines.append('rtsp_session_%s_total{session="%s",client="%s"} %d' % (
+                    name, sessionId, client, getattr(metrics, name)))
+        for name, attr in (('quality_tier', 'tier'), ('rtt_seconds', 'rtt'), ('rate_limit_bytes', 'rateLimit')):
+            lines.append('# TYPE rtsp_session_%s gauge' % name)
+            for sessionId, (metrics, client, _) in sessions:
+                lines.append('rtsp_session_%s{session="%s",client="%s"} %s' % (
+                    name, sessionId, client, getattr(metrics, attr)))
+        for name, attr in (('send_latency_seconds', 'sendLatency'), ('pacing_lateness_seconds', 'lateness')):
+            lines.append('# TYPE rtsp_%s histogram' % name)
+            lines.extend(getattr(total, attr).render('rtsp_' + name, ''))
+            lines.append('# TYPE rtsp_session_%s histogram' % name)
+            for sessionId, (metrics, client, _) in sessions:
+                labels = 'session="%s",client="%s",' % (sessionId, client)
+                lines.extend(getattr(metrics, attr).render('rtsp_session_' + name, labels))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = sharedMetrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # không in mỗi lần Prometheus đọc số liệu
+
+
+def startMetricsServer(port, host='127.0.0.1'):
+    """Serve /metrics over HTTP on a daemon thread; return the HTTP server."""
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="metrics").start()
+    print("Metrics at http://%s:%d/metrics" % (host, httpd.server_address[1]))
+    return httpd
+
+
+# Số liệu dùng chung cho mọi ServerWorker trong tiến trình
+sharedMetrics = MetricsRegistry()
@@ -0,0 +1,301 @@
+import os, signal, threading, itertools, multiprocessing
+from multiprocessing.connection import wait
+from time import monotonic
+
+from ServerWorker import ServerWorker
+from Metrics import startMetricsServer
+
+FREE = 0
+
+
+class SessionTable:
+    """Session id -> pid of the worker process owning it, in shared memory.
+
+    Open addressing over one lock-protected array of (session id, pid) pairs,
+    created before the workers are forked so all of them see the same table.
+    A release shifts the rest of the probing chain back over the freed slot
+    instead of leaving a tombstone, so churn never fills the table.
+    """
+
+    def __init__(self, context, slots=8192):
+        self.slots = slots
+        self.array = context.Array('q', slots * 2)  # zeroed: every slot FREE
+
+    def probe(self, sessionId):
+        start = sessionId % self.slots
+        for i in range(self.slots):
+            yield 2 * ((start + i) % self.slots)
+
+    def claim(self, sessionId, pid):
+        """Record pid as the owner; False if the id is taken (or the table is full)."""
+        with self.array.get_lock():
+            for slot in self.probe(sessionId):
+                key = self.array[slot]
+                if key == sessionId:
+                    return False
+                if key == FREE:
+                    self.array[slot] = sessionId
+                    self.array[slot + 1] = pid
+                    return True
+            return False
+
+    def owner(self, sessionId):
+        """Return the pid owning a session, or None."""
+        with self.array.get_lock():
+            for slot in self.probe(sessionId):
+                key = self.array[slot]
+                if key == sessionId:
+                    return self.array[slot + 1]
+                if key == FREE:
+                    return None
+        return None
+
+    def release(self, sessionId):
+        with self.array.get_lock():
+            for slot in self.probe(sessionId):
+                key = self.array[slot]
+                if key == sessionId:
+                    self.remove(slot // 2)
+                    return
+                if key == FREE:
+                    return
+
+    def releaseOwner(self, pid):
+        """Drop every session of a worker that has exited."""
+        with self.array.get_lock():
+            i = 0
+            while i < self.slots:
+                if self.array[2 * i] != FREE and self.array[2 * i + 1] == pid:
+                    self.remove(i)  # another entry may have moved into i: look at it again
+                else:
+                    i += 1
+
+    def remove(self, hole):
+        """Free entry hole, moving later entries of its chain back (lock held)."""
+        j = hole
+        for _ in range(self.slots - 1):
+            j = (j + 1) % self.slots
+            key = self.array[2 * j]
+            if key == FREE:
+                break
+            home = key % self.slots
+            # an entry may only move back to a slot between its home and where it is
+            if (hole <= j and hole < home <= j) or (hole > j and (home > hole or home <= j)):
+                continue
+            self.array[2 * hole] = key
+            self.array[2 * hole + 1] = self.array[2 * j + 1]
+            hole = j
+        self.array[2 * hole] = FREE
+        self.array[2 * hole + 1] = 0
+
+
+class WorkerRouter:
+    """Worker side of the pre-fork control channel.
+
+    Sessions are tied to the worker that ran SETUP. A PAUSE or TEARDOWN that
+    arrives on another connection (possibly accepted by another process) is
+    passed to the owning worker through the supervisor and answered with the
+    code it returns.
+    """
+
+    TIMEOUT = 1.0  # seconds to wait for the owning worker to answer
+
+    def __init__(self, table, conn):
+        self.table = table
+        self.conn = conn  # Pipe end shared with the supervisor
+        self.pid = os.getpid()
+        self.local = {}  # session id -> ServerWorker of this process
+        self.waiting = {}  # token -> (deadline, callback) of forwarded requests
+        self.tokens = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.listen, daemon=True, name="router").start()
+
+    def claim(self, sessionId, worker):
+        """Reserve a session id across all workers; False if another one holds it."""
+        if not self.table.claim(sessionId, self.pid):
+            return False
+        self.local[sessionId] = worker
+        return True
+
+    def release(self, sessionId):
+        if self.local.pop(sessionId, None) is not None:
+            self.table.release(sessionId)
+
+    def send(self, message):
+        with self.lock:
+            self.conn.send(message)
+
+    def forward(self, requestType, sessionId, done):
+        """Run a request on whichever worker owns the session; done(code) receives the reply code."""
+        worker = self.local.get(sessionId)
+        if worker is not None:
+            worker.runForwarded(requestType, done)
+            return
+        owner = self.table.owner(sessionId)
+        if owner is None:
+            done(ServerWorker.SESSION_NOT_FOUND_454)
+            return
+        with self.lock:
+            token = next(self.tokens)
+            self.waiting[token] = (monotonic() + self.TIMEOUT, done)
+            self.conn.send(('call', owner, token, requestType, sessionId))
+
+    def listen(self):
+        """Serve requests forwarded to this worker and deliver the answers to ours."""
+        while True:
+            try:
+                message = self.conn.recv() if self.conn.poll(self.TIMEOUT / 4) else None
+            except (EOFError, OSError):
+                return  # supervisor gone
+            if message is not None:
+                if message[0] == 'call':
+                    _, caller, token, requestType, sessionId = message
+                    reply = lambda code, caller=caller, token=token: self.send(('result', caller, token, code))
+                    worker = self.local.get(sessionId)
+                    if worker is None:
+                        reply(ServerWorker.SESSION_NOT_FOUND_454)
+                    else:
+                        worker.runForwarded(requestType, reply)
+                elif message[0] == 'result':
+                    _, token, code = message
+                    with self.lock:
+                        entry = self.waiting.pop(token, None)
+                    if entry is not None:
+                        entry[1](code)
+            # the owner died or is stuck: fail the request instead of leaving the client waiting
+            now = monotonic()
+            with self.lock:
+                expired = [token for token, (deadline, _) in self.waiting.items() if deadline < now]
+                callbacks = [self.waiting.pop(token)[1] for token in expired]
+            for done in callbacks:
+                done(ServerWorker.CON_ERR_500)
+
+
+def workerMain(server, args, slot, table, conn):
+    """Body of one worker process: serve the shared port until told to drain."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is handled by the supervisor
+    router = WorkerRouter(table, conn)
+    ServerWorker.router = router
+    router.start()
+    metricsServer = startMetricsServer(args.metrics_port + slot) if args.metrics_port else None
+
+    def onDrain():
+        # free the metrics port for the replacement before it starts
+        if metricsServer is not None:
+            metricsServer.shutdown()
+            metricsServer.server_close()
+        router.send(('draining',))
+
+    server.prefork = True
+    server.drainTimeout = args.drain_timeout
+    server.onDrain = onDrain
+    server.serve(args.port)
+
+
+class Supervisor:
+    """Parent of a pre-fork server: N workers accept on one port with SO_REUSEPORT.
+
+    The supervisor serves no clients. It relays forwarded requests between
+    workers, restarts a worker that dies and on SIGHUP replaces the workers one
+    at a time: the old one stops accepting, the new one starts, and the old
+    one exits once its sessions end (or after --drain-timeout).
+    """
+
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.context = multiprocessing.get_context('fork')
+        self.table = SessionTable(self.context)
+        self.workers = {}  # pid -> (Process, supervisor end of its pipe)
+        self.slots = [None] * args.workers  # pid of the worker serving each slot
+        self.restartQueue = []  # slots still to be replaced in a rolling restart
+        self.replacing = None  # (slot, old pid) waiting for the old worker to drain
+        self.restartRequested = False
+        self.stopping = False
+
+    def spawn(self, slot):
+        parentEnd, childEnd = self.context.Pipe()
+        process = self.context.Process(target=workerMain, name="worker-%d" % slot,
+                                       args=(self.server, self.args, slot, self.table, childEnd))
+        process.start()
+        childEnd.close()
+        self.workers[process.pid] = (process, parentEnd)
+        self.slots[slot] = process.pid
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self.onRestart)
+        signal.signal(signal.SIGTERM, self.onStop)
+        signal.signal(signal.SIGINT, self.onStop)
+        for slot in range(len(self.slots)):
+            self.spawn(slot)
+        print("Pre-fork server on port %d: %d workers, supervisor pid %d (SIGHUP: graceful restart)" % (
+            self.args.port, len(self.slots), os.getpid()))
+
+        while self.workers:
+            conns = {conn: pid for pid, (_, conn) in self.workers.items()}
+            sentinels = {process.sentinel: pid for pid, (process, _) in self.workers.items()}
+            for ready in wait(list(conns) + list(sentinels), timeout=0.5):
+                if ready in conns:
+                    self.receive(conns[ready], ready)
+                elif sentinels[ready] in self.workers:
+                    self.reap(sentinels[ready])
+            if self.restartRequested:
+                self.restartRequested = False
+                self.restartQueue = list(range(len(self.slots)))
+            if self.replacing is None and self.restartQueue and not self.stopping:
+                slot = self.restartQueue.pop(0)
+                pid = self.slots[slot]
+                self.replacing = (slot, pid)
+                self.workers[pid][0].terminate()  # SIGTERM: stop accepting, then drain
+
+    def onRestart(self, signum, frame):
+        self.restartRequested = True
+
+    def onStop(self, signum, frame):
+        if self.stopping:
+            # second signal: do not wait for the sessions
+            for process, _ in self.workers.values():
+                process.kill()
+            return
+        self.stopping = True
+        print("Stopping: draining %d workers" % len(self.workers))
+        for process, _ in self.workers.values():
+            process.terminate()
+
+    def receive(self, pid, conn):
+        """Handle one message from a worker's pipe."""
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return  # the worker is exiting; its sentinel follows
+        if message[0] == 'call':
+            _, owner, token, requestType, sessionId = message
+            if owner in self.workers:
+                self.workers[owner][1].send(('call', pid, token, requestType, sessionId))
+            else:
+                conn.send(('result', token, ServerWorker.SESSION_NOT_FOUND_454))
+        elif message[0] == 'result':
+            _, caller, token, code = message
+            if caller in self.workers:
+                self.workers[caller][1].send(('result', token, code))
+        elif message[0] == 'draining' and self.replacing is not None and self.replacing[1] == pid:
+            # the old worker has closed its listener: start its replacement
+            self.spawn(self.replacing[0])
+            self.replacing = None
+
+    def reap(self, pid):
+        """Clean up after a worker that exited; replace it if it was not retired on purpose."""
+        process, conn = self.workers.pop(pid)
+        process.join()
+        conn.close()
+        self.table.releaseOwner(pid)
+        if pid in self.slots:
+            slot = self.slots.index(pid)
+            if self.replacing is not None and self.replacing[1] == pid:
+                self.replacing = None  # died before reporting it was draining
+            elif not self.stopping:
+                print("Worker %d (pid %d) exited with code %s, restarting" % (slot, pid, process.exitcode))
+            if not self.stopping:
+                self.spawn(slot)
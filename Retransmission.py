@@ -0,0 +1,75 @@
+from RtpPacket import SEQ_MOD, extendSeq
+
+
+class PacketHistory:
+    """The last `size` RTP packets a session sent, by sequence number, for retransmission.
+
+    A ring indexed by seqnum modulo size (a power of two, so it divides 2^16
+    and wraps with the seqnums). Payloads are the fragments as sent: views of
+    the frame, not copies.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.slots = [None] * size  # seq % size -> (seq, marker, payload, timestamp, extension)
+
+    def add(self, seq, batch, timestamp, extension=0):
+        """Record a batch of (payload, marker) fragments sent from seqnum seq on."""
+        for i, (payload, marker) in enumerate(batch):
+            s = (seq + i) % SEQ_MOD
+            self.slots[s % self.size] = (s, marker, payload, timestamp, extension)
+
+    def get(self, seq):
+        """Return (seq, marker, payload, timestamp, extension) of a packet, or None if it has been overwritten."""
+        entry = self.slots[seq % self.size]
+        return entry if entry is not None and entry[0] == seq else None
+
+
+class NackTracker:
+    """Sequence numbers missing from a received RTP stream, and when to NACK them.
+
+    A gap is first NACKed after REORDER_DELAY (the packet may only be late),
+    then every RETRY_INTERVAL, at most MAX_RETRIES times. It is forgotten
+    after `deadline` seconds, when its frame is given up anyway.
+    """
+
+    REORDER_DELAY = 0.005
+    RETRY_INTERVAL = 0.1
+    MAX_RETRIES = 3
+    MAX_GAP = 256  # a larger jump (resync) is not NACKed
+
+    def __init__(self, deadline=0.3):
+        self.deadline = deadline
+        self.highest = None  # extended seqnum of the newest packet
+        self.missing = {}  # extended seqnum -> [first missed, next NACK time, NACKs sent]
+        self.nacksSent = 0  # seqnums asked for, counting retries
+        self.recovered = 0  # NACKed packets that arrived
+
+    def update(self, seq, now):
+        """Account for one received packet."""
+        if self.highest is None:
+            self.highest = SEQ_MOD + seq
+            return
+        ext = extendSeq(seq, self.highest)
+        if ext > self.highest:
+            if ext - self.highest - 1 <= self.MAX_GAP:
+                for lost in range(self.highest + 1, ext):
+                    self.missing[lost] = [now, now + self.REORDER_DELAY, 0]
+            self.highest = ext
+        else:
+            entry = self.missing.pop(ext, None)
+            if entry is not None and entry[2]:
+                self.recovered += 1
+
+    def due(self, now):
+        """Return the 16-bit seqnums to NACK now, scheduling their next retry."""
+        seqs = []
+        for ext, entry in list(self.missing.items()):
+            if now - entry[0] > self.deadline or (entry[2] >= self.MAX_RETRIES and now >= entry[1]):
+                del self.missing[ext]  # quá hạn: frame đã bị bỏ
+            elif now >= entry[1]:
+                entry[1] = now + self.RETRY_INTERVAL
+                entry[2] += 1
+                seqs.append(ext % SEQ_MOD)
+        self.nacksSent += len(seqs)
+        return seqs
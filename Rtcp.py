@@ -0,0 +1,235 @@
+import socket, struct, threading, traceback
+from time import time
+
+RTCP_VERSION = 2
+RTCP_SR = 200
+RTCP_RR = 201
+RTCP_RTPFB = 205  # transport layer feedback (RFC 4585)
+NACK_FMT = 1  # generic NACK
+
+# V(2) P(1) RC(5) | PT(8) | length in 32-bit words minus one(16) | sender SSRC(32)
+RTCP_HEADER = struct.Struct('!BBHI')
+# source SSRC | fraction lost(8) cumulative lost(24) | extended highest seq | jitter | LSR | DLSR
+REPORT_BLOCK = struct.Struct('!IIIIII')
+# NTP timestamp(64) | RTP timestamp | sender's packet count | sender's octet count
+SENDER_INFO = struct.Struct('!QIII')
+# media source SSRC of a feedback packet, then FCI entries: first lost seq(16) | bitmask of the next 16(16)
+MEDIA_SSRC = struct.Struct('!I')
+NACK_FCI = struct.Struct('!HH')
+NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900 (NTP) to 1970 (Unix)
+
+
+def ntpTime(t=None):
+    """Return a wall-clock time (default: now) as a 64-bit NTP timestamp."""
+    if t is None:
+        t = time()
+    return int((t + NTP_EPOCH_OFFSET) * (1 << 32)) & 0xFFFFFFFFFFFFFFFF
+
+
+def compactNtp(ntp):
+    """Return the middle 32 bits of an NTP timestamp: the LSR/DLSR format, in 1/65536 s."""
+    return (ntp >> 16) & 0xFFFFFFFF
+
+
+def roundTripTime(block, now=None):
+    """Return the round-trip time in seconds from a report block's LSR and DLSR, or None."""
+    if not block.lsr:
+        return None  # the receiver has not had a sender report yet
+    return ((compactNtp(ntpTime(now)) - block.lsr - block.dlsr) & 0xFFFFFFFF) / 65536.0
+
+
+class ReportBlock:
+    """One reception report block: what a receiver saw of one RTP source (RFC 3550 6.4.1)."""
+
+    def __init__(self, ssrc, fractionLost=0.0, cumulativeLost=0, highestSeq=0, jitter=0, lsr=0, dlsr=0):
+        self.ssrc = ssrc
+        self.fractionLost = fractionLost  # 0.0 - 1.0 since the previous report
+        self.cumulativeLost = cumulativeLost
+        self.highestSeq = highestSeq  # extended with wrap cycles
+        self.jitter = jitter  # media clock units
+        self.lsr = lsr
+        self.dlsr = dlsr
+
+    def pack(self):
+        fraction = min(255, int(self.fractionLost * 256))
+        lost = max(-0x800000, min(0x7FFFFF, int(self.cumulativeLost))) & 0xFFFFFF
+        return REPORT_BLOCK.pack(self.ssrc & 0xFFFFFFFF, (fraction << 24) | lost, self.highestSeq & 0xFFFFFFFF,
+                                 int(self.jitter) & 0xFFFFFFFF, self.lsr, self.dlsr)
+
+    @classmethod
+    def unpack_from(cls, data, offset):
+        ssrc, lost, highestSeq, jitter, lsr, dlsr = REPORT_BLOCK.unpack_from(data, offset)
+        cumulative = lost & 0xFFFFFF
+        if cumulative & 0x800000:
+            cumulative -= 0x1000000  # số âm: nhận trùng gói
+        return cls(ssrc, (lost >> 24) / 256.0, cumulative, highestSeq, jitter, lsr, dlsr)
+
+
+class RtcpPacket:
+    """One packet of a compound RTCP datagram: its type, sender SSRC and report blocks.
+
+    A sender report also carries the sender info (zero in a receiver report);
+    a generic NACK the media SSRC and the sequence numbers it asks for.
+    """
+
+    def __init__(self, packetType, ssrc, blocks=(), ntp=0, rtpTime=0, packetCount=0, octetCount=0):
+        self.packetType = packetType
+        self.ssrc = ssrc
+        self.blocks = list(blocks)
+        self.ntp = ntp
+        self.rtpTime = rtpTime
+        self.packetCount = packetCount
+        self.octetCount = octetCount
+        self.mediaSsrc = 0
+        self.nacks = []
+
+
+def packSenderReport(ssrc, ntp, rtpTime, packetCount, octetCount, blocks=()):
+    """Return an RTCP SR: when (wall clock and RTP clock) and how much ssrc has sent."""
+    body = SENDER_INFO.pack(ntp, rtpTime & 0xFFFFFFFF, packetCount & 0xFFFFFFFF, octetCount & 0xFFFFFFFF)
+    body += b''.join(block.pack() for block in blocks)
+    length = (RTCP_HEADER.size + len(body)) // 4 - 1
+    return RTCP_HEADER.pack((RTCP_VERSION << 6) | len(blocks), RTCP_SR, length, ssrc & 0xFFFFFFFF) + body
+
+
+def packReceiverReport(ssrc, blocks):
+    """Return an RTCP RR from ssrc carrying the given ReportBlocks (at most 31)."""
+    body = b''.join(block.pack() for block in blocks)
+    length = (RTCP_HEADER.size + len(body)) // 4 - 1
+    return RTCP_HEADER.pack((RTCP_VERSION << 6) | len(blocks), RTCP_RR, length, ssrc & 0xFFFFFFFF) + body
+
+
+def packNack(ssrc, mediaSsrc, seqs):
+    """Return an RTCP generic NACK from ssrc asking mediaSsrc to resend the given 16-bit seqnums."""
+    pending = list(dict.fromkeys(seqs))
+    items = []
+    while pending:
+        pid = pending.pop(0)
+        blp = 0
+        rest = []
+        for seq in pending:
+            distance = (seq - pid) & 0xFFFF
+            if 1 <= distance <= 16:
+                blp |= 1 << (distance - 1)
+            else:
+                rest.append(seq)
+        pending = rest
+        items.append(NACK_FCI.pack(pid, blp))
+    body = MEDIA_SSRC.pack(mediaSsrc & 0xFFFFFFFF) + b''.join(items)
+    length = (RTCP_HEADER.size + len(body)) // 4 - 1
+    return RTCP_HEADER.pack((RTCP_VERSION << 6) | NACK_FMT, RTCP_RTPFB, length, ssrc & 0xFFFFFFFF) + body
+
+
+def parseRtcp(data):
+    """Split a compound RTCP datagram into RtcpPackets; raise ValueError if it is malformed.
+
+    Packet types other than SR, RR and generic NACK are skipped.
+    """
+    packets = []
+    offset = 0
+    while offset + RTCP_HEADER.size <= len(data):
+        first, packetType, length, ssrc = RTCP_HEADER.unpack_from(data, offset)
+        end = offset + (length + 1) * 4
+        if first >> 6 != RTCP_VERSION or end > len(data):
+            raise ValueError("bad RTCP packet")
+        if packetType in (RTCP_SR, RTCP_RR):
+            start = offset + RTCP_HEADER.size
+            info = ()
+            if packetType == RTCP_SR:
+                if start + SENDER_INFO.size > end:
+                    raise ValueError("short RTCP sender report")
+                info = SENDER_INFO.unpack_from(data, start)
+                start += SENDER_INFO.size
+            count = first & 0x1F
+            if start + count * REPORT_BLOCK.size > end:
+                raise ValueError("RTCP report blocks overrun the packet")
+            blocks = [ReportBlock.unpack_from(data, start + i * REPORT_BLOCK.size) for i in range(count)]
+            packets.append(RtcpPacket(packetType, ssrc, blocks, *info))
+        elif packetType == RTCP_RTPFB and first & 0x1F == NACK_FMT:
+            start = offset + RTCP_HEADER.size
+            if start + MEDIA_SSRC.size > end:
+                raise ValueError("short RTCP NACK")
+            packet = RtcpPacket(packetType, ssrc)
+            packet.mediaSsrc, = MEDIA_SSRC.unpack_from(data, start)
+            for pos in range(start + MEDIA_SSRC.size, end - NACK_FCI.size + 1, NACK_FCI.size):
+                pid, blp = NACK_FCI.unpack_from(data, pos)
+                packet.nacks.append(pid)
+                packet.nacks.extend((pid + bit + 1) & 0xFFFF for bit in range(16) if blp >> bit & 1)
+            packets.append(packet)
+        offset = end
+    if not packets and offset == 0:
+        raise ValueError("short RTCP packet")
+    return packets
+
+
+class RtcpReceiver:
+    """UDP socket on which the server exchanges RTCP with all of its clients.
+
+    One per process, announced as the second server_port of every SETUP.
+    Sessions register the address their client reports from (the port after
+    its RTP port); each packet from it is passed to that session's onRtcp().
+    The sessions' sender reports go out from it too.
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.sessions = {}  # client RTCP address -> ServerWorker
+        self.lock = threading.Lock()
+        self.reports = 0
+        self.unknown = 0  # packets from addresses with no session, or malformed
+
+    def start(self):
+        """Bind the socket and start the receiving thread (called lazily on first use)."""
+        with self.lock:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.bind(('', 0))
+                threading.Thread(target=self.run, daemon=True, name="rtcp").start()
+
+    def port(self):
+        self.start()
+        return self.sock.getsockname()[1]
+
+    def register(self, addr, worker):
+        with self.lock:
+            self.sessions[addr] = worker
+
+    def unregister(self, addr, worker):
+        with self.lock:
+            if self.sessions.get(addr) is worker:
+                del self.sessions[addr]
+
+    def run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            worker = self.sessions.get(addr)
+            try:
+                packets = parseRtcp(data) if worker is not None else None
+            except ValueError:
+                packets = None
+            if not packets:
+                self.unknown += 1
+                continue
+            self.reports += 1
+            for packet in packets:
+                try:
+                    worker.onRtcp(packet)
+                except Exception:
+                    traceback.print_exc()
+
+    def send(self, data, addr):
+        """Send a report to a client from this socket (the server_port it reports to)."""
+        try:
+            self.sock.sendto(data, addr)
+        except OSError as e:
+            print("RTCP send error:", e)
+
+    def stats(self):
+        return {'sessions': len(self.sessions), 'reports': self.reports, 'unknown': self.unknown}
+
+
+# Socket RTCP dùng chung cho mọi phiên của tiến trình
+sharedRtcp = RtcpReceiver()
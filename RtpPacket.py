@@ -1,92 +1,126 @@
-import sys
+import sys, struct, zlib
 from time import time
 HEADER_SIZE = 12
+MJPEG_CLOCK_RATE = 90000  # RTP timestamp clock for video (RFC 2435)
+
+# V(2) P(1) X(1) CC(4) | M(1) PT(7) | seqnum(16) | timestamp(32) | SSRC(32)
+RTP_HEADER = struct.Struct('!BBHII')
+
+# Header extension of a frame reference packet: profile(16) | length in words(16) | frame hash(64)
+FRAME_REF_PROFILE = 0x4652  # "FR"
+FRAME_REF = struct.Struct('!HHQ')
+
+SEQ_MOD = 1 << 16
 
 # comment de push len
 
+
+def extendSeq(seq, reference):
+    """Return the extended seqnum nearest to the extended seqnum reference whose low 16 bits are seq."""
+    delta = (seq - reference) % SEQ_MOD
+    if delta >= SEQ_MOD // 2:
+        delta -= SEQ_MOD  # gói cũ hơn reference
+    return reference + delta
+
+
+def frameHash(data):
+    """Return a 64-bit content hash of a whole frame (CRC-32 and Adler-32, not cryptographic)."""
+    return (zlib.crc32(data) << 32) | zlib.adler32(data)
+
+
+def pack_into(buffer, offset, seqnum, timestamp, ssrc, marker=0, pt=26, version=2, padding=0, extension=0, cc=0):
+    """Write a 12-byte RTP header into buffer at offset (no allocation)."""
+    RTP_HEADER.pack_into(buffer, offset,
+                         (version << 6) | (padding << 5) | (extension << 4) | (cc & 0x0F),
+                         ((marker & 0x01) << 7) | (pt & 0x7F),
+                         seqnum & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc & 0xFFFFFFFF)
+
+
+def packFrameRef(key):
+    """Return the header extension that stands in for a frame the client already has."""
+    return FRAME_REF.pack(FRAME_REF_PROFILE, (FRAME_REF.size - 4) // 4, key)
+
+
+def frameRef(packet):
+    """Return the frame hash carried by a frame reference packet, or None for media packets."""
+    if not packet.byte0 & 0x10 or len(packet.payload) < FRAME_REF.size:
+        return None
+    profile, length, key = FRAME_REF.unpack_from(packet.payload)
+    return key if profile == FRAME_REF_PROFILE else None
+
+
+def parse(data):
+    """Decode an RTP packet in place; header and payload are memoryviews into data."""
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    packet = RtpPacket.__new__(RtpPacket)
+    packet.byte0, packet.byte1, packet.seq, packet.ts, packet.ssrc = RTP_HEADER.unpack_from(view)
+    packet.header = view[:HEADER_SIZE]
+    packet.payload = view[HEADER_SIZE:]
+    return packet
+
+
 class RtpPacket:
+    # __slots__: không có __dict__, mỗi gói nhỏ gọn hơn và truy cập thuộc tính nhanh hơn
+    __slots__ = ('header', 'payload', 'byte0', 'byte1', 'seq', 'ts', 'ssrc')
+
     def __init__(self):
         # header và payload là thuộc tính instance (không dùng biến class)
         self.header = bytearray(HEADER_SIZE) # khởi tạo header (12 bytes)
         self.payload = b''  # payload (rỗng)
+        self.byte0 = self.byte1 = self.seq = self.ts = self.ssrc = 0
 
-    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None):
         """Encode the RTP packet with header fields and payload."""
-        timestamp = int(time()) # Lấy thời gian hiện tại làm timestamp
+        if timestamp is None:
+            timestamp = int(time()) # Lấy thời gian hiện tại làm timestamp
         header = bytearray(HEADER_SIZE) # Tạo header mới
-
-        # Byte 0: V(2), P(1), X(1), CC(4)
-        # Byte 0: Ghép 4 trường thành 1 byte
-        # version << 6: dịch version 6 bit sang trái (2 bit đầu)
-        # padding << 5: dịch padding 5 bit sang trái (bit thứ 3)
-        # extension << 4: dịch extension 4 bit sang trái (bit thứ 4)
-        # cc & 0x0F: lấy 4 bit cuối của cc
-        header[0] = (version << 6) | (padding << 5) | (extension << 4) | (cc & 0x0F)
-
-        # Byte 1: M(1), PT(7)
-        # Byte 1: Marker bit (1 bit) và Payload Type (7 bit)
-        header[1] = ((marker & 0x01) << 7) | (pt & 0x7F)
-
-        # Seqnum (16 bit) - big
-        # Sequence Number (16 bit) - chia thành 2 bytes
-        header[2] = (seqnum >> 8) & 0xFF # Byte cao nhất
-        header[3] = seqnum & 0xFF  # Byte thấp nhất
-
-        # Timestamp (32 bit)
-        # Timestamp (32 bit) - chia thành 4 bytes
-        header[4] = (timestamp >> 24) & 0xFF # Byte cao nhất
-        header[5] = (timestamp >> 16) & 0xFF
-        header[6] = (timestamp >> 8) & 0xFF
-        header[7] = timestamp & 0xFF  # Byte thấp nhất
-
-        # SSRC (32 bit)
-        # SSRC - Synchronization Source (32 bit)
-        header[8]  = (ssrc >> 24) & 0xFF
-        header[9]  = (ssrc >> 16) & 0xFF
-        header[10] = (ssrc >> 8) & 0xFF
-        header[11] = ssrc & 0xFF
+        pack_into(header, 0, seqnum, timestamp, ssrc, marker, pt, version, padding, extension, cc)
+        self.byte0, self.byte1, self.seq, self.ts, self.ssrc = RTP_HEADER.unpack_from(header)
 
         self.header = header
-        # ensure payload is bytes type
-        # Đảm bảo payload là kiểu bytes
-        self.payload = payload if isinstance(payload, (bytes, bytearray)) else bytes(payload)
+        # keep bytes-like payloads (bytes, bytearray, memoryview) as-is - no copy
+        # Giữ nguyên payload dạng buffer, chỉ chuyển đổi khi cần
+        self.payload = payload if isinstance(payload, (bytes, bytearray, memoryview)) else bytes(payload)
 
     def decode(self, byteStream):
-        """Decode the RTP packet. byteStream: bytes or bytearray."""
-        bs = bytearray(byteStream)
-        self.header = bs[:HEADER_SIZE]
-        self.payload = bytes(bs[HEADER_SIZE:])
+        """Decode the RTP packet. byteStream: bytes, bytearray or memoryview (not copied)."""
+        view = byteStream if isinstance(byteStream, memoryview) else memoryview(byteStream)
+        self.byte0, self.byte1, self.seq, self.ts, self.ssrc = RTP_HEADER.unpack_from(view)
+        self.header = view[:HEADER_SIZE]
+        self.payload = view[HEADER_SIZE:]
 
     def version(self):
         """Return RTP version."""
-        return (self.header[0] >> 6) & 0x03
+        return (self.byte0 >> 6) & 0x03
 
     def seqNum(self):
-        """Return sequence (frame) number."""
-        return (self.header[2] << 8) | self.header[3]
+        """Return the 16-bit packet sequence number."""
+        return self.seq
 
     def timestamp(self):
         """Return timestamp."""
-        return (self.header[4] << 24) | (self.header[5] << 16) | (self.header[6] << 8) | self.header[7]
+        return self.ts
 
     def payloadType(self):
         """Return payload type."""
-        return self.header[1] & 0x7F
+        return self.byte1 & 0x7F
 
     def getPayload(self):
         """Return payload (bytes)."""
-        return bytes(self.payload)
+        return self.payload if isinstance(self.payload, bytes) else bytes(self.payload)
 
     def getPacket(self):
         """Return RTP packet as bytes (header + payload)."""
-        return bytes(self.header) + bytes(self.payload)
+        return b''.join((self.header, self.payload))
 
     def marker(self):
         """Return the Marker bit (M bit) as 0 or 1."""
-        return (self.header[1] >> 7) & 0x01
+        return (self.byte1 >> 7) & 0x01
 
     # CLIENT-SIDE CACHING - CREATE HASH FOR FRAME
     def getFrameHash(self):
-        """Tạo hash duy nhất cho frame để sử dụng trong caching system"""
-        import hashlib
-        return hashlib.md5(self.payload).hexdigest()[:16] # Lấy 16 ký tự đầu
\ No newline at end of file
+        """Return the content hash of this packet's payload as 16 hex digits.
+
+        Only whole-frame hashes are useful for caching; see frameHash().
+        """
+        return '%016x' % frameHash(self.payload)
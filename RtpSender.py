@@ -0,0 +1,109 @@
+import sys, socket, struct, errno
+from time import time
+
+from RtpPacket import HEADER_SIZE, pack_into
+
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # không có trên Windows
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)  # Linux >= 4.18
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+# errors of a GSO send that mean the kernel or the device cannot segment it
+GSO_UNSUPPORTED = (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOPROTOOPT, errno.EIO)
+
+
+class RtpSender:
+    """Batched RTP transmission for one UDP socket.
+
+    Headers are packed into a reusable buffer and each packet is handed to the
+    kernel as [header, payload] with sendmsg, so payload memoryviews are never
+    copied. On Linux a run of equal-sized packets goes out in a single sendmsg
+    with UDP generic segmentation offload (GSO).
+    """
+
+    def __init__(self, sock, maxBatch=GSO_MAX_SEGMENTS):
+        self.sock = sock
+        self.maxBatch = maxBatch
+        self.headers = bytearray(HEADER_SIZE * maxBatch)
+        self.headerView = memoryview(self.headers)
+        self.useGso = HAS_SENDMSG and sys.platform.startswith('linux')
+        self.syscalls = 0
+        self.packets = 0
+
+    def send(self, packets, addr, timestamp=None, ssrc=0, pt=26, extension=0):
+        """Send packets, a list of (seqnum, marker, payload), to addr."""
+        if timestamp is None:
+            timestamp = int(time())
+        for start in range(0, len(packets), self.maxBatch):
+            batch = packets[start:start + self.maxBatch]
+            for i, (seqnum, marker, _) in enumerate(batch):
+                pack_into(self.headers, i * HEADER_SIZE, seqnum, timestamp, ssrc, marker, pt, extension=extension)
+            self.sendBatch(batch, addr)
+
+    def fanOut(self, packets, addrs, timestamp, ssrc=0, pt=26, extension=0):
+        """Send the same packets to every address, packing the headers once.
+
+        Returns how many addresses failed; the others are still served.
+        """
+        failed = set()
+        for start in range(0, len(packets), self.maxBatch):
+            batch = packets[start:start + self.maxBatch]
+            for i, (seqnum, marker, _) in enumerate(batch):
+                pack_into(self.headers, i * HEADER_SIZE, seqnum, timestamp, ssrc, marker, pt, extension=extension)
+            for addr in addrs:
+                try:
+                    self.sendBatch(batch, addr)
+                except OSError:
+                    failed.add(addr)
+        return len(failed)
+
+    def sendBatch(self, batch, addr):
+        """Transmit a batch whose headers are already packed in self.headers."""
+        self.packets += len(batch)
+        if not HAS_SENDMSG:
+            for i, (_, _, payload) in enumerate(batch):
+                self.sock.sendto(self.headers[i * HEADER_SIZE:(i + 1) * HEADER_SIZE] + payload, addr)
+                self.syscalls += 1
+            return
+
+        i = 0
+        while i < len(batch):
+            n = self.gsoRun(batch, i) if self.useGso else 1
+            if n > 1:
+                try:
+                    self.sendGso(batch, i, n, addr)
+                    i += n
+                    continue
+                except OSError as e:
+                    if e.errno not in GSO_UNSUPPORTED:
+                        raise  # full buffer, unreachable peer...: a send error, GSO stays on
+                    print("UDP GSO unavailable, falling back to one sendmsg per packet:", e)
+                    self.useGso = False
+            payload = batch[i][2]
+            self.sock.sendmsg([self.headerView[i * HEADER_SIZE:(i + 1) * HEADER_SIZE], payload], [], 0, addr)
+            self.syscalls += 1
+            i += 1
+
+    def gsoRun(self, batch, start):
+        """Return how many packets from start can share one GSO send."""
+        size = len(batch[start][2])
+        limit = min(len(batch) - start, GSO_MAX_SEGMENTS, GSO_MAX_BYTES // (HEADER_SIZE + size))
+        n = 1
+        while n < limit:
+            nextSize = len(batch[start + n][2])
+            if nextSize > size:
+                break
+            n += 1
+            if nextSize < size:
+                break  # only the last segment may be shorter
+        return n
+
+    def sendGso(self, batch, start, n, addr):
+        """Send n packets in one sendmsg; the kernel splits them into datagrams."""
+        segment = HEADER_SIZE + len(batch[start][2])
+        buffers = []
+        for i in range(start, start + n):
+            buffers.append(self.headerView[i * HEADER_SIZE:(i + 1) * HEADER_SIZE])
+            buffers.append(batch[i][2])
+        self.sock.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', segment))], 0, addr)
+        self.syscalls += 1
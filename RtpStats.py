@@ -0,0 +1,116 @@
+from time import monotonic
+from RtpPacket import SEQ_MOD, extendSeq
+
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+DISCONTINUITY = 1.0  # seconds; bigger transit jumps are pauses or seeks, not jitter
+
+
+class ReceptionStats:
+    """Receiver-side RTP statistics (RFC 3550, appendix A).
+
+    Tracks extended sequence numbers across 16-bit wraparound, packet loss,
+    reordering and the interarrival jitter in media clock units.
+    """
+
+    def __init__(self, clockRate=90000):
+        self.clockRate = clockRate
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.baseSeq = 0
+        self.maxSeq = 0  # extended with wrap cycles
+        self.received = 0
+        self.reordered = 0
+        self.badSeq = SEQ_MOD + 1
+        self.jitter = 0.0
+        self.lastTimestamp = None
+        self.lastTransit = None
+        # snapshot for fractionLost(), updated at every report
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+
+    def update(self, seq, timestamp, arrival=None):
+        """Account for one received packet."""
+        if arrival is None:
+            arrival = monotonic()
+        if not self.initialized:
+            self.initialized = True
+            self.baseSeq = seq
+            self.maxSeq = seq
+        else:
+            delta = extendSeq(seq, self.maxSeq) - self.maxSeq
+            if 0 <= delta < MAX_DROPOUT:
+                self.maxSeq += delta  # kể cả khi seqnum quay vòng 65535 -> 0
+            elif -MAX_MISORDER < delta < 0:
+                self.reordered += 1  # gói đến muộn / sai thứ tự
+            else:
+                # very large jump: resync if the next packet follows this one
+                if seq == self.badSeq:
+                    self.reset()
+                    self.initialized = True
+                    self.baseSeq = seq
+                    self.maxSeq = seq
+                else:
+                    self.badSeq = (seq + 1) % SEQ_MOD
+                    return
+        self.received += 1
+
+        # jitter is measured on the first packet of each frame only: fragments
+        # of one frame share a timestamp but are deliberately spread in time
+        if timestamp != self.lastTimestamp:
+            transit = arrival * self.clockRate - timestamp
+            if self.lastTransit is not None:
+                d = abs(transit - self.lastTransit)
+                if d < self.clockRate * DISCONTINUITY:  # bỏ qua khi timestamp nhảy (seek)
+                    self.jitter += (d - self.jitter) / 16.0
+            self.lastTransit = transit
+            self.lastTimestamp = timestamp
+
+    def restartJitter(self):
+        """Measure jitter from the next frame on, as after PLAY: the pause is not a transit change."""
+        self.lastTransit = None
+        self.lastTimestamp = None
+
+    def extendedMaxSeq(self):
+        """Return the highest sequence number received, extended with wrap cycles."""
+        return self.maxSeq
+
+    def expected(self):
+        """Return the number of packets expected since the first one."""
+        if not self.initialized:
+            return 0
+        return self.extendedMaxSeq() - self.baseSeq + 1
+
+    def lost(self):
+        """Return the cumulative number of packets lost (may be negative with duplicates)."""
+        return self.expected() - self.received
+
+    def fractionLost(self):
+        """Return the fraction lost since the previous call, as in an RTCP report."""
+        expected = self.expected()
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        lostInterval = expectedInterval - receivedInterval
+        if expectedInterval <= 0 or lostInterval <= 0:
+            return 0.0
+        return lostInterval / expectedInterval
+
+    def jitterMs(self):
+        """Return the interarrival jitter in milliseconds."""
+        return self.jitter * 1000.0 / self.clockRate
+
+    def summary(self):
+        """Return the statistics as a dict."""
+        expected = self.expected()
+        return {
+            'received': self.received,
+            'expected': expected,
+            'lost': self.lost(),
+            'loss_rate': max(0, self.lost()) / expected if expected else 0.0,
+            'reordered': self.reordered,
+            'jitter_ms': self.jitterMs(),
+        }
@@ -0,0 +1,110 @@
+import socket, threading, queue
+from time import perf_counter
+
+from RtpSender import RtpSender
+
+SEND_BUFFER = 4 * 1024 * 1024  # SO_SNDBUF asked for each RTP socket (the kernel may cap it)
+
+
+def tuneSendBuffer(sock, size=SEND_BUFFER):
+    """Ask for a larger send buffer; return the size the kernel granted."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+    except OSError:
+        pass
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+
+
+class TransmitLane:
+    """One long-lived UDP socket with its RtpSender and the queue its sender thread drains."""
+
+    def __init__(self, index, queueLimit):
+        self.index = index
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('', 0))  # fixed source port, announced in SETUP replies
+        self.sendBuffer = tuneSendBuffer(self.sock)
+        self.sender = RtpSender(self.sock)
+        self.jobs = queue.Queue(queueLimit)
+        self.sessions = 0  # sessions assigned to this lane
+        self.thread = None
+
+
+class RtpTransmitter:
+    """Pool of UDP sockets shared by every session, each drained by a dedicated sender thread.
+
+    The pacing threads only build (seqnum, marker, payload) lists and queue
+    them; the syscalls happen on the lane's thread. A session stays on one
+    lane, so its packets leave in order.
+    """
+
+    def __init__(self, sockets=2, queueLimit=1024):
+        self.numSockets = sockets
+        self.queueLimit = queueLimit  # batches waiting per lane before new ones are dropped
+        self.lanes = []
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def start(self):
+        """Open the sockets and start the sender threads (called lazily on first use)."""
+        with self.lock:
+            while len(self.lanes) < self.numSockets:
+                lane = TransmitLane(len(self.lanes), self.queueLimit)
+                lane.thread = threading.Thread(target=self.run, args=(lane,), daemon=True,
+                                               name="rtp-tx-%d" % lane.index)
+                self.lanes.append(lane)
+                lane.thread.start()
+
+    def assign(self):
+        """Pick the lane with the fewest sessions for a new session."""
+        if len(self.lanes) < self.numSockets:
+            self.start()
+        with self.lock:
+            lane = min(self.lanes, key=lambda l: l.sessions)
+            lane.sessions += 1
+            return lane
+
+    def unassign(self, lane):
+        with self.lock:
+            lane.sessions -= 1
+
+    def submit(self, lane, packets, addrs, timestamp, ssrc, metrics, extension=0):
+        """Queue packets for the lane's sender to send to each of addrs.
+
+        Returns False if the lane is backed up and they were dropped.
+        """
+        try:
+            lane.jobs.put_nowait((packets, addrs, timestamp, ssrc, metrics, extension))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            metrics.countSendErrors()
+            return False
+
+    def run(self, lane):
+        """Sender thread: transmit queued batches, recording the send time in the session's metrics."""
+        while True:
+            packets, addrs, timestamp, ssrc, metrics, extension = lane.jobs.get()
+            start = perf_counter()
+            failed = lane.sender.fanOut(packets, addrs, timestamp, ssrc, extension=extension)
+            if failed:
+                metrics.countSendErrors(failed)
+                print("RTP send error on lane %d (%d of %d addresses)" % (lane.index, failed, len(addrs)))
+            metrics.sendLatency.observe(perf_counter() - start)
+
+    def queued(self):
+        """Return the number of batches waiting in all lanes."""
+        return sum(lane.jobs.qsize() for lane in self.lanes)
+
+    def stats(self):
+        return {
+            'sockets': len(self.lanes),
+            'queued': self.queued(),
+            'dropped': self.dropped,
+            'send_buffer': [lane.sendBuffer for lane in self.lanes],
+            'syscalls': sum(lane.sender.syscalls for lane in self.lanes),
+        }
+
+
+# Socket dùng chung cho mọi phiên của tiến trình
+sharedTransmitter = RtpTransmitter()
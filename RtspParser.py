@@ -0,0 +1,142 @@
+import re
+
+HEAD_END = re.compile(rb'\r?\n\r?\n')
+MAX_HEAD_SIZE = 64 * 1024  # request line + headers
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class RtspParseError(ValueError):
+    """The peer sent something that is not an RTSP message."""
+
+
+class RtspMessage:
+    """One RTSP request or reply: start line, headers and body."""
+    __slots__ = ('startLine', 'headers', 'body')
+
+    def __init__(self, startLine, headers, body=b''):
+        self.startLine = startLine
+        self.headers = headers  # [(name, value)] in the order received
+        self.body = body
+
+    def header(self, name, default=None):
+        """Return the value of a header (case-insensitive; the last one if repeated)."""
+        name = name.lower()
+        for key, value in reversed(self.headers):
+            if key.lower() == name:
+                return value
+        return default
+
+    def headerValues(self, name):
+        """Return every value of a repeated header."""
+        name = name.lower()
+        return [value for key, value in self.headers if key.lower() == name]
+
+    def method(self):
+        """Return the request method (upper case), or '' for a reply."""
+        word = self.startLine.split(' ', 1)[0]
+        return '' if word.startswith('RTSP/') else word.upper()
+
+    def uri(self):
+        parts = self.startLine.split()
+        return parts[1] if len(parts) > 1 else ''
+
+    def statusCode(self):
+        """Return the status code of a reply, or None for a request."""
+        parts = self.startLine.split(' ', 2)
+        if not parts[0].startswith('RTSP/') or len(parts) < 2:
+            return None
+        try:
+            return int(parts[1])
+        except ValueError:
+            return None
+
+    def text(self):
+        """Return the message as text, for logging."""
+        lines = [self.startLine] + ['%s: %s' % header for header in self.headers]
+        text = '\n'.join(lines)
+        if self.body:
+            text += '\n\n' + self.body.decode('utf-8', errors='replace')
+        return text
+
+
+class RtspParser:
+    """Incremental RTSP parser for one connection.
+
+    feed() takes whatever recv() returned and gives back every message it
+    completes, so coalesced (pipelined) and split messages both work. A message
+    ends at the blank line after its headers, plus Content-Length bytes of body.
+    Older peers of this project end a message without the blank line; flush()
+    takes the buffered bytes as one message once the peer has gone quiet.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.head = None  # (startLine, headers) waiting for its body
+        self.bodyLength = 0
+
+    def feed(self, data):
+        """Add received bytes; return the list of messages now complete."""
+        self.buffer += data
+        messages = []
+        while True:
+            if self.head is None:
+                # CRLFs between messages are allowed (keep-alives, legacy terminators)
+                start = 0
+                while start < len(self.buffer) and self.buffer[start] in b'\r\n':
+                    start += 1
+                if start:
+                    del self.buffer[:start]
+                match = HEAD_END.search(self.buffer)
+                if match is None:
+                    if len(self.buffer) > MAX_HEAD_SIZE:
+                        raise RtspParseError("RTSP header block too large")
+                    return messages
+                self.head = self.parseHead(bytes(self.buffer[:match.start()]))
+                del self.buffer[:match.end()]
+            if len(self.buffer) < self.bodyLength:
+                return messages
+            body = bytes(self.buffer[:self.bodyLength])
+            del self.buffer[:self.bodyLength]
+            messages.append(RtspMessage(self.head[0], self.head[1], body))
+            self.head = None
+            self.bodyLength = 0
+
+    def pending(self):
+        """Return True if part of a message is buffered."""
+        return self.head is not None or bool(self.buffer.strip())
+
+    def flush(self):
+        """Take everything buffered as complete messages (peer stopped sending)."""
+        messages = []
+        if self.head is not None:
+            messages.append(RtspMessage(self.head[0], self.head[1], bytes(self.buffer)))
+        elif self.buffer.strip():
+            startLine, headers = self.parseHead(bytes(self.buffer).strip())
+            messages.append(RtspMessage(startLine, headers))
+        self.buffer.clear()
+        self.head = None
+        self.bodyLength = 0
+        return messages
+
+    def parseHead(self, block):
+        """Split a header block into the start line and (name, value) headers."""
+        lines = block.decode('utf-8', errors='replace').splitlines()
+        startLine = lines[0].strip()
+        if len(startLine.split()) < 2:
+            raise RtspParseError("malformed RTSP start line: %r" % startLine)
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                continue  # bỏ qua dòng không phải header
+            headers.append((name.strip(), value.strip()))
+        self.bodyLength = 0
+        for name, value in headers:
+            if name.lower() == 'content-length':
+                try:
+                    self.bodyLength = int(value)
+                except ValueError:
+                    raise RtspParseError("bad Content-Length: %r" % value)
+                if not 0 <= self.bodyLength <= MAX_BODY_SIZE:
+                    raise RtspParseError("Content-Length out of range: %d" % self.bodyLength)
+        return startLine, headers
@@ -0,0 +1,82 @@
+import heapq, itertools, threading, traceback
+from time import monotonic
+
+
+class PacingTimer:
+    """Handle for a callback registered with the PacingScheduler."""
+    __slots__ = ('callback', 'active')
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.active = True
+
+
+class PacingScheduler:
+    """Heap of deadlines on the monotonic clock, served by a small pool of threads.
+
+    A callback is called as callback(now) once its deadline is reached and returns
+    its next absolute deadline, or None to stop.
+    """
+
+    def __init__(self, threads=1):
+        self.numThreads = threads
+        self.heap = []  # (deadline, seq, timer)
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.threads = []
+
+    def start(self):
+        """Start the pacing threads (called lazily on first schedule)."""
+        with self.cond:
+            while len(self.threads) < self.numThreads:
+                thread = threading.Thread(target=self.run, daemon=True, name="pacer-%d" % len(self.threads))
+                self.threads.append(thread)
+                thread.start()
+
+    def schedule(self, deadline, callback):
+        """Register callback to fire at the given monotonic deadline."""
+        if len(self.threads) < self.numThreads:
+            self.start()
+        timer = PacingTimer(callback)
+        self.push(deadline, timer)
+        return timer
+
+    def cancel(self, timer):
+        """Stop a timer; it is dropped lazily when it reaches the top of the heap."""
+        timer.active = False
+
+    def push(self, deadline, timer):
+        with self.cond:
+            heapq.heappush(self.heap, (deadline, next(self.counter), timer))
+            if self.heap[0][2] is timer:
+                self.cond.notify()  # deadline mới sớm hơn, đánh thức luồng đang ngủ
+
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    deadline, _, timer = self.heap[0]
+                    if not timer.active:
+                        heapq.heappop(self.heap)
+                        continue
+                    now = monotonic()
+                    if deadline > now:
+                        self.cond.wait(deadline - now)
+                        continue
+                    heapq.heappop(self.heap)
+                    break
+
+            try:
+                nextDeadline = timer.callback(now)
+            except Exception:
+                traceback.print_exc()
+                nextDeadline = None
+            if nextDeadline is not None and timer.active:
+                self.push(nextDeadline, timer)
+
+
+# Bộ lập lịch dùng chung cho mọi phiên của server đa luồng
+sharedScheduler = PacingScheduler()
@@ -1,26 +1,115 @@
-import sys, socket
+import socket, signal, argparse
+from time import monotonic, sleep
 
 from ServerWorker import ServerWorker
+from FrameCache import sharedCache
+from Scheduler import sharedScheduler
+from RtpTransmitter import sharedTransmitter
+from Broadcast import sharedBroadcasts
+from Metrics import startMetricsServer, sharedMetrics
 
 
 class Server:
+    USAGE = "Server.py Server_port [options]"
+    DRAIN_POLL = 0.2  # how often a draining worker checks for remaining sessions
+
+    prefork = False  # set in pre-fork workers: share the port, drain on SIGTERM
+    drainTimeout = 30.0
+    draining = False
 
     def main(self):
-        try:
-            SERVER_PORT = int(sys.argv[1])
-        except:
-            print("[Usage: Server.py Server_port]\n")
+        args = self.parseArgs()
+        if args is None:
+            print("[Usage: %s]\n" % self.USAGE)
+            return
+        if args.workers > 1:
+            from Prefork import Supervisor
+            Supervisor(self, args).run()
             return
+        if args.metrics_port:
+            startMetricsServer(args.metrics_port)
+        self.serve(args.port)
+
+    def parseArgs(self):
+        """Parse the command line and apply the options shared by every server engine."""
+        parser = argparse.ArgumentParser(usage=self.USAGE)
+        parser.add_argument('port', type=int)
+        parser.add_argument('--no-mmap', action='store_true',
+                            help="read frames with file I/O through the shared frame cache")
+        parser.add_argument('--cache-mb', type=int, default=sharedCache.budget // (1024 * 1024),
+                            help="memory budget of the shared frame cache in MB (used with --no-mmap only)")
+        parser.add_argument('--pacing-threads', type=int, default=sharedScheduler.numThreads,
+                            help="threads serving the shared RTP pacing scheduler")
+        parser.add_argument('--no-hints', action='store_true',
+                            help="ignore <file>.hint and fragment every frame at send time")
+        parser.add_argument('--rtp-sockets', type=int, default=sharedTransmitter.numSockets,
+                            help="shared UDP sockets (each with its own sender thread) carrying RTP")
+        parser.add_argument('--no-dedup', action='store_true',
+                            help="always send repeated frames in full, even to clients with a frame cache")
+        parser.add_argument('--no-congestion-control', action='store_true',
+                            help="send at the file's rate whatever loss the clients report")
+        parser.add_argument('--broadcast', action='store_true',
+                            help="live-style: read and packetize each file once and fan it out to all its viewers")
+        parser.add_argument('--metrics-port', type=int, default=0,
+                            help="serve Prometheus metrics on this localhost port (0: off); "
+                                 "worker N of a pre-fork server uses this port + N")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="worker processes accepting on the port with SO_REUSEPORT (Linux)")
+        parser.add_argument('--drain-timeout', type=float, default=self.drainTimeout,
+                            help="seconds a stopping or replaced worker keeps serving its sessions")
+        try:
+            args = parser.parse_args()
+        except SystemExit:
+            return None
+        ServerWorker.USE_MMAP = not args.no_mmap
+        ServerWorker.DEDUP_FRAMES = not args.no_dedup
+        ServerWorker.USE_HINTS = not args.no_hints
+        ServerWorker.CONGESTION_CONTROL = not args.no_congestion_control
+        if args.broadcast:
+            ServerWorker.broadcasts = sharedBroadcasts
+        sharedCache.setBudget(args.cache_mb * 1024 * 1024)
+        sharedScheduler.numThreads = max(1, args.pacing_threads)
+        sharedTransmitter.numSockets = max(1, args.rtp_sockets)
+        return args
+
+    def serve(self, SERVER_PORT):
+        """Accept RTSP connections, one ServerWorker thread per client."""
         rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.prefork:
+            rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stopAccepting(rtspSocket))
         rtspSocket.bind(('', SERVER_PORT))
         rtspSocket.listen(5)
 
         # Receive client info (address,port) through RTSP/TCP session
-        while True:
+        while not self.draining:
             clientInfo = {}
-            clientInfo['rtspSocket'] = rtspSocket.accept()
+            try:
+                clientInfo['rtspSocket'] = rtspSocket.accept()
+            except OSError:
+                if self.draining:
+                    break
+                raise
             ServerWorker(clientInfo).run()
+        rtspSocket.close()
+
+        self.onDrain()
+        deadline = monotonic() + self.drainTimeout
+        while self.sessionsLeft() and monotonic() < deadline:
+            sleep(self.DRAIN_POLL)
+
+    def stopAccepting(self, rtspSocket):
+        """SIGTERM in a pre-fork worker: stop accepting; open sessions keep streaming."""
+        self.draining = True
+        rtspSocket.shutdown(socket.SHUT_RDWR)  # wakes the blocked accept()
+
+    def onDrain(self):
+        """Called once the worker has stopped accepting (set by the pre-fork supervisor)."""
+        pass
+
+    def sessionsLeft(self):
+        return sharedMetrics.serverValues()['active_sessions']
 
 
 if __name__ == "__main__":
-    (Server()).main()
\ No newline at end of file
+    (Server()).main()
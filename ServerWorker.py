@@ -1,28 +1,105 @@
 from random import randint
-import sys, traceback, threading, socket
-
-from VideoStream import VideoStream
-from RtpPacket import RtpPacket
+from collections import deque, OrderedDict
+from time import monotonic
+import os, sys, math, traceback, threading, socket
+
+from VideoStream import VideoStream, tierFileName
+from RtpPacket import RtpPacket, HEADER_SIZE, MJPEG_CLOCK_RATE, frameHash, packFrameRef
+from FrameCache import sharedCache
+from Scheduler import sharedScheduler
+from RtpTransmitter import sharedTransmitter
+from HintFile import acquireHints, releaseHints
+from Metrics import SessionMetrics, sharedMetrics
+from Rtcp import sharedRtcp, packSenderReport, ntpTime, roundTripTime, RTCP_RTPFB
+from Congestion import CongestionController
+from Retransmission import PacketHistory
+from RtspParser import RtspParser, RtspParseError
 
 class ServerWorker:
     SETUP = 'SETUP'
     PLAY = 'PLAY'
     PAUSE = 'PAUSE'
     TEARDOWN = 'TEARDOWN'
+    SET_PARAMETER = 'SET_PARAMETER'
+    GET_PARAMETER = 'GET_PARAMETER'
 
     INIT = 0
     READY = 1
     PLAYING = 2
 
+    MAX_RTP_PAYLOAD = 1400 # gửi tối đa bao nhiêu bytes
+    USE_MMAP = True  # đọc khung qua mmap dùng chung, không sao chép
+    USE_HINTS = True  # take fragments and frame hashes from <file>.hint when it is up to date
+    BURST_SPREAD = 0.5  # fraction of the frame interval the fragments are spread over
+    FRAGMENTS_PER_BURST = 8  # fragments sent back-to-back in one batched send
+    MIN_FRAGMENT_GAP = 0.001  # fragments due within this many seconds are sent together
+    LEGACY_FLUSH_TIMEOUT = 0.2  # a request without the final blank line is complete after this pause
+    DEDUP_FRAMES = True  # gửi tham chiếu thay cho frame lặp lại nếu client có cache
+    ADAPTIVE_TIERS = True  # switch to <file>.tier1, .tier2... (MakeTiers.py) on receiver reports
+    TIER_DOWN_LOSS = 0.05  # fraction lost in one report that moves the session a tier down
+    TIER_DOWN_JITTER = 0.5  # jitter, in frame intervals, that does the same
+    TIER_UP_LOSS = 0.01  # reports with less loss count towards moving back up
+    TIER_UP_REPORTS = 5  # clean reports in a row before trying the next tier up
+    TIER_HOLD = 2.0  # seconds after a switch during which reports (on the old tier) are ignored
+    CONGESTION_CONTROL = True  # limit each session's send rate on its receiver reports
+    RTCP_INTERVAL = 1.0  # seconds between sender reports
+    HISTORY_SIZE = 1024  # packets kept for retransmission (power of two)
+    MAX_RETRANSMIT = 64  # packets resent for one NACK
+    SESSION_ID_ATTEMPTS = 32  # random ids tried before SETUP gives up with 503
+
     OK_200 = 0
     FILE_NOT_FOUND_404 = 1
     CON_ERR_500 = 2
+    SESSION_NOT_FOUND_454 = 3
+    INVALID_RANGE_457 = 4
+    SERVICE_UNAVAILABLE_503 = 5
+    PARAMETER_NOT_UNDERSTOOD_451 = 6
+
+    router = None  # pre-fork workers: reaches sessions owned by other processes (Prefork.WorkerRouter)
+    broadcasts = None  # --broadcast: Broadcast.BroadcastRegistry, one shared stream per file
 
     def __init__(self, clientInfo):
         # clientInfo expected: {'rtspSocket': (connSocket, (addr,port)), ...}
         self.clientInfo = clientInfo
         self.state = self.INIT
 
+        # pacing state, driven by sendRtp(now)
+        self.sendLock = threading.Lock()
+        self.interval = 0.05
+        self.frameDeadline = 0.0
+        self.pending = deque()  # (deadline, payload_chunk, marker_bit) of the current frame
+        self.pendingFrame = 0
+        self.rtpAddr = None
+        self.lane = None  # shared RTP socket of this session (RtpTransmitter lane)
+
+        # RTP identity: random SSRC, initial seqnum and timestamp base (RFC 3550 5.1)
+        self.ssrc = randint(0, 0xFFFFFFFF)
+        self.rtpSeq = randint(0, 0xFFFF)
+        self.tsBase = randint(0, 0xFFFFFFFF)
+
+        # frames the client should still have cached: hash -> size, least recent first
+        self.sentFrames = OrderedDict()
+        self.sentBytes = 0
+        self.dedupBudget = 0  # 0: client did not announce a frame cache
+        self.framesDeduped = 0
+
+        # quality tiers: files best first, the one being sent and the one reports ask for
+        self.tierFiles = []
+        self.tier = 0
+        self.wantedTier = 0
+        self.cleanReports = 0
+        self.reportsSincePlay = 0  # the first one may still count the pause as jitter
+        self.tierChanged = 0.0
+
+        # RTCP: sender reports out, receiver reports in (loss, jitter, RTT) drive the send rate
+        self.congestion = CongestionController()
+        self.lastSenderReport = 0.0
+        self.history = PacketHistory(self.HISTORY_SIZE)  # sent packets a NACK can ask for again
+
+        # counters and latency histograms, exported through Metrics
+        self.metrics = SessionMetrics()
+        self.nextDeadline = None  # deadline the pacing tick was scheduled for
+
     def run(self): # chạy hàm này
         threading.Thread(target=self.recvRtspRequest, daemon=True).start() # bắt đầu xử lý trong luồng
 
@@ -34,60 +111,75 @@ class ServerWorker:
             print("No rtsp socket in clientInfo")
             return
 
+        parser = RtspParser()
         while True:
             try:
                 data = connSocket.recv(4096) # nhận dữ liệu từ client
+            except socket.timeout:
+                # an older client that does not end its requests with a blank line
+                connSocket.settimeout(None)
+                data = None
             except Exception:
                 traceback.print_exc()
                 break
 
-            if not data:
+            if data is not None and not data:
                 # connection closed by client
                 break
 
             try:
-                text = data.decode('utf-8', errors='ignore') # phân tích dữ liệu
-                print("Data received:\n" + text)  # in ra cái gì đã nhận từ client
-                self.processRtspRequest(text) # đưa vào trong quy trình xử lý
+                self.processRtspMessages(parser.feed(data) if data is not None else parser.flush())
+            except RtspParseError as e:
+                print("Bad RTSP request, closing connection:", e)
+                break
+            connSocket.settimeout(self.LEGACY_FLUSH_TIMEOUT if parser.pending() else None)
+
+        self.connectionClosed()
+        connSocket.close()
+
+    def connectionClosed(self):
+        """End the session of a client that closed the RTSP connection without TEARDOWN."""
+        if 'session' in self.clientInfo:
+            self.stopSending()  # broadcasts loop forever: leave the stream too
+            self.closeSession()
+
+    def processRtspMessages(self, messages):
+        """Handle each complete request, in order (several may come in one read)."""
+        for message in messages:
+            try:
+                print("Data received:\n" + message.text())  # in ra cái gì đã nhận từ client
+                self.processRtspRequest(message) # đưa vào trong quy trình xử lý
             except Exception:
                 traceback.print_exc()
 
-    def processRtspRequest(self, data):
+    def processRtspRequest(self, message):
         """Process RTSP request sent from the client."""
-        # normalize lines (handle CRLF)
-        request_lines = [line.strip() for line in data.splitlines() if line.strip() != ''] # lấy dữ liệu từ cái data
-        if not request_lines:
-            return
-
-        # parse request line safely
-        first_line_parts = request_lines[0].split() # split() để tách khoảng trắng
-        if len(first_line_parts) < 2:
+        requestType = message.method() # chuyển thành chữ in hoa, để cho thấy cái yêu cầu là gì
+        filename = message.uri() # tên file video muốn truyền vào
+        sharedMetrics.countRequest(requestType)
+
+        seq = message.header('CSeq') # theo dõi cái yêu cầu có được thực hiện hay không
+        transport = message.header('Transport')  # client_port
+        range_value = message.header('Range')  # npt seeking on PLAY
+        cache_size = message.header('Frame-Cache')  # client cache size (SETUP)
+        missed = message.headerValues('Frame-Miss')  # frames the client lacks (SET_PARAMETER)
+
+        # a session set up on another connection, maybe in another worker process
+        session = message.header('Session')
+        if (self.router is not None and session and 'session' not in self.clientInfo
+                and requestType in (self.PAUSE, self.TEARDOWN)):
+            self.forwardRequest(requestType, session, seq or '0')
             return
-        requestType = first_line_parts[0].upper() # chuyển thành chữ in hoa, để cho thấy cái yêu cầu là gì
-        filename = first_line_parts[1] # tên file video muốn truyền vào
-
-        # find CSeq
-        seq = None
-        for line in request_lines[1:6]:
-            if line.upper().startswith('CSEQ'):
-                parts = line.split(':', 1)
-                if len(parts) == 2:
-                    seq = parts[1].strip() # lấy ra cái cổng số mấy để theo dõi cái yêu cầu có được thực hiện hay không
-                break
-
-        # find Transport line (to get client_port)
-        transport_line = None
-        for line in request_lines[1:]:
-            if line.upper().startswith('TRANSPORT'):
-                transport_line = line  # lấy cái dòng cuối cùng
-                break
 
         # HANDLE REQUEST TYPES
         if requestType == self.SETUP:
             if self.state == self.INIT:
                 print("processing SETUP") # in ra dòng để bảo đang setup
                 try:
-                    self.clientInfo['videoStream'] = VideoStream(filename) # lấy cái video
+                    if self.broadcasts is not None:
+                        self.clientInfo['broadcast'] = self.broadcasts.open(filename)
+                    else:
+                        self.clientInfo['videoStream'] = self.openVideo(filename) # lấy cái video
                     self.state = self.READY # --> hiển thị ra để sẳn sàn cho việc chiếu
                 except IOError:
                     # file not found -> reply 404
@@ -95,149 +187,656 @@ class ServerWorker:
                     return
 
                 # generate session id
-                self.clientInfo['session'] = randint(100000, 999999) # tạo một phiên làm việc giữa client và server để đảm bảo việc làm việc giữa hai đó không bị gián đoạn
+                sessionId = self.newSessionId()
+                if sessionId is None:
+                    # the pre-fork session table is full
+                    self.closeSession()
+                    self.state = self.INIT
+                    self.replyRtsp(self.SERVICE_UNAVAILABLE_503, seq or '0')
+                    return
+                self.clientInfo['session'] = sessionId # tạo một phiên làm việc giữa client và server để đảm bảo việc làm việc giữa hai đó không bị gián đoạn
 
-                # parse client port from Transport header if present
-                if transport_line and '=' in transport_line:
+                # parse client ports from Transport header if present: client_port=rtp[-rtcp]
+                if transport and '=' in transport:
                     try:
-                        port_str = transport_line.split('=')[-1].strip().strip('; ')
-                        self.clientInfo['rtpPort'] = int(port_str) # lưu thông tin cổng rtp cho trường khách hàng
+                        ports = transport.split('=')[-1].strip().strip('; ').split('-')
+                        self.clientInfo['rtpPort'] = int(ports[0]) # lưu thông tin cổng rtp cho trường khách hàng
+                        # RTCP on the next port unless the client names another one
+                        self.clientInfo['rtcpPort'] = int(ports[1]) if len(ports) > 1 else int(ports[0]) + 1
                     except Exception:
                         # fallback: leave rtpPort absent -> server will log error when sending
                         traceback.print_exc()
 
+                if self.ADAPTIVE_TIERS and 'videoStream' in self.clientInfo:
+                    self.tierFiles = self.findTiers(filename)
+
+                # the client keeps frames it has seen: repeated frames can be sent by hash
+                if cache_size and self.DEDUP_FRAMES:
+                    try:
+                        # half of it: the rest holds frames waiting for playback
+                        self.dedupBudget = int(cache_size) // 2
+                    except ValueError:
+                        self.dedupBudget = 0
+
+                rtspAddr = self.clientInfo['rtspSocket'][1]
+                sharedMetrics.register(self.clientInfo['session'], self.metrics,
+                                       '%s:%s' % tuple(rtspAddr[:2]), self)
+
+                # receiver reports come to the process-wide RTCP socket
+                headers = []
+                if 'rtcpPort' in self.clientInfo:
+                    self.clientInfo['rtcpAddr'] = (rtspAddr[0], self.clientInfo['rtcpPort'])
+                    sharedRtcp.register(self.clientInfo['rtcpAddr'], self)
+                    headers.append('Transport: RTP/AVP;unicast;client_port=%d-%d;server_port=%d-%d' % (
+                        self.clientInfo['rtpPort'], self.clientInfo['rtcpPort'],
+                        self.rtpSourcePort(), sharedRtcp.port()))
+                    if 'broadcast' not in self.clientInfo:
+                        headers.append('RTCP-Feedback: nack')  # lost packets are resent from the history
+
                 # send 200 OK
-                self.replyRtsp(self.OK_200, seq or '0')
+                self.replyRtsp(self.OK_200, seq or '0', headers)
 
         elif requestType == self.PLAY:
-            if self.state == self.READY:
+            if self.state == self.READY and 'broadcast' in self.clientInfo:
+                print("processing PLAY (broadcast)")
+                self.state = self.PLAYING
+                self.joinBroadcast(filename, seq or '0')
+
+            elif self.state == self.READY:
                 print("processing PLAY")
+                try:
+                    start = self.parseNptRange(range_value) if range_value else None
+                except ValueError:
+                    self.replyRtsp(self.INVALID_RANGE_457, seq or '0')
+                    return
                 self.state = self.PLAYING
 
                 # create UDP socket (for sending RTP)
                 try:
-                    self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # giao thức udp để gửi đoạn video
+                    self.openRtpSocket()
                 except Exception:
                     traceback.print_exc()
                     self.replyRtsp(self.CON_ERR_500, seq or '0')
                     return
 
-                # event to control send loop
-                self.clientInfo['event'] = threading.Event() # tạo một cái điều khiển luồng
+                # seek to the requested position using the frame index
+                with self.sendLock:  # a tick of the previous PLAY may still be running
+                    video = self.clientInfo['videoStream']
+                    if start is not None:
+                        video.seekTime(start)
+                    npt = video.frameNbr() / video.frameRate
+                    rtpInfo = 'RTP-Info: url=%s;seq=%d;rtptime=%d' % (
+                        filename, self.rtpSeq, self.mediaTimestamp(video.frameNbr() + 1))
+                    self.reportsSincePlay = 0
 
-                # reply OK then start sender thread
-                self.replyRtsp(self.OK_200, seq or '0') # gửi phản hồi
-                worker = threading.Thread(target=self.sendRtp, daemon=True) # chỉ truyền tên hàm, tham chiếu tới hàm thôi chứ chưa chạy, còn nếu gọi sendRtp() thì nó sẽ trả về None
-
-                self.clientInfo['worker'] = worker  # lưu thông tin luồng vào clientInfo
-                worker.start() # bắt đầu luồng bằng việc gửi Rtp và daemon để luồng không cản trở chương trình chính kết thúc
+                # reply OK then start sending
+                self.replyRtsp(self.OK_200, seq or '0', ['Range: npt=%.3f-' % npt, rtpInfo]) # gửi phản hồi
+                self.startStreaming()
 
         elif requestType == self.PAUSE:
             if self.state == self.PLAYING:
                 print("processing PAUSE")
                 self.state = self.READY # gán lại cái
-                if 'event' in self.clientInfo:
-                    self.clientInfo['event'].set() # KIỂM TRA CÁI NÀY CÓ ĐÚNG HAY KHÔNG
+                self.stopSending()
                 self.replyRtsp(self.OK_200, seq or '0') # gửi phản hồi khách hàng
 
+        elif requestType == self.SET_PARAMETER:
+            # the client no longer has these frames: send them in full next time
+            # (the frame that missed is not resent, it is past its display time)
+            with self.sendLock:
+                for key in missed:
+                    try:
+                        self.forgetFrame(int(key, 16))
+                    except ValueError:
+                        pass
+            self.replyRtsp(self.OK_200, seq or '0')
+
+        elif requestType == self.GET_PARAMETER:
+            # body lines name the parameters wanted; none means all of them
+            values = self.metrics.snapshot() if self.state != self.INIT else {}
+            values.update(('server_' + name, value) for name, value in sharedMetrics.serverValues().items())
+            names = message.body.decode('utf-8', errors='ignore').split()
+            wanted = [name for name in names if name in values]
+            if names and not wanted:
+                self.replyRtsp(self.PARAMETER_NOT_UNDERSTOOD_451, seq or '0')
+                return
+            body = ''.join('%s: %s\r\n' % (name, values[name]) for name in wanted or values)
+            self.replyRtsp(self.OK_200, seq or '0', ['Content-Type: text/parameters'], body)
+
         elif requestType == self.TEARDOWN:
             print("processing TEARDOWN")
-            if 'event' in self.clientInfo:
-                self.clientInfo['event'].set() # gửi tiếp, khi mà bị dừng thì nó vẫn gửi video lên chứ không phải là dừng luôn
+            self.stopSending()
             self.replyRtsp(self.OK_200, seq or '0')
-            # close RTP socket if exists
-            if 'rtpSocket' in self.clientInfo: # kiểm tra sự tồn tại của RTP sockets để đóng nó lại
-                try:
-                    self.clientInfo['rtpSocket'].close()
-                except Exception:
-                    pass
-
-    def sendRtp(self):
-        """Send RTP packets over UDP (fragmenting large frames)."""
-        MAX_RTP_PAYLOAD = 1400 # gửi tối đa bao nhiêu bytes
-        event = self.clientInfo.get('event')
-        video = self.clientInfo.get('videoStream')
-        rtp_socket = self.clientInfo.get('rtpSocket')
-        if not (event and video and rtp_socket): # nếu không có thông tin của những cái này thì nó sẽ bị dừng lại
-            print("sendRtp: missing event/video/rtp_socket")
+            self.closeSession()
+
+    def newSessionId(self):
+        """Pick a random session id, unique across worker processes when pre-forked; None if none is free."""
+        for _ in range(self.SESSION_ID_ATTEMPTS):
+            sessionId = randint(100000, 999999)
+            if self.router is None or self.router.claim(sessionId, self):
+                return sessionId
+        return None
+
+    def forwardRequest(self, requestType, session, seq):
+        """Apply a request for a session owned elsewhere and wait for the result."""
+        try:
+            sessionId = int(session.split(';')[0])
+        except ValueError:
+            sessionId = 0
+        done = threading.Event()
+        result = []
+        self.router.forward(requestType, sessionId, lambda code: (result.append(code), done.set()))
+        done.wait(self.router.TIMEOUT * 2)
+        self.replyRtsp(result[0] if result else self.CON_ERR_500, seq, ['Session: %d' % sessionId])
+
+    def runForwarded(self, requestType, done):
+        """Apply a request that reached another connection; done(code) gets the reply code."""
+        done(self.applyForwarded(requestType))
+
+    def applyForwarded(self, requestType):
+        if requestType == self.PAUSE and self.state == self.PLAYING:
+            print("processing forwarded PAUSE")
+            self.state = self.READY
+            self.stopSending()
+        elif requestType == self.TEARDOWN:
+            print("processing forwarded TEARDOWN")
+            self.stopSending()
+            self.closeSession()
+        return self.OK_200
+
+    def openVideo(self, filename):
+        """Open a media file, with its pre-packetized layout if a matching .hint file exists."""
+        video = VideoStream(filename, self.USE_MMAP)
+        if self.USE_HINTS:
+            video.hints = acquireHints(video, self.MAX_RTP_PAYLOAD)
+        return video
+
+    def findTiers(self, filename):
+        """Return the file of each quality tier present for a media file, best first."""
+        tiers = [filename]
+        while os.path.exists(tierFileName(filename, len(tiers))):
+            tiers.append(tierFileName(filename, len(tiers)))
+        return tiers
+
+    def closeVideo(self, video):
+        if video.hints is not None:
+            releaseHints(video)
+        video.close()
+
+    def joinBroadcast(self, filename, seq):
+        """PLAY in broadcast mode: receive the file's shared stream from its next frame (no seeking)."""
+        self.rtpAddr = self.clientRtpAddress()
+        if self.rtpAddr is None:
+            self.replyRtsp(self.CON_ERR_500, seq)
             return
-
-        while True:
-            # wait short time; if event set -> stop
-            was_set = event.wait(0.05)  # chờ một xíu
-            if was_set or event.is_set():
-                break
-
+        rtpSeq, rtptime = self.clientInfo['broadcast'].subscribe(self, self.rtpAddr)
+        rtpInfo = 'RTP-Info: url=%s;seq=%d;rtptime=%d' % (filename, rtpSeq, rtptime)
+        self.replyRtsp(self.OK_200, seq, ['Range: npt=now-', rtpInfo])
+
+    def stopSending(self):
+        """Stop RTP to this session: its own pacing, or its place in a broadcast."""
+        source = self.clientInfo.get('broadcast')
+        if source is not None:
+            source.unsubscribe(self)
+        self.stopStreaming()
+
+    # RTCP
+    def onRtcp(self, packet):
+        """Handle an RTCP packet from this session's client (RTCP thread)."""
+        if packet.packetType == RTCP_RTPFB:
+            if packet.mediaSsrc == self.ssrc:
+                self.onNack(packet.nacks)
+            return
+        for block in packet.blocks:
+            if block.ssrc == self.ssrc:
+                rtt = roundTripTime(block)
+                if rtt is not None:
+                    self.metrics.rtt = rtt
+                self.onReceiverReport(block)
+                if self.CONGESTION_CONTROL:
+                    with self.sendLock:
+                        self.congestion.onReport(monotonic(), block.fractionLost, rtt)
+                    self.metrics.rateLimit = self.congestion.rate or 0
+
+    def onNack(self, seqs):
+        """Resend the packets a client reports lost, those still in the history (RTCP thread)."""
+        with self.sendLock:
+            if self.rtpAddr is None:
+                return
+            self.congestion.onNack(len(seqs))
+            entries = [entry for entry in map(self.history.get, seqs[:self.MAX_RETRANSMIT]) if entry is not None]
+            if not entries:
+                return
             try:
-                data = video.nextFrame()  # đọc cái khung tiếp theo
+                entries = self.resendPackets(entries)
             except Exception:
                 traceback.print_exc()
-                break
-
+                return
+            if not entries:
+                return
+            nbytes = sum(len(entry[2]) + HEADER_SIZE for entry in entries)
+            self.metrics.packets_retransmitted += len(entries)
+            self.congestion.onSent(nbytes, len(entries))
+            self.congestion.charge(nbytes)
+
+    def sendSenderReport(self, now, video):
+        """Send an RTCP SR; the client echoes its time back (LSR/DLSR), which gives the RTT."""
+        self.lastSenderReport = now
+        packets = self.metrics.packets_sent
+        report = packSenderReport(self.ssrc, ntpTime(), self.mediaTimestamp(video.frameNbr() + 1),
+                                  packets, self.metrics.bytes_sent - HEADER_SIZE * packets)
+        sharedRtcp.send(report, self.clientInfo['rtcpAddr'])
+
+    def onReceiverReport(self, block):
+        """Choose the quality tier from the loss and jitter a client reports.
+
+        A lossy or jittery report moves one tier down; TIER_UP_REPORTS clean
+        ones in a row move one tier up. The switch itself happens at the next
+        frame boundary (nextTick). The jitter of the first report after PLAY
+        is not used: it may still include the pause or the seek.
+        """
+        self.reportsSincePlay += 1
+        if len(self.tierFiles) < 2 or monotonic() - self.tierChanged < self.TIER_HOLD:
+            return
+        jitter = block.jitter / MJPEG_CLOCK_RATE / self.interval  # in frame intervals
+        if self.reportsSincePlay == 1:
+            jitter = 0.0
+        if block.fractionLost >= self.TIER_DOWN_LOSS or jitter >= self.TIER_DOWN_JITTER:
+            self.cleanReports = 0
+            self.wantedTier = min(self.tier + 1, len(self.tierFiles) - 1)
+        elif block.fractionLost <= self.TIER_UP_LOSS:
+            self.cleanReports += 1
+            if self.cleanReports >= self.TIER_UP_REPORTS:
+                self.cleanReports = 0
+                self.wantedTier = max(self.tier - 1, 0)
+        else:
+            self.cleanReports = 0
+
+    def switchTier(self, video):
+        """Continue from the same frame in the wanted tier's file (frame boundary, sendLock held)."""
+        tier = self.wantedTier
+        try:
+            other = self.openVideo(self.tierFiles[tier])
+            if other.frameCount() != video.frameCount():
+                self.closeVideo(other)
+                raise IOError
+        except IOError:
+            print("Quality tier %d of %s is unusable" % (tier, self.tierFiles[0]))
+            if tier > self.tier:
+                del self.tierFiles[tier:]
+            self.wantedTier = self.tier
+            return video
+        other.seek(video.frameNbr())
+        self.clientInfo['videoStream'] = other
+        self.closeVideo(video)
+        print("Session %s: quality tier %d -> %d" % (self.clientInfo.get('session'), self.tier, tier))
+        self.tier = tier
+        self.tierChanged = monotonic()
+        self.metrics.tier = tier
+        self.metrics.tier_switches += 1
+        return other
+
+    # STREAMING HOOKS (overridden by the asyncio server)
+    def openRtpSocket(self):
+        """Attach the session to one of the shared RTP sockets (once; PAUSE/PLAY keep it)."""
+        if self.lane is None:
+            self.lane = sharedTransmitter.assign()
+
+    def rtpSourcePort(self):
+        """Return the local port this session's RTP leaves from (the first server_port)."""
+        sender = self.clientInfo.get('broadcast', self)
+        with sender.sendLock:
+            sender.openRtpSocket()
+            return sender.lane.sock.getsockname()[1]
+
+    def startStreaming(self):
+        """Register this session with the shared pacing scheduler."""
+        if not self.preparePacing(monotonic()):
+            return
+        self.clientInfo['timer'] = sharedScheduler.schedule(self.frameDeadline, self.sendRtp)
+
+    def stopStreaming(self):
+        """Remove this session from the pacing scheduler."""
+        timer = self.clientInfo.pop('timer', None)
+        if timer is not None:
+            sharedScheduler.cancel(timer) # dừng gửi khung
+
+    def preparePacing(self, now):
+        """Reset the pacing state before PLAY; returns False if RTP cannot be sent.
+
+        Timers are cancelled lazily, so sendLock is taken against a tick of the previous PLAY.
+        """
+        with self.sendLock:
+            self.rtpAddr = self.clientRtpAddress()
+            if self.rtpAddr is None:
+                return False
+            video = self.clientInfo['videoStream']
+            self.interval = 1.0 / video.frameRate
+            self.frameDeadline = now + self.interval
+            self.nextDeadline = self.frameDeadline
+            self.pending.clear()
+            return True
+
+    def closeSession(self):
+        """Release the RTP socket and the video stream after TEARDOWN."""
+        with self.sendLock:  # chờ lần gửi đang chạy kết thúc
+            self.releaseResources()
+
+    def releaseResources(self):
+        """Leave the shared RTP socket and close the video stream (sendLock must be held)."""
+        # the socket is shared: batches already queued still go out, nothing is closed under them
+        if self.lane is not None:
+            sharedTransmitter.unassign(self.lane)
+            self.lane = None
+        if self.clientInfo.get('videoStream') and self.clientInfo['videoStream'].view is None:
+            print("Frame cache:", sharedCache.stats())
+        if self.framesDeduped:
+            print("Frames sent as references:", self.framesDeduped)
+        sharedMetrics.unregister(self.clientInfo.get('session'))
+        if 'rtcpAddr' in self.clientInfo:
+            sharedRtcp.unregister(self.clientInfo.pop('rtcpAddr'), self)
+        if self.router is not None:
+            self.router.release(self.clientInfo.get('session'))
+        if 'broadcast' in self.clientInfo:
+            source = self.clientInfo.pop('broadcast')
+            source.unsubscribe(self)
+            self.broadcasts.release(source)
+        # release the file handle / shared mapping
+        if 'videoStream' in self.clientInfo:
+            try:
+                self.closeVideo(self.clientInfo.pop('videoStream'))
+            except Exception:
+                pass
+
+    def parseNptRange(self, value):
+        """Return the start time in seconds from a Range header value 'npt=start-[end]'.
+
+        None if there is nothing to seek to; ValueError if the start is not a time.
+        """
+        value = value.strip()
+        if not value.lower().startswith('npt='):
+            return None
+        start = value[4:].split('-', 1)[0].strip()
+        if start in ('', 'now'):
+            return None
+        seconds = float(start)
+        if not math.isfinite(seconds):
+            raise ValueError("npt start is not finite: %r" % start)
+        return max(0.0, seconds)
+
+    def sendRtp(self, now):
+        """Send the RTP fragments that are due and return the next deadline (None to stop)."""
+        with self.sendLock:
+            video = self.clientInfo.get('videoStream')
+            if video is None:
+                return None
+            if self.nextDeadline is not None:
+                self.metrics.lateness.observe(max(0.0, now - self.nextDeadline))
+            self.nextDeadline = self.nextTick(now, video)
+            return self.nextDeadline
+
+    def nextTick(self, now, video):
+        """Body of sendRtp (sendLock held): send what is due, return the next deadline."""
+        if not self.pending:
+            # frame boundary: deadlines are absolute, so time spent reading and
+            # sending does not drift; after a long stall resync instead of bursting
+            if now - self.frameDeadline > self.interval:
+                self.frameDeadline = now
+            if self.wantedTier != self.tier:
+                video = self.switchTier(video)
+            if 'rtcpAddr' in self.clientInfo and now - self.lastSenderReport >= self.RTCP_INTERVAL:
+                self.sendSenderReport(now, video)
+            try:
+                data = self.readFrame(video)  # đọc cái khung tiếp theo
+            except Exception:
+                traceback.print_exc()
+                return None
+            if data is None:
+                print("sendRtp: end of stream")
+                return None
             if not data:
-                continue
-
-            frameNumber = video.frameNbr() # lấy ra cái số thức tự của khung
-            frame_size = len(data) # chiều dài của khung theo số nguyên
-            num_chunks = (frame_size + MAX_RTP_PAYLOAD - 1) // MAX_RTP_PAYLOAD # chia khung đó ra thành nhiều khung để truyền gói đó đi
-
-            # get client address (from RTSP socket info)
+                # an empty frame: nothing to send, keep the timing
+                self.frameDeadline += self.interval
+                return self.frameDeadline
+
+            # a repeat of a frame the client has cached goes out as one small packet
+            hints = video.hints
+            key = hints.frameHash(video.frameNbr() - 1) if hints else None
+            if self.dedupBudget and self.sendFrameRef(data, video.frameNbr(), key):
+                self.frameDeadline += self.interval
+                return self.frameDeadline
+
+            # over the session's send rate: skip the frame
+            if self.CONGESTION_CONTROL and not self.congestion.admit(now, len(data)):
+                if self.dedupBudget:
+                    self.forgetFrame(key if key is not None else frameHash(data))
+                self.metrics.frames_skipped += 1
+                self.frameDeadline += self.interval
+                return self.frameDeadline
+
+            # spread the fragments, in small bursts that go out as one batch,
+            # over part of the interval instead of one frame-sized burst
+            if hints:
+                fragments = hints.fragments(video.frameNbr() - 1, data)  # pre-packetized
+            else:
+                fragments = list(self.iterFragments(data))
+            spread = self.congestion.spread(len(data), self.interval * self.BURST_SPREAD)
+            perBurst = self.FRAGMENTS_PER_BURST
+            if self.congestion.rate is not None:
+                # rate-limited: bursts as small as the timer resolution allows
+                perBurst = max(1, min(perBurst, int(len(fragments) * self.MIN_FRAGMENT_GAP / spread) + 1))
+            bursts = (len(fragments) + perBurst - 1) // perBurst
+            gap = spread / bursts
+            for i, (payload_chunk, marker_bit) in enumerate(fragments):
+                deadline = self.frameDeadline + (i // perBurst) * gap
+                self.pending.append((deadline, payload_chunk, marker_bit))
+            self.pendingFrame = video.frameNbr() # lấy ra cái số thức tự của khung
+            self.frameDeadline += self.interval
+
+        # every fragment that is due goes out as one batch per wakeup
+        batch = []
+        while self.pending and self.pending[0][0] <= now + self.MIN_FRAGMENT_GAP:
+            _, payload_chunk, marker_bit = self.pending.popleft()
+            batch.append((payload_chunk, marker_bit))
+        if batch:
             try:
-                rtsp_info = self.clientInfo.get('rtspSocket')
-                if not rtsp_info or len(rtsp_info) < 2:
-                    print("sendRtp: no rtspSocket address info")
-                    break
-                address = rtsp_info[1][0]
-                port = int(self.clientInfo.get('rtpPort', 0))
-                if port == 0:
-                    print("sendRtp: rtpPort missing or zero")
-                    break
+                self.countedSend(batch, self.pendingFrame)
             except Exception:
+                print("Connection Error sending RTP chunk")
                 traceback.print_exc()
-                break
-
-            for i in range(num_chunks):
-                start = i * MAX_RTP_PAYLOAD
-                end = min((i + 1) * MAX_RTP_PAYLOAD, frame_size)
-                payload_chunk = data[start:end]
-                marker_bit = 1 if (i == num_chunks - 1) else 0
-
-                try:
-                    rtp_packet = self.makeRtp(payload_chunk, frameNumber, marker_bit)
-                    # ensure bytes
-                    if isinstance(rtp_packet, str):
-                        rtp_packet = rtp_packet.encode('latin1')
-                    rtp_socket.sendto(rtp_packet, (address, port))
-                except Exception:
-                    print("Connection Error sending RTP chunk")
-                    traceback.print_exc()
-                    # break out of chunk loop on send error to avoid busy-looping
-                    break
+                # drop the rest of the frame on send error to avoid busy-looping
+                self.pending.clear()
+
+        return self.pending[0][0] if self.pending else self.frameDeadline
+
+    def sendPackets(self, batch, frameNumber, extension=0):
+        """Queue a batch of (payload_chunk, marker_bit) fragments of one frame on the session's socket.
+
+        Returns False if the lane's queue was full and the batch was dropped (its seqnums are used anyway).
+        """
+        seq = self.rtpSeq
+        packets = [((seq + i) & 0xFFFF, marker_bit, payload_chunk)
+                   for i, (payload_chunk, marker_bit) in enumerate(batch)]
+        self.rtpSeq = (seq + len(batch)) & 0xFFFF
+        return sharedTransmitter.submit(self.lane, packets, [self.rtpAddr], self.mediaTimestamp(frameNumber),
+                                        self.ssrc, self.metrics, extension)
+
+    def resendPackets(self, entries):
+        """Queue packets from the history again, with their original seqnums and timestamps.
+
+        Returns the entries queued (those of a full lane are dropped).
+        """
+        if self.lane is None:
+            return []
+        batches = {}  # (timestamp, extension) -> entries: one job per frame
+        for entry in entries:
+            batches.setdefault((entry[3], entry[4]), []).append(entry)
+        queued = []
+        for (timestamp, extension), group in batches.items():
+            packets = [(seq, marker, payload) for seq, marker, payload, _, _ in group]
+            if sharedTransmitter.submit(self.lane, packets, [self.rtpAddr], timestamp, self.ssrc, self.metrics,
+                                        extension):
+                queued.extend(group)
+        return queued
+
+    def countedSend(self, batch, frameNumber, extension=0):
+        """sendPackets, counting the packets and bytes sent and any error, and keeping them for NACKs.
+
+        The send latency is recorded where the syscalls happen (the transmit thread).
+        """
+        seq = self.rtpSeq
+        try:
+            sent = self.sendPackets(batch, frameNumber, extension)
+        except Exception:
+            self.metrics.countSendErrors()
+            raise
+        if not sent:
+            self.metrics.countDropped(len(batch))  # lane backed up: not sent, not resendable
+            return
+        self.history.add(seq, batch, self.mediaTimestamp(frameNumber), extension)
+        nbytes = sum(len(payload) for payload, _ in batch) + HEADER_SIZE * len(batch)
+        frames = 0 if extension else sum(marker for _, marker in batch)  # gói cuối của mỗi frame
+        self.metrics.countSent(len(batch), nbytes, frames)
+        self.congestion.onSent(nbytes, len(batch))
+
+    def sendFrameRef(self, data, frameNumber, key=None):
+        """Send a reference packet if the client has this frame cached; otherwise remember it.
+
+        key is the frame's hash if already known. Returns True if the reference
+        was sent (sendLock must be held).
+        """
+        if key is None:
+            key = frameHash(data)
+        if key in self.sentFrames:
+            self.sentFrames.move_to_end(key)
+            try:
+                self.countedSend([(packFrameRef(key), 1)], frameNumber, extension=1)
+            except Exception:
+                traceback.print_exc()
+            self.framesDeduped += 1
+            self.metrics.frames_referenced += 1
+            return True
+        self.sentFrames[key] = len(data)
+        self.sentBytes += len(data)
+        while self.sentBytes > self.dedupBudget and self.sentFrames:
+            self.sentBytes -= self.sentFrames.popitem(last=False)[1]
+        return False
+
+    def forgetFrame(self, key):
+        """Stop referencing a frame the client reported missing (sendLock must be held)."""
+        size = self.sentFrames.pop(key, None)
+        if size is not None:
+            self.sentBytes -= size
+
+    def nextSeq(self):
+        """Return the next 16-bit RTP sequence number (one per packet, wrapping)."""
+        seq = self.rtpSeq
+        self.rtpSeq = (seq + 1) & 0xFFFF
+        return seq
+
+    def mediaTimestamp(self, frameNumber):
+        """Return the 90 kHz RTP timestamp of a frame (frameNumber counts from 1)."""
+        video = self.clientInfo.get('videoStream')
+        frameRate = video.frameRate if video else VideoStream.FRAME_RATE
+        return (self.tsBase + (frameNumber - 1) * MJPEG_CLOCK_RATE // frameRate) & 0xFFFFFFFF
 
-    def makeRtp(self, payload, frameNbr, marker=0):
+    def clientRtpAddress(self):
+        """Return the (address, port) RTP is sent to, or None if unknown."""
+        try:
+            rtsp_info = self.clientInfo.get('rtspSocket')
+            if not rtsp_info or len(rtsp_info) < 2:
+                print("sendRtp: no rtspSocket address info")
+                return None
+            address = rtsp_info[1][0]
+            port = int(self.clientInfo.get('rtpPort', 0))
+            if port == 0:
+                print("sendRtp: rtpPort missing or zero")
+                return None
+        except Exception:
+            traceback.print_exc()
+            return None
+        return (address, port)
+
+    def iterFragments(self, data):
+        """Yield (payload_chunk, marker_bit) for each RTP fragment of a frame."""
+        frame_size = len(data) # chiều dài của khung theo số nguyên
+        num_chunks = (frame_size + self.MAX_RTP_PAYLOAD - 1) // self.MAX_RTP_PAYLOAD # chia khung đó ra thành nhiều khung để truyền gói đó đi
+        # slicing a memoryview does not copy the frame data
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        for i in range(num_chunks):
+            start = i * self.MAX_RTP_PAYLOAD
+            end = min(start + self.MAX_RTP_PAYLOAD, frame_size)
+            yield view[start:end], 1 if (i == num_chunks - 1) else 0
+
+    def readFrame(self, video):
+        """Return the next frame, serving it from the shared frame cache when possible; None at the end."""
+        if video.view is not None:
+            return video.nextFrame()  # mmap: các phiên đã dùng chung bộ nhớ
+        index = video.frameNbr()
+        key = (video.path, index)
+        data = sharedCache.get(key)
+        if data is None:
+            data = video.nextFrame()
+            if data is not None:
+                sharedCache.put(key, data)
+        else:
+            video.seek(index + 1)  # bỏ qua khung đã có trong cache
+        return data
+
+    def makeRtp(self, payload, frameNbr, marker=0, extension=0):
         """RTP-packetize the video data."""
+        return self.makeRtpPacket(payload, frameNbr, marker, extension).getPacket()
+
+    def makeRtpPacket(self, payload, frameNbr, marker=0, extension=0):
+        """Build the RtpPacket for a payload without joining header and payload."""
         version = 2
         padding = 0
-        extension = 0
         cc = 0
         pt = 26  # MJPEG
-        seqnum = frameNbr
-        ssrc = 0
+        seqnum = self.nextSeq()
+        ssrc = self.ssrc
 
         rtpPacket = RtpPacket()
-        rtpPacket.encode(version, padding, extension, cc, seqnum, marker, pt, ssrc, payload)
-        return rtpPacket.getPacket()
+        rtpPacket.encode(version, padding, extension, cc, seqnum, marker, pt, ssrc, payload,
+                         self.mediaTimestamp(frameNbr))
+        return rtpPacket
 
-    def replyRtsp(self, code, seq):
+    def replyRtsp(self, code, seq, headers=None, body=None):
         """Send RTSP reply to the client."""
         if code == self.OK_200:
             # print("200 OK")
-            reply = 'RTSP/1.0 200 OK\nCSeq: ' + seq + '\nSession: ' + str(self.clientInfo['session'])
-            connSocket = self.clientInfo['rtspSocket'][0]
-            connSocket.send(reply.encode())
+            reply = 'RTSP/1.0 200 OK\r\nCSeq: ' + seq
+            if 'session' in self.clientInfo:
+                reply += '\r\nSession: ' + str(self.clientInfo['session'])
+            for header in headers or []:
+                reply += '\r\n' + header
+            if body is not None:
+                reply += '\r\nContent-Length: %d\r\n\r\n%s' % (len(body.encode()), body)
+            else:
+                reply += '\r\n\r\n'
+            self.sendReply(reply)
 
         # Error messages
         elif code == self.FILE_NOT_FOUND_404:
             print("404 NOT FOUND")
+            self.sendReply('RTSP/1.0 404 Not Found\r\nCSeq: %s\r\n\r\n' % seq)
         elif code == self.CON_ERR_500:
             print("500 CONNECTION ERROR")
+            self.sendReply('RTSP/1.0 500 Internal Server Error\r\nCSeq: %s\r\n\r\n' % seq)
+        elif code == self.SESSION_NOT_FOUND_454:
+            print("454 SESSION NOT FOUND")
+            self.sendReply('RTSP/1.0 454 Session Not Found\r\nCSeq: %s\r\n\r\n' % seq)
+        elif code == self.INVALID_RANGE_457:
+            print("457 INVALID RANGE")
+            self.sendReply('RTSP/1.0 457 Invalid Range\r\nCSeq: %s\r\n\r\n' % seq)
+        elif code == self.PARAMETER_NOT_UNDERSTOOD_451:
+            print("451 PARAMETER NOT UNDERSTOOD")
+            self.sendReply('RTSP/1.0 451 Parameter Not Understood\r\nCSeq: %s\r\n\r\n' % seq)
+        elif code == self.SERVICE_UNAVAILABLE_503:
+            print("503 SERVICE UNAVAILABLE")
+            self.sendReply('RTSP/1.0 503 Service Unavailable\r\nCSeq: %s\r\n\r\n' % seq)
+
+    def sendReply(self, reply):
+        """Write an RTSP reply on the control connection."""
+        connSocket = self.clientInfo['rtspSocket'][0]
+        connSocket.send(reply.encode())
@@ -1,22 +1,213 @@
+import os, sys, struct, mmap, threading
+from array import array
+
+INDEX_FILE_EXT = ".idx"
+INDEX_MAGIC = b'VIDX'
+INDEX_VERSION = 1
+# magic, version, source size, source mtime (ns), frame count
+INDEX_HEADER = struct.Struct('!4sHQQI')
+FRAME_HEADER_SIZE = 5
+TIER_FILE_EXT = ".tier%d"  # reduced-quality variant n of a file (MakeTiers.py)
+
+# Shared read-only mappings: realpath -> [mmap, refcount]
+_mappings = {}
+_mappingsLock = threading.Lock()
+
+
+def acquireMapping(filename, fileobj):
+    """Return the process-wide mmap of a file, mapping it on first use."""
+    key = os.path.realpath(filename)
+    with _mappingsLock:
+        entry = _mappings.get(key)
+        if entry is None:
+            entry = [mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ), 0]
+            _mappings[key] = entry
+        entry[1] += 1
+        return entry[0]
+
+
+def releaseMapping(filename):
+    """Drop one reference to a shared mapping, unmapping it when unused."""
+    key = os.path.realpath(filename)
+    with _mappingsLock:
+        entry = _mappings.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _mappings[key]
+            try:
+                entry[0].close()
+            except BufferError:
+                pass  # vẫn còn memoryview đang gửi, GC sẽ giải phóng sau
+
+
+def tierFileName(filename, tier):
+    """Return the name of quality tier n of a file (tier 0 is the file itself)."""
+    return filename + TIER_FILE_EXT % tier if tier else filename
+
+
 class VideoStream:
-    def __init__(self, filename):
+    FRAME_RATE = 20  # khung hình / giây, server gửi mỗi 0.05 s
+
+    def __init__(self, filename, useMmap=False, frameRate=None):
         self.filename = filename
+        self.frameRate = frameRate or self.FRAME_RATE
+        self.path = os.path.realpath(filename)  # khóa dùng chung giữa các phiên
         try:
             self.file = open(filename, 'rb')
         except:
             raise IOError
         self.frameNum = 0
+        self.hints = None  # HintFile.HintTable, set by the server when a fresh .hint file exists
+
+        # Index of every frame: offsets[i] points at frame data (after the 5-byte length)
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        try:
+            self.loadIndex()
+        except IOError:
+            self.file.close()  # không phải file MJPEG hợp lệ
+            raise
+
+        # mmap mode: frames are memoryviews into a mapping shared by all sessions
+        self.view = None
+        if useMmap:
+            try:
+                self.view = memoryview(acquireMapping(filename, self.file))
+            except (ValueError, OSError) as e:
+                print("mmap unavailable, falling back to file reads:", e)
+
+    def close(self):
+        """Release the file handle and the shared mapping."""
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+            releaseMapping(self.filename)
+        self.file.close()
+
+    # FRAME INDEX
+    def indexFileName(self):
+        """Return the path of the on-disk index cached next to the media file."""
+        return self.filename + INDEX_FILE_EXT
+
+    def loadIndex(self):
+        """Load the frame index from disk, rebuilding it if missing or stale."""
+        st = os.fstat(self.file.fileno())
+        try:
+            with open(self.indexFileName(), 'rb') as f:
+                magic, version, size, mtime, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic == INDEX_MAGIC and version == INDEX_VERSION \
+                        and size == st.st_size and mtime == st.st_mtime_ns:
+                    offsets = array('Q')
+                    lengths = array('I')
+                    offsets.fromfile(f, count)
+                    lengths.fromfile(f, count)
+                    if sys.byteorder == 'little':
+                        offsets.byteswap()
+                        lengths.byteswap()
+                    self.offsets, self.lengths = offsets, lengths
+                    return
+        except (OSError, EOFError, struct.error):
+            pass
+
+        self.buildIndex()
+        self.saveIndex(st)
+
+    def buildIndex(self):
+        """Scan the length prefixes once to record the offset/length of every frame."""
+        offsets = array('Q')
+        lengths = array('I')
+        pos = 0
+        with open(self.filename, 'rb') as f:
+            while True:
+                header = f.read(FRAME_HEADER_SIZE)
+                if len(header) < FRAME_HEADER_SIZE:
+                    break
+                try:
+                    framelength = int(header)
+                except ValueError:
+                    framelength = -1
+                if framelength < 0:
+                    raise IOError("corrupt frame header %r at offset %d of %s" % (header, pos, self.filename))
+                pos += FRAME_HEADER_SIZE
+                offsets.append(pos)
+                lengths.append(framelength)
+                pos += framelength
+                f.seek(pos)
+        self.offsets, self.lengths = offsets, lengths
+
+    def saveIndex(self, st):
+        """Write the index next to the media file; failures are not fatal."""
+        offsets = array('Q', self.offsets)
+        lengths = array('I', self.lengths)
+        if sys.byteorder == 'little':
+            offsets.byteswap()
+            lengths.byteswap()
+        tmpname = self.indexFileName() + '.tmp'
+        try:
+            with open(tmpname, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, st.st_size,
+                                          st.st_mtime_ns, len(offsets)))
+                offsets.tofile(f)
+                lengths.tofile(f)
+            os.replace(tmpname, self.indexFileName())
+        except OSError as e:
+            print("Failed to write frame index:", e)
+
+    def frameCount(self):
+        """Return the total number of frames in the file."""
+        return len(self.offsets)
+
+    def duration(self):
+        """Return the length of the stream in seconds."""
+        return self.frameCount() / self.frameRate
+
+    def seek(self, frameNumber):
+        """Position the stream so nextFrame() returns frame index frameNumber (0-based)."""
+        frameNumber = max(0, min(int(frameNumber), self.frameCount()))
+        if self.view is None:  # mmap mode reads by index only
+            if frameNumber < self.frameCount():
+                self.file.seek(self.offsets[frameNumber] - FRAME_HEADER_SIZE)
+            else:
+                self.file.seek(0, os.SEEK_END)
+        self.frameNum = frameNumber
+
+    def seekTime(self, seconds):
+        """Seek to the frame shown at the given normal play time."""
+        self.seek(min(seconds * self.frameRate, self.frameCount()))  # a huge time seeks to the end
+
+    def frameAt(self, n):
+        """Return the data of frame index n (0-based) without moving the stream."""
+        if n < 0 or n >= self.frameCount():
+            return b''
+        if self.view is not None:
+            offset = self.offsets[n]
+            return self.view[offset:offset + self.lengths[n]]
+        if hasattr(os, 'pread'):
+            return os.pread(self.file.fileno(), self.lengths[n], self.offsets[n])
+        with open(self.filename, 'rb') as f:  # Windows không có pread
+            f.seek(self.offsets[n])
+            return f.read(self.lengths[n])
 
     def nextFrame(self):
-        """Get next frame."""
+        """Get next frame; None at the end of the file (a frame may be empty)."""
+        if self.frameNum >= self.frameCount():
+            return None
+        if self.view is not None:
+            data = self.frameAt(self.frameNum)  # memoryview, không sao chép
+            self.frameNum += 1
+            return data
+
         data = self.file.read(
             5)  # Get the framelength from the first 5 bytes, [5 bytes framelength][frame data][5 bytes framelength][frame data]...
-        if data:
-            framelength = int(data)  # lấy ra chiều dài của khung bằng số nguyên
+        if not data:
+            return None
+        framelength = int(data)  # lấy ra chiều dài của khung bằng số nguyên
 
-            # Read the current frame
-            data = self.file.read(framelength)  # đọc cái khung hiện tại
-            self.frameNum += 1  # tăng số lượng khung lên
+        # Read the current frame
+        data = self.file.read(framelength)  # đọc cái khung hiện tại
+        self.frameNum += 1  # tăng số lượng khung lên
         return data
 
     def frameNbr(self):
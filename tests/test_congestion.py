@@ -0,0 +1,57 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Congestion import CongestionController
+
+
+def sendAndReport(controller, now, nbytes, fractionLost, rtt=0.01):
+    controller.onSent(nbytes, packets=100)
+    controller.onReport(now, fractionLost, rtt)
+
+
+def test_loss_cuts_to_the_rate_sent():
+    controller = CongestionController()
+    controller.onReport(0.0, 0.0)
+    sendAndReport(controller, 1.0, 1000000, 0.2)
+    assert controller.rate == pytest.approx(900000)
+    sendAndReport(controller, 2.0, 1000, 0.5)
+    assert controller.rate == controller.MIN_RATE
+
+
+def test_nacks_count_as_loss():
+    controller = CongestionController()
+    controller.onReport(0.0, 0.0)
+    controller.onNack(10)
+    sendAndReport(controller, 1.0, 1000000, 0.0)
+    assert controller.rate == pytest.approx(950000)
+
+
+def test_clean_reports_grow_then_lift_the_limit():
+    controller = CongestionController()
+    controller.onReport(0.0, 0.0)
+    sendAndReport(controller, 1.0, 1000000, 0.1)
+    rate = controller.rate
+    sendAndReport(controller, 2.0, 1000000, 0.0)
+    assert controller.rate == pytest.approx(rate * controller.RATE_INCREASE)
+    sendAndReport(controller, 3.0, 1000000, 0.0, rtt=0.5)  # queueing: held
+    assert controller.rate == pytest.approx(rate * controller.RATE_INCREASE)
+    for n in range(4, 20):
+        sendAndReport(controller, n, 600000, 0.0)
+    assert controller.rate is None
+
+
+def test_token_bucket():
+    controller = CongestionController()
+    assert controller.admit(0.0, 10 ** 9)  # unlimited
+    controller.rate = 100000
+    assert controller.admit(1.0, 5000)  # no credit yet: goes out, and is owed
+    assert not controller.admit(1.01, 5000)
+    assert controller.admit(1.1, 5000)
+    controller.charge(20000)  # a retransmission
+    assert not controller.admit(1.2, 5000)
+    assert controller.admit(10.0, 5000)  # credit capped at BUCKET seconds
+    assert controller.tokens == pytest.approx(100000 * controller.BUCKET - 5000)
+    assert controller.spread(50000, 0.01) == pytest.approx(0.5)
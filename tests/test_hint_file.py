@@ -0,0 +1,64 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HintFile import HINT_FILE_EXT, HintTable, buildHints, acquireHints, releaseHints, _tables
+from RtpPacket import frameHash
+from VideoStream import VideoStream
+
+FRAMES = [b'a' * 10, b'b' * 25, b'']
+
+
+def writeMovie(path):
+    with open(path, 'wb') as f:
+        for data in FRAMES:
+            f.write(b'%05d' % len(data) + data)
+
+
+def test_build_and_load(tmp_path):
+    movie = str(tmp_path / 'movie.Mjpeg')
+    writeMovie(movie)
+    assert buildHints(movie, maxPayload=10) == (3, 4)
+    assert not os.path.exists(movie + HINT_FILE_EXT + '.tmp')
+    video = VideoStream(movie)
+    try:
+        table = HintTable.load(video, 10)
+        for n, data in enumerate(FRAMES):
+            fragments = table.fragments(n, data)
+            assert b''.join(bytes(chunk) for chunk, marker in fragments) == data
+            assert [marker for chunk, marker in fragments] == [0] * (len(fragments) - 1) + [1] * bool(fragments)
+            assert table.frameHash(n) == frameHash(data)
+        assert [len(chunk) for chunk, marker in table.fragments(1, FRAMES[1])] == [10, 10, 5]
+        assert HintTable.load(video, 1400) is None  # built for another payload size
+    finally:
+        video.close()
+
+
+def test_stale_hints_are_ignored(tmp_path):
+    movie = str(tmp_path / 'movie.Mjpeg')
+    writeMovie(movie)
+    buildHints(movie, maxPayload=10)
+    with open(movie, 'ab') as f:
+        f.write(b'00001x')
+    video = VideoStream(movie)
+    try:
+        assert HintTable.load(video, 10) is None
+    finally:
+        video.close()
+
+
+def test_tables_are_shared_and_freed(tmp_path):
+    movie = str(tmp_path / 'movie.Mjpeg')
+    writeMovie(movie)
+    buildHints(movie, maxPayload=10)
+    first, second = VideoStream(movie), VideoStream(movie)
+    try:
+        table = acquireHints(first, 10)
+        assert acquireHints(second, 10) is table
+        releaseHints(first)
+        assert first.path in _tables
+        releaseHints(second)
+        assert first.path not in _tables
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,39 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JitterBuffer import JitterBuffer
+
+
+def test_deadline_anchored_on_first_frame():
+    buffer = JitterBuffer()
+    assert buffer.deadline(90000, now=10.0) == 10.0
+    assert buffer.deadline(90000 + 4500) == pytest.approx(10.05)
+
+
+def test_timestamps_extended_across_wrap():
+    buffer = JitterBuffer()
+    start = (1 << 32) - 4500
+    buffer.deadline(start, now=10.0)
+    assert buffer.deadline(4500) == pytest.approx(10.1)
+    assert buffer.deadline(start) == pytest.approx(10.0)  # an older frame stays older
+
+
+def test_late_frame_pushes_the_schedule_back():
+    buffer = JitterBuffer(minDelay=0.05)
+    buffer.observe(0, arrival=10.0)
+    buffer.deadline(0, now=10.0)
+    buffer.observe(4500, arrival=10.3)  # 0.25 s late
+    assert buffer.lateFrames == 1
+    assert buffer.deadline(4500) >= 10.3 + 0.05
+
+
+def test_seek_is_not_jitter():
+    buffer = JitterBuffer()
+    buffer.observe(0, arrival=10.0)
+    buffer.observe(90000 * 60, arrival=10.05)  # jumped a minute ahead
+    assert buffer.jitter == 0.0
+    buffer.reset()
+    assert buffer.offset is None
@@ -0,0 +1,48 @@
+import os, sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+Image = pytest.importorskip('PIL.Image')
+
+import MakeTiers
+from VideoStream import VideoStream, tierFileName
+from HintFile import HINT_FILE_EXT
+
+
+def writeMovie(path, frames=6, size=(96, 64)):
+    with open(path, 'wb') as f:
+        for n in range(frames):
+            out = BytesIO()
+            Image.new('RGB', size, (n * 40 % 256, 80, 160)).save(out, 'JPEG', quality=90)
+            f.write(b'%05d' % len(out.getvalue()))
+            f.write(out.getvalue())
+
+
+def test_tiers_keep_the_frame_count(tmp_path):
+    movie = str(tmp_path / 'movie.Mjpeg')
+    writeMovie(movie)
+    names = MakeTiers.makeTiers(movie, ((0.5, 50), (0.25, 30)), workers=1)
+    assert names == [tierFileName(movie, 1), tierFileName(movie, 2)]
+    for name in names:
+        video = VideoStream(name)
+        try:
+            assert video.frameCount() == 6
+            assert Image.open(BytesIO(bytes(video.frameAt(0)))).size[0] < 96
+        finally:
+            video.close()
+        assert os.path.exists(name + HINT_FILE_EXT)
+        assert not os.path.exists(name + '.tmp')
+
+
+def test_oversized_frame_leaves_no_tmp_file(tmp_path, monkeypatch, capsys):
+    movie = str(tmp_path / 'movie.Mjpeg')
+    writeMovie(movie)
+    monkeypatch.setattr(MakeTiers, 'MAX_FRAME_SIZE', 10)  # forked workers inherit it
+    monkeypatch.setattr(sys, 'argv', ['MakeTiers.py', movie, '--tier', '0.5:50', '--workers', '1'])
+    MakeTiers.main()
+    assert 'does not fit' in capsys.readouterr().err
+    assert not os.path.exists(tierFileName(movie, 1))
+    assert not os.path.exists(tierFileName(movie, 1) + '.tmp')
@@ -0,0 +1,62 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Rtcp import (RTCP_SR, RTCP_RR, RTCP_RTPFB, ReportBlock, packSenderReport, packReceiverReport,
+                  packNack, parseRtcp, roundTripTime, compactNtp, ntpTime)
+
+
+def test_sender_report_round_trip():
+    block = ReportBlock(0x1234, 0.25, 17, 70000, 450, lsr=0xABCD, dlsr=0x10)
+    data = packSenderReport(0xCAFEBABE, ntpTime(1000.5), 0x1FFFFFFFF, 42, 9000, [block])
+    assert len(data) % 4 == 0
+    packet, = parseRtcp(data)
+    assert (packet.packetType, packet.ssrc) == (RTCP_SR, 0xCAFEBABE)
+    assert (packet.ntp, packet.rtpTime, packet.packetCount, packet.octetCount) == \
+        (ntpTime(1000.5), 0xFFFFFFFF, 42, 9000)
+    got, = packet.blocks
+    assert (got.ssrc, got.fractionLost, got.cumulativeLost, got.highestSeq, got.jitter, got.lsr, got.dlsr) == \
+        (0x1234, 0.25, 17, 70000, 450, 0xABCD, 0x10)
+
+
+def test_receiver_report_negative_loss():
+    data = packReceiverReport(7, [ReportBlock(1, cumulativeLost=-3), ReportBlock(2, 1.0, 0x7FFFFFFF)])
+    packet, = parseRtcp(data)
+    assert packet.packetType == RTCP_RR
+    assert packet.blocks[0].cumulativeLost == -3  # duplicates
+    assert packet.blocks[1].fractionLost == 255 / 256.0
+    assert packet.blocks[1].cumulativeLost == 0x7FFFFF  # clamped to 24 bits
+
+
+def test_nack_round_trip_across_wrap():
+    seqs = [65530, 65535, 0, 5, 65530, 300]
+    packet, = parseRtcp(packNack(7, 99, seqs))
+    assert (packet.packetType, packet.mediaSsrc) == (RTCP_RTPFB, 99)
+    assert sorted(packet.nacks) == sorted(set(seqs))
+
+
+def test_compound_packet():
+    data = packReceiverReport(7, [ReportBlock(1)]) + packNack(7, 1, [10, 12])
+    assert [p.packetType for p in parseRtcp(data)] == [RTCP_RR, RTCP_RTPFB]
+
+
+@pytest.mark.parametrize('data', [
+    b'\x80\xc9\x00',  # shorter than a header
+    b'\x40\xc9\x00\x01' + bytes(4),  # version 1
+    b'\x80\xc9\x00\x05' + bytes(4),  # length past the end
+    b'\x80\xc8\x00\x01' + bytes(4),  # SR without sender info
+    b'\x81\xc9\x00\x01' + bytes(4),  # report block missing
+    b'\x81\xcd\x00\x01' + bytes(4),  # NACK without media SSRC
+])
+def test_malformed_packets(data):
+    with pytest.raises(ValueError):
+        parseRtcp(data)
+
+
+def test_round_trip_time():
+    sent = compactNtp(ntpTime(100.0))
+    block = ReportBlock(1, lsr=sent, dlsr=int(0.25 * 65536))
+    assert roundTripTime(block, now=100.75) == pytest.approx(0.5, abs=1e-4)
+    assert roundTripTime(ReportBlock(1)) is None
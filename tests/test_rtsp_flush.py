@@ -0,0 +1,66 @@
+import os, sys, socket, threading, asyncio, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ClientCore import ClientCore
+from ServerWorker import ServerWorker
+from AsyncServer import AsyncServerWorker
+
+# a Content-Length one byte short leaves a stray 'x' that flush() cannot parse
+SHORT_BODY = b'GET_PARAMETER * RTSP/1.0\r\nCSeq: 1\r\nContent-Length: 14\r\n\r\nserver_threadsx'
+
+
+def readAll(sock, timeout=5.0):
+    """Read until the peer closes; raise socket.timeout if it never does."""
+    sock.settimeout(timeout)
+    data = b''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return data
+        data += chunk
+
+
+class FlushErrorTest(unittest.TestCase):
+    """A message flush() cannot parse closes the connection instead of killing the reader."""
+
+    def setUp(self):
+        self.serverSide, self.clientSide = socket.socketpair()
+        self.addCleanup(self.serverSide.close)
+        self.addCleanup(self.clientSide.close)
+
+    def test_threaded_server(self):
+        worker = ServerWorker({'rtspSocket': (self.serverSide, ('127.0.0.1', 0))})
+        worker.LEGACY_FLUSH_TIMEOUT = 0.05
+        thread = threading.Thread(target=worker.recvRtspRequest, daemon=True)
+        thread.start()
+        self.clientSide.sendall(SHORT_BODY)
+        self.assertIn(b'RTSP/1.0 200 OK', readAll(self.clientSide))
+        thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+
+    def test_async_server(self):
+        async def run():
+            reader, writer = await asyncio.open_connection(sock=self.serverSide)
+            worker = AsyncServerWorker({'rtspSocket': (None, ('127.0.0.1', 0))}, writer, None)
+            worker.LEGACY_FLUSH_TIMEOUT = 0.05
+            self.clientSide.sendall(SHORT_BODY)
+            await asyncio.wait_for(worker.handle(reader), 5.0)
+            await writer.wait_closed()
+
+        asyncio.run(run())
+        self.assertIn(b'RTSP/1.0 200 OK', readAll(self.clientSide))
+
+    def test_client(self):
+        client = ClientCore('127.0.0.1', 0, 0, 'movie.Mjpeg', threaded=True, verbose=False)
+        client.rtspSocket = self.clientSide
+        self.clientSide.settimeout(0.05)
+        self.serverSide.sendall(b'RTSP/1.0 200 OK\r\nCSeq: 1')  # old server: no blank line
+        self.assertTrue(client.onRtspReadable())
+        self.serverSide.sendall(b'\r\nContent-Length: 1\r\n\r\nax')
+        self.assertTrue(client.onRtspReadable())
+        self.assertFalse(client.onRtspReadable())  # the stray 'x', flushed on timeout
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RtpPacket import SEQ_MOD, extendSeq
+from RtpStats import ReceptionStats
+from FrameReassembler import FrameReassembler
+from Retransmission import NackTracker, PacketHistory
+
+
+@pytest.mark.parametrize('seq, reference, expected', [
+    (5, SEQ_MOD + 3, SEQ_MOD + 5),
+    (1, SEQ_MOD + 65535, 2 * SEQ_MOD + 1),  # wrapped forward
+    (65535, 2 * SEQ_MOD + 1, SEQ_MOD + 65535),  # late packet from before the wrap
+    (3, SEQ_MOD + 3, SEQ_MOD + 3),
+])
+def test_extend_seq(seq, reference, expected):
+    assert extendSeq(seq, reference) == expected
+
+
+def test_reception_stats_across_wrap():
+    stats = ReceptionStats()
+    for seq in (65533, 65534, 0, 65535, 2):  # 1 lost, 65535 late
+        stats.update(seq, 0, arrival=0.0)
+    assert stats.extendedMaxSeq() == SEQ_MOD + 2
+    assert stats.expected() == 6
+    assert stats.lost() == 1
+    assert stats.reordered == 1
+
+
+def test_reception_stats_resync_on_big_jump():
+    stats = ReceptionStats()
+    stats.update(10, 0, arrival=0.0)
+    stats.update(20000, 0, arrival=0.0)  # ignored until confirmed
+    assert (stats.received, stats.extendedMaxSeq()) == (1, 10)
+    stats.update(20001, 0, arrival=0.0)
+    assert (stats.received, stats.baseSeq, stats.extendedMaxSeq()) == (1, 20001, 20001)
+
+
+def test_reassembler_across_wrap():
+    reassembler = FrameReassembler()
+    assert reassembler.push(65534, 1000, 0, b'ab', arrival=0.0) == []
+    assert reassembler.push(0, 1000, 1, b'ef', arrival=0.0) == []
+    (timestamp, data, latency), = reassembler.push(65535, 1000, 0, b'cd', arrival=0.0)
+    assert (timestamp, bytes(data)) == (1000, b'abcdef')
+    (timestamp, data, latency), = reassembler.push(1, 4000, 1, b'gh', arrival=0.0)
+    assert (timestamp, bytes(data)) == (4000, b'gh')
+
+
+def test_nack_tracker_across_wrap():
+    tracker = NackTracker()
+    tracker.update(65533, 0.0)
+    tracker.update(1, 0.0)  # 65534, 65535 and 0 missing
+    assert tracker.due(0.0) == []  # may only be reordered
+    assert sorted(tracker.due(0.01)) == [0, 65534, 65535]
+    tracker.update(65535, 0.02)
+    assert tracker.recovered == 1
+    assert sorted(tracker.due(0.2)) == [0, 65534]
+    assert tracker.due(1.0) == []  # past the deadline
+
+
+def test_packet_history_wraps_with_seqnums():
+    history = PacketHistory(size=4)
+    history.add(65534, [(b'a', 0), (b'b', 0), (b'c', 1)], 90)
+    assert history.get(0) == (0, 1, b'c', 90, 0)
+    assert history.get(65534)[2] == b'a'
+    history.add(1, [(b'd', 1), (b'e', 1)], 180)
+    assert history.get(65534) is None  # overwritten by seq 2
@@ -0,0 +1,60 @@
+import os, sys, multiprocessing
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Prefork import SessionTable
+
+SLOTS = 8
+
+
+@pytest.fixture
+def table():
+    return SessionTable(multiprocessing.get_context(), slots=SLOTS)
+
+
+def test_claim_owner_release(table):
+    assert table.claim(123, 7)
+    assert not table.claim(123, 8)  # id taken
+    assert table.owner(123) == 7
+    table.release(123)
+    assert table.owner(123) is None
+    assert table.claim(123, 8)
+
+
+def test_release_shifts_the_chain_back(table):
+    colliding = [3, 3 + SLOTS, 3 + 2 * SLOTS]  # same home slot
+    for n, sessionId in enumerate(colliding):
+        assert table.claim(sessionId, 100 + n)
+    assert table.claim(5, 200)  # its home is taken by the chain: placed after it
+    table.release(colliding[0])
+    for n, sessionId in enumerate(colliding[1:], 1):
+        assert table.owner(sessionId) == 100 + n
+    assert table.owner(5) == 200
+    table.release(5)
+    assert table.owner(colliding[2]) == 102
+    assert table.claim(colliding[0], 101)  # reinserted at the end of the chain
+    assert table.owner(colliding[0]) == 101
+
+
+def test_chain_across_the_end_of_the_array(table):
+    ids = [SLOTS - 1, 2 * SLOTS - 1, 3 * SLOTS - 1, 1]
+    for sessionId in ids:
+        assert table.claim(sessionId, sessionId)
+    table.release(ids[0])
+    for sessionId in ids[1:]:
+        assert table.owner(sessionId) == sessionId
+
+
+def test_release_owner_and_churn(table):
+    for sessionId in range(1, SLOTS + 1):
+        assert table.claim(sessionId * 5, sessionId % 2)
+    assert not table.claim(999, 1)  # full
+    table.releaseOwner(1)
+    for sessionId in range(1, SLOTS + 1):
+        assert table.owner(sessionId * 5) == (0 if sessionId % 2 == 0 else None)
+    for n in range(1000):  # no tombstones: churn never fills the table
+        assert table.claim(1000 + n, 3)
+        table.release(1000 + n)
+    assert sum(1 for i in range(SLOTS) if table.array[2 * i]) == SLOTS // 2